@@ -76,4 +76,10 @@ echo -e "  - Swagger UI: http://localhost:8000/docs"
 echo -e "  - ReDoc: http://localhost:8000/redoc"
 echo -e "${YELLOW}Press Ctrl+C to stop the server${NC}"
 
-uvicorn src.api.student_api:app --host 0.0.0.0 --port 8000 --reload 
\ No newline at end of file
+# API_WORKERS=4 serves with several worker processes instead of one reloading process
+if [ "${API_WORKERS:-1}" -gt 1 ]; then
+    echo -e "${YELLOW}Running ${API_WORKERS} workers (no reload)${NC}"
+    uvicorn src.api.student_api:app --host 0.0.0.0 --port 8000 --workers "$API_WORKERS"
+else
+    uvicorn src.api.student_api:app --host 0.0.0.0 --port 8000 --reload
+fi
@@ -1,8 +1,16 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse, Response
 from src.core.jira_rag.jira_client import JiraClient
-from typing import Dict, Any, List
+from src.core.jira_rag.link_graph import IssueLinkGraph
+from src.core.jira_rag.metrics import REGISTRY, CONTENT_TYPE, RETRIES, MetricsMiddleware, register_cache
+from src.core.jira_rag.tracing import TRACER, InMemoryExporter, TracingMiddleware, summarize
+from src.core.jira_rag.profiling import ProfilingMiddleware
+from src.core.jira_rag.admission import AdmissionMiddleware, install_sync_executor
+from typing import Dict, Any, List, Optional
+import json
 import uvicorn
 import logging
+import threading
 import time
 import requests
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
@@ -22,6 +30,19 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
+app.add_middleware(ProfilingMiddleware)
+# Bulk work gets a small concurrency budget so it cannot starve interactive chatflow calls
+ADMISSION_ROUTES = {
+    "/create_test_case": "interactive",
+    "/get_linked_test_cases/{issue_key}": "interactive",
+    "/graph/traverse/{issue_key}": "interactive",
+    "/graph/{project}/coverage": "interactive",
+    "/create_bulk_test_cases": "bulk",
+    "/graph/{project}/refresh": "bulk",
+}
+app.add_middleware(AdmissionMiddleware, routes=ADMISSION_ROUTES)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 def check_env_vars():
     """Check if all required environment variables are set."""
@@ -65,22 +86,176 @@ def initialize_jira_client(max_retries=3, retry_delay=2):
                 raise
             
             if attempt < max_retries - 1:
+                RETRIES.labels("jira", "connect").inc()
                 time.sleep(retry_delay)
                 continue
             
     raise Exception("Failed to initialize Jira client after multiple attempts")
 
-# Load environment variables and initialize Jira client
-load_dotenv()
-check_env_vars()
+class JiraClientManager:
+    """
+    Builds the Jira client in a background thread so importing the module and
+    starting a worker never wait on Jira. Failed initializations are retried
+    with exponential backoff, and a client whose connection breaks is rebuilt.
+    """
+
+    def __init__(self, retry_delay: float = 2.0, max_retry_delay: float = 60.0):
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.client: Optional[JiraClient] = None
+        self.state = "stopped"
+        self.last_error: Optional[str] = None
+        self.attempts = 0
+        self.ready_at: Optional[float] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start initializing in the background unless already running or ready"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() or self._ready.is_set():
+                return
+            self.state = "starting"
+            self._thread = threading.Thread(target=self._run, name="jira-client-init", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        delay = self.retry_delay
+        while True:
+            self.attempts += 1
+            try:
+                load_dotenv()
+                check_env_vars()
+                client = initialize_jira_client()
+                with self._lock:
+                    self.client = client
+                    self.state = "ready"
+                    self.last_error = None
+                    self.ready_at = time.time()
+                    self._ready.set()
+                logger.info("Jira client initialized successfully")
+                return
+            except Exception as e:
+                self.last_error = str(e)
+                self.state = "retrying"
+                RETRIES.labels("jira", "connect").inc()
+                logger.error(f"Failed to initialize Jira client: {str(e)}. Retrying in {delay:.0f} seconds...")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def get(self, timeout: float = 0.0) -> Optional[JiraClient]:
+        """Return the client, waiting up to timeout seconds for it to become ready"""
+        if not self._ready.is_set():
+            self.start()
+            self._ready.wait(timeout)
+        return self.client
+
+    def invalidate(self, error: Exception) -> None:
+        """Drop a client whose connection failed and rebuild it in the background"""
+        with self._lock:
+            if not self._ready.is_set():
+                return
+            logger.warning(f"Jira connection failed, re-initializing client: {str(error)}")
+            self._ready.clear()
+            self.client = None
+            self.last_error = str(error)
+        self.start()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self._ready.is_set(),
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "ready_since": self.ready_at,
+        }
+
+# Seconds a sync request waits for a client that is still initializing
+JIRA_INIT_WAIT = float(os.getenv("JIRA_INIT_WAIT", "5"))
+
+jira_clients = JiraClientManager()
+
+def _coalescing_cache_stats() -> Dict[str, int]:
+    """Coalesced reads count as hits of the in-flight request cache"""
+    jira_client = jira_clients.client
+    if not jira_client:
+        return {"hits": 0, "misses": 0}
+    stats = jira_client.coalescing_stats()
+    return {"hits": stats["coalesced"], "misses": stats["executed"]}
+
+register_cache("jira_coalescing", _coalescing_cache_stats)
 
-try:
-    logger.info("Starting Jira client initialization...")
-    jira_client = initialize_jira_client()
-    logger.info("Jira client initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Jira client: {str(e)}")
-    jira_client = None
+def get_jira_client(timeout: float = 0.0) -> JiraClient:
+    """Client for a request; async endpoints must not wait so the event loop never blocks"""
+    client = jira_clients.get(timeout=timeout)
+    if not client:
+        raise HTTPException(status_code=503, detail="Jira client not initialized", headers={"Retry-After": "5"})
+    return client
+
+def handle_jira_error(e: Exception) -> None:
+    """Rebuild the client when the connection to Jira itself failed"""
+    if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        jira_clients.invalidate(e)
+
+@app.on_event("startup")
+def startup_event():
+    load_dotenv()
+    install_sync_executor()
+    jira_clients.start()
+    REGISTRY.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    REGISTRY.stop()
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus text exposition of request, upstream, ingestion and cache metrics.
+    """
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/traces")
+def list_traces():
+    """
+    Most recent traces kept by the in-memory span exporter.
+    """
+    exporter = TRACER.exporter
+    if not isinstance(exporter, InMemoryExporter):
+        raise HTTPException(status_code=404, detail="Traces are not kept in memory (see TRACING_EXPORTER)")
+    return {"traces": exporter.traces(), "dropped_spans": exporter.dropped}
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str, slowest: int = Query(10, ge=0), include_spans: bool = False):
+    """
+    Per-stage time breakdown and slowest issues of one trace, optionally with its spans.
+    """
+    exporter = TRACER.exporter
+    spans = exporter.spans(trace_id) if isinstance(exporter, InMemoryExporter) else []
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} not found")
+    result = {"trace_id": trace_id, **summarize(spans, slowest=slowest)}
+    if include_spans:
+        result["span_list"] = [span.to_dict() for span in sorted(spans, key=lambda span: span.start)]
+    return result
+
+@app.get("/healthz")
+def liveness():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    return {"alive": True}
+
+@app.get("/readyz")
+def readiness():
+    """
+    Readiness probe: 200 once the Jira client is connected, 503 while it is starting or retrying.
+    """
+    status = jira_clients.status()
+    if not status["ready"]:
+        raise HTTPException(status_code=503, detail=status)
+    return status
 
 @app.post("/create_test_case")
 async def create_test_case(data: Dict[str, Any]):
@@ -93,8 +268,7 @@ async def create_test_case(data: Dict[str, Any]):
         "project_key": "PROJ"      # The project where the test case will be created
     }
     """
-    if not jira_client:
-        raise HTTPException(status_code=503, detail="Jira client not initialized")
+    jira_client = get_jira_client()
     
     try:
         logger.info(f"Creating test case for parent issue {data['parent_key']}")
@@ -133,16 +307,33 @@ async def create_test_case(data: Dict[str, Any]):
         }
         
     except Exception as e:
+        handle_jira_error(e)
         logger.error(f"Error in create_test_case: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def ndjson_records(records, parent_key: str):
+    """Serialize bulk creation records as NDJSON, ending with a summary line"""
+    totals = {"created": 0, "linked": 0, "failed": 0}
+    try:
+        for record in records:
+            if record["type"] == "chunk":
+                for name in totals:
+                    totals[name] += record[name]
+            yield json.dumps(record) + "\n"
+    except Exception as e:
+        handle_jira_error(e)
+        logger.error(f"Error in create_bulk_test_cases stream: {str(e)}")
+        yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+    yield json.dumps({"type": "summary", "parent_key": parent_key, **totals}) + "\n"
+
 @app.post("/create_bulk_test_cases")
-async def create_bulk_test_cases(data: Dict[str, Any]):
+async def create_bulk_test_cases(data: Dict[str, Any], stream: bool = Query(False, description="Stream one NDJSON record per test case and per chunk as they finish?")):
     """
     Create multiple test cases for a parent issue using structured LLM output.
+    Test cases are created in chunks of at most 50, creating the next chunk
+    while the previous one is linked.
     """
-    if not jira_client:
-        raise HTTPException(status_code=503, detail="Jira client not initialized")
+    jira_client = get_jira_client()
 
     try:
         logger.info("Received request to create bulk test cases")
@@ -158,6 +349,18 @@ async def create_bulk_test_cases(data: Dict[str, Any]):
         logger.info(f"Extracted parameters: parent_key={parent_key}, project_key={project_key}, link_type={link_type}")
         logger.info(f"Labels: {labels}, Component: {component}, Reporter: {reporter}")
 
+        if stream:
+            records = jira_client.iter_bulk_create_test_issues(
+                project_key=project_key,
+                test_cases=data["test_cases"],
+                parent_key=parent_key,
+                link_type=link_type,
+                labels=labels,
+                component=component,
+                reporter=reporter,
+            )
+            return StreamingResponse(ndjson_records(records, parent_key), media_type="application/x-ndjson")
+
         results = jira_client.bulk_create_test_issues(
             project_key=project_key,
             test_cases=data["test_cases"],
@@ -177,13 +380,15 @@ async def create_bulk_test_cases(data: Dict[str, Any]):
         }
 
     except Exception as e:
+        handle_jira_error(e)
         logger.error(f"Error in create_bulk_test_cases: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/test_jira_connection")
 def test_jira_connection():
+    jira_client = jira_clients.get(timeout=JIRA_INIT_WAIT)
     if not jira_client:
-        return {"success": False, "error": "Jira client not initialized"}
+        return {"success": False, "error": "Jira client not initialized", "status": jira_clients.status()}
     
     try:
         # Try to get Jira server info
@@ -191,22 +396,77 @@ def test_jira_connection():
         logger.info(f"Successfully connected to Jira server: {info['serverTitle']} (Version: {info['version']})")
         return {"success": True, "server": info}
     except Exception as e:
+        handle_jira_error(e)
         logger.error(f"Error in test_jira_connection: {str(e)}")
         return {"success": False, "error": str(e)}
 
+# Issue link graph, optionally persisted between restarts
+LINK_GRAPH_FILE = os.getenv("JIRA_LINK_GRAPH_FILE")
+link_graph = IssueLinkGraph.load(LINK_GRAPH_FILE) if LINK_GRAPH_FILE else IssueLinkGraph()
+
+def ensure_graph(project: str, refresh: bool = False, full: bool = False) -> Optional[Dict[str, Any]]:
+    """Load a project into the link graph on first use, or refresh it on request"""
+    if project in link_graph.synced and not (refresh or full):
+        return None
+    jira_client = get_jira_client(timeout=JIRA_INIT_WAIT)
+    try:
+        result = link_graph.sync(jira_client, project, full=full)
+    except Exception as e:
+        handle_jira_error(e)
+        logger.error(f"Error syncing link graph for {project}: {str(e)}")
+        raise HTTPException(status_code=502, detail=str(e))
+    if LINK_GRAPH_FILE:
+        link_graph.save(LINK_GRAPH_FILE)
+    return result
+
+@app.post("/graph/{project}/refresh")
+def refresh_link_graph(project: str, full: bool = False):
+    """
+    Load a project's issue links, or apply the issues updated since the last sync (full=true reloads).
+    """
+    return ensure_graph(project, refresh=True, full=full)
+
+@app.get("/graph/{project}/coverage")
+def link_graph_coverage(project: str, link_type: Optional[str] = None, test_type: str = "Test",
+                        issue_types: Optional[List[str]] = Query(None), refresh: bool = False):
+    """
+    Test coverage matrix of a project from the link graph: tests linked to every
+    issue, uncovered issues and coverage per epic.
+    """
+    ensure_graph(project, refresh=refresh)
+    return link_graph.coverage(project, test_type=test_type, link_type=link_type, issue_types=issue_types)
+
+@app.get("/graph/traverse/{issue_key}")
+def traverse_link_graph(issue_key: str, depth: int = Query(2, ge=1, le=6), link_types: Optional[List[str]] = Query(None)):
+    """
+    Walk the link graph from an issue (e.g. epic -> stories -> tests) up to depth links away.
+    """
+    ensure_graph(issue_key.rsplit("-", 1)[0])
+    return link_graph.traverse(issue_key, depth=depth, link_types=link_types)
+
+@app.get("/jira/coalescing")
+def jira_coalescing_stats():
+    """
+    Report how many Jira reads were served by an identical in-flight request.
+    """
+    jira_client = jira_clients.client
+    if not jira_client:
+        return {"calls": 0, "executed": 0, "coalesced": 0, "errors": 0, "in_flight": 0, "fan_in": 0.0}
+    return jira_client.coalescing_stats()
+
 @app.get("/get_linked_test_cases/{issue_key}")
 def get_linked_test_cases(issue_key: str, link_type: str = "Tests"):
     """
     Retrieve all test cases linked to a given issue.
     """
-    if not jira_client:
-        raise HTTPException(status_code=503, detail="Jira client not initialized")
+    jira_client = get_jira_client(timeout=JIRA_INIT_WAIT)
     try:
         linked = jira_client.get_linked_issues(issue_key, link_type=link_type)
         # Optionally filter only 'Test' issues
         test_cases = [l for l in linked if l.get("link_type", "").lower() == link_type.lower()]
         return {"success": True, "linked_test_cases": test_cases}
     except Exception as e:
+        handle_jira_error(e)
         logger.error(f"Error in get_linked_test_cases: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,7 +1,17 @@
-from fastapi import FastAPI, HTTPException, Query
-from src.core.models.ingest_models import IngestJiraRequest, IngestJsonRequest
+from fastapi import FastAPI, HTTPException, Query, Request, Header
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from src.core.models.ingest_models import IngestJiraRequest, IngestJsonRequest, RetrieveRequest
 from src.core.jira_rag.jira_client import JiraClient
-from src.core.jira_rag.dify_integration import DifyIntegration, DifyConfigurationError
+from src.core.jira_rag.dify_integration import DifyIntegration, DifyConfigurationError, SUMMARY_MODES
+from src.core.jira_rag.retrieval_cache import retrieval_cache
+from src.core.jira_rag.sharding import ShardedDifyIntegration
+from src.core.jira_rag.resilience import CircuitOpenError
+from src.core.jira_rag.webhooks import WebhookCoalescer, DifyWebhookApplier, verify_signature, parse_webhook
+from src.core.jira_rag.metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware
+from src.core.jira_rag.tracing import TRACER, InMemoryExporter, TracingMiddleware, summarize
+from src.core.jira_rag.profiling import ProfilingMiddleware
+from src.core.jira_rag.admission import AdmissionMiddleware, install_sync_executor
 from typing import Optional, List
 import os
 from dotenv import load_dotenv
@@ -10,6 +20,7 @@ from pathlib import Path
 import requests
 import json
 import traceback
+import threading
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,83 +31,326 @@ app = FastAPI(
     description="API for students to ingest Jira issues from Jira or JSON files, and test connections.",
     version="1.0.0"
 )
+app.add_middleware(ProfilingMiddleware)
+# Bulk work gets a small concurrency budget so it cannot starve interactive chatflow calls
+ADMISSION_ROUTES = {
+    "/retrieve": "interactive",
+    "/ingest/jira": "bulk",
+    "/ingest/json": "bulk",
+}
+app.add_middleware(AdmissionMiddleware, routes=ADMISSION_ROUTES)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+# Created on the first webhook so the API starts without Dify credentials
+webhook_coalescer: Optional[WebhookCoalescer] = None
+_webhook_lock = threading.Lock()
 
 @app.on_event("startup")
 def startup_event():
     load_dotenv()
     logger.info("Environment variables loaded.")
+    install_sync_executor()
+    REGISTRY.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    if webhook_coalescer is not None:
+        webhook_coalescer.close()
+    REGISTRY.stop()
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus text exposition of request, upstream, ingestion and cache metrics.
+    """
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/traces")
+def list_traces():
+    """
+    Most recent traces kept by the in-memory span exporter.
+    """
+    exporter = TRACER.exporter
+    if not isinstance(exporter, InMemoryExporter):
+        raise HTTPException(status_code=404, detail="Traces are not kept in memory (see TRACING_EXPORTER)")
+    return {"traces": exporter.traces(), "dropped_spans": exporter.dropped}
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str, slowest: int = Query(10, ge=0), include_spans: bool = False):
+    """
+    Per-stage time breakdown and slowest issues of one trace, optionally with its spans.
+    """
+    exporter = TRACER.exporter
+    spans = exporter.spans(trace_id) if isinstance(exporter, InMemoryExporter) else []
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} not found")
+    result = {"trace_id": trace_id, **summarize(spans, slowest=slowest)}
+    if include_spans:
+        result["span_list"] = [span.to_dict() for span in sorted(spans, key=lambda span: span.start)]
+    return result
+
+def get_webhook_coalescer() -> WebhookCoalescer:
+    """
+    Build the webhook coalescer on first use. DifyIntegration() calls Dify, so
+    async callers run this in the threadpool. Webhooks are only applied to an
+    existing dataset: without DIFY_DATASET_ID a DifyConfigurationError is
+    raised instead of creating a new one.
+    """
+    global webhook_coalescer
+    with _webhook_lock:
+        if webhook_coalescer is None:
+            if os.getenv("DIFY_DATASET_ID") in (None, "", "your-dataset-id"):
+                raise DifyConfigurationError("DIFY_DATASET_ID must be set to apply Jira webhooks")
+            applier = DifyWebhookApplier(DifyIntegration())
+            webhook_coalescer = WebhookCoalescer(
+                applier,
+                window=float(os.getenv("JIRA_WEBHOOK_WINDOW", "2")),
+                max_delay=float(os.getenv("JIRA_WEBHOOK_MAX_DELAY", "10")),
+                max_retries=int(os.getenv("JIRA_WEBHOOK_MAX_RETRIES", "5")),
+                retry_backoff=float(os.getenv("JIRA_WEBHOOK_RETRY_BACKOFF", "1")),
+            )
+        return webhook_coalescer
+
+def dify_unavailable(e: CircuitOpenError) -> HTTPException:
+    """503 with Retry-After while the Dify circuit breaker fails calls fast"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after + 0.5))})
 
 @app.post("/ingest/jira")
-def ingest_from_jira(request: IngestJiraRequest, advanced_ingestion: bool = Query(False, description="Enable advanced ingestion (aliases and queries)?")):
+def ingest_from_jira(request: IngestJiraRequest, advanced_ingestion: bool = Query(False, description="Enable advanced ingestion (aliases and queries)?"), sharded: bool = Query(False, description="Route issues to per-project datasets from DIFY_SHARD_MAP?")):
     """
     Ingest issues from Jira into Dify. Provide either a JQL query or a project key.
     """
     try:
         jira_client = JiraClient()
-        dify = DifyIntegration(advanced_ingestion=advanced_ingestion)
+        dify = ShardedDifyIntegration(advanced_ingestion=advanced_ingestion) if sharded else DifyIntegration(advanced_ingestion=advanced_ingestion)
         if request.jql:
             jql_query = request.jql
         elif request.project:
             jql_query = f"project = {request.project} ORDER BY created DESC"
         else:
             raise HTTPException(status_code=400, detail="You must provide either a 'jql' or 'project' parameter.")
-        issues = jira_client.get_issues(jql_query, max_results=request.max_results)
+        issues = jira_client.get_issue_rows(jql_query, max_results=request.max_results)
         if not issues:
             return {"success": False, "message": "No issues found for the given query."}
-        dify.ingest_issues(issues, advanced_ingestion=advanced_ingestion)
-        return {"success": True, "message": f"Ingested {len(issues)} issues from Jira."}
+        created = sum(outcome["status"] == "created"
+                      for outcome in dify.iter_ingest_issues(issues, advanced_ingestion=advanced_ingestion))
+        failed = len(issues) - created
+        if failed:
+            return {"success": False, "message": f"Ingested {created} of {len(issues)} issues from Jira; {failed} failed."}
+        return {"success": True, "message": f"Ingested {created} issues from Jira."}
+    except CircuitOpenError as e:
+        raise dify_unavailable(e)
     except Exception as e:
         logger.error(f"Error ingesting from Jira: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+INGEST_RESULT_MODES = ("full", "compact", "ndjson")
+
+def iter_ingest_files(dify, dataset_dir: str, file_names: List[str], advanced_ingestion: bool, summary_mode: str, raw: bool = False):
+    """
+    Ingest JSON files one after the other, yielding every issue or summary
+    document outcome as it completes and then a record for its file:
+        {"type": "file", "file", "status": "ingested" | "failed", "created", "failed", "error"}
+    """
+    for file_name in file_names:
+        record = {"type": "file", "file": file_name, "status": "ingested", "created": 0, "failed": 0, "error": None}
+        try:
+            logger.info(f"Starting JSON ingestion for file: {file_name} in directory: {dataset_dir}")
+            file_path = Path(dataset_dir) / file_name
+
+            logger.info(f"Checking if file exists at path: {file_path}")
+            if not file_path.exists():
+                raise FileNotFoundError(f"File not found: {file_path}")
+
+            logger.info(f"File found. Attempting to ingest JSON file: {file_path}")
+            try:
+                for outcome in dify.iter_ingest_json_file(str(file_path), advanced_ingestion=advanced_ingestion,
+                                                          summary_mode=summary_mode, raw=raw):
+                    record["created" if outcome["status"] == "created" else "failed"] += 1
+                    outcome["file"] = file_name
+                    yield outcome
+                logger.info(f"Successfully ingested JSON file {file_name}: {record['created']} documents created, "
+                            f"{record['failed']} failed")
+            except json.JSONDecodeError as e:
+                record["error"] = f"Invalid JSON format in file {file_path}: {str(e)}"
+                logger.error(record["error"])
+            except CircuitOpenError:
+                # Abort the request; the files from this one on can be sent again once Dify is back
+                raise
+            except Exception as e:
+                record["error"] = f"Error during Dify ingestion: {str(e)}"
+                logger.error(f"{record['error']}\n{traceback.format_exc()}")
+        except FileNotFoundError as e:
+            record["error"] = str(e)
+            logger.error(record["error"])
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            record["error"] = f"Unexpected error during JSON ingestion for file {file_name}: {str(e)}"
+            logger.error(f"{record['error']}\n{traceback.format_exc()}")
+        if record["error"]:
+            record["status"] = "failed"
+        yield record
+
+def ndjson_outcomes(records, total_files: int):
+    """
+    Serialize ingest outcomes as NDJSON, ending with a summary line. A stream
+    stopped by an error reports success false and the files it did not reach.
+    """
+    totals = {"files": 0, "failed_files": 0, "unprocessed_files": 0, "created": 0, "failed": 0}
+    aborted = False
+    try:
+        for record in records:
+            if record["type"] == "file":
+                totals["files"] += 1
+                totals["failed_files"] += record["status"] == "failed"
+                totals["created"] += record["created"]
+                totals["failed"] += record["failed"]
+            yield json.dumps(record) + "\n"
+    except CircuitOpenError as e:
+        aborted = True
+        logger.error(f"Ingest stream stopped: {str(e)}")
+        yield json.dumps({"type": "error", "error": str(e), "retry_after": int(e.retry_after + 0.5)}) + "\n"
+    except Exception as e:
+        aborted = True
+        logger.error(f"Error in ingest stream: {str(e)}")
+        yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+    totals["unprocessed_files"] = max(0, total_files - totals["files"])
+    success = not aborted and totals["failed_files"] == 0 and totals["unprocessed_files"] == 0
+    yield json.dumps({"type": "summary", "success": success, **totals}) + "\n"
+
 @app.post("/ingest/json")
-def ingest_from_json(request: IngestJsonRequest, advanced_ingestion: bool = Query(False, description="Enable advanced ingestion (aliases and queries)?")):
+def ingest_from_json(request: IngestJsonRequest, advanced_ingestion: bool = Query(False, description="Enable advanced ingestion (aliases and queries)?"), summary_mode: str = Query("per_field", description="Summary files: one document per field ('per_field') or one sectioned document per project ('single')"), sharded: bool = Query(False, description="Route issues to per-project datasets from DIFY_SHARD_MAP?"), result_mode: str = Query("full", description="'full' (every Dify response), 'compact' (counts, document ids and errors per file) or 'ndjson' (stream one line per issue and per file as they finish)")):
     """
     Ingest issues from a list of JSON files in the dataset directory into Dify.
-    All documents will be ingested into the same dataset.
+    All documents will be ingested into the same dataset, or into their
+    project's dataset when sharded.
     """
-    results = []
-    errors = []
+    if summary_mode not in SUMMARY_MODES:
+        raise HTTPException(status_code=400, detail=f"summary_mode must be one of: {', '.join(SUMMARY_MODES)}")
+    if result_mode not in INGEST_RESULT_MODES:
+        raise HTTPException(status_code=400, detail=f"result_mode must be one of: {', '.join(INGEST_RESULT_MODES)}")
     try:
-        dify = DifyIntegration(advanced_ingestion=advanced_ingestion)
-        dataset_dir = Path(request.dataset_dir)
-        for file_name in request.file_names:
-            try:
-                logger.info(f"Starting JSON ingestion for file: {file_name} in directory: {request.dataset_dir}")
-                file_path = dataset_dir / file_name
-
-                logger.info(f"Checking if file exists at path: {file_path}")
-                if not file_path.exists():
-                    error_msg = f"File not found: {file_path}"
-                    logger.error(error_msg)
-                    errors.append({"file": file_name, "error": error_msg})
+        dify = ShardedDifyIntegration(advanced_ingestion=advanced_ingestion) if sharded else DifyIntegration(advanced_ingestion=advanced_ingestion)
+        records = iter_ingest_files(dify, request.dataset_dir, request.file_names, advanced_ingestion, summary_mode,
+                                    raw=result_mode == "full")
+        if result_mode == "ndjson":
+            return StreamingResponse(ndjson_outcomes(records, len(request.file_names)), media_type="application/x-ndjson")
+
+        if result_mode == "compact":
+            files, errors = [], []
+            documents, issue_errors = {}, []
+            for record in records:
+                if record["type"] != "file":
+                    if record["status"] == "created":
+                        documents[record.get("issue_key") or record.get("field")] = record["document_id"]
+                    else:
+                        issue_errors.append({"index": record.get("index"), "issue_key": record.get("issue_key"), "error": record["error"]})
                     continue
+                record.update(documents=documents, errors=issue_errors)
+                del record["type"]
+                files.append(record)
+                if record["error"]:
+                    errors.append({"file": record["file"], "error": record["error"]})
+                documents, issue_errors = {}, []
+            return {"success": len(errors) == 0, "files": files, "errors": errors}
 
-                logger.info(f"File found. Attempting to ingest JSON file: {file_path}")
-                try:
-                    result = dify.ingest_json_file(str(file_path), advanced_ingestion=advanced_ingestion)
-                    logger.info(f"Successfully ingested JSON file. Result: {result}")
-                    results.append({"file": file_name, "result": result})
-                except json.JSONDecodeError as e:
-                    error_msg = f"Invalid JSON format in file {file_path}: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append({"file": file_name, "error": error_msg})
-                except Exception as e:
-                    error_msg = f"Error during Dify ingestion: {str(e)}"
-                    logger.error(f"{error_msg}\n{traceback.format_exc()}")
-                    errors.append({"file": file_name, "error": error_msg})
-            except Exception as e:
-                error_msg = f"Unexpected error during JSON ingestion for file {file_name}: {str(e)}"
-                logger.error(f"{error_msg}\n{traceback.format_exc()}")
-                errors.append({"file": file_name, "error": error_msg})
+        results, errors, responses = [], [], []
+        for record in records:
+            if record["type"] != "file":
+                responses.extend(record["responses"])
+            elif record["error"]:
+                errors.append({"file": record["file"], "error": record["error"]})
+            else:
+                results.append({"file": record["file"], "result": responses})
+            if record["type"] == "file":
+                responses = []
         return {"success": len(errors) == 0, "results": results, "errors": errors}
     except DifyConfigurationError as e:
         logger.error(f"Dify configuration error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    except CircuitOpenError as e:
+        raise dify_unavailable(e)
     except Exception as e:
         logger.error(f"Error ingesting from JSON: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/retrieve")
+def retrieve(request: RetrieveRequest):
+    """
+    Query a Dify dataset. Repeated queries are served from a cache that is
+    invalidated whenever documents are written to the dataset.
+    With 'sharded', only the datasets of the projects named in the query (or
+    in 'projects') are searched, in parallel, and records are merged by score.
+    """
+    if request.sharded:
+        try:
+            dify = ShardedDifyIntegration()
+            return dify.retrieve(request.query, projects=request.projects, retrieval_model=request.retrieval_model,
+                                 top_k=request.top_k, use_cache=request.use_cache)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error retrieving from shards: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    dataset_id = request.dataset_id or os.getenv("DIFY_DATASET_ID")
+    if not dataset_id or dataset_id == "your-dataset-id":
+        raise HTTPException(status_code=400, detail="You must provide a 'dataset_id' or set DIFY_DATASET_ID.")
+    try:
+        dify = DifyIntegration(dataset_id=dataset_id)
+        return dify.retrieve(request.query, retrieval_model=request.retrieval_model, use_cache=request.use_cache)
+    except CircuitOpenError as e:
+        raise dify_unavailable(e)
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"Dify retrieval error: {str(e)}")
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error retrieving from Dify: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/retrieve/cache")
+def retrieve_cache_stats():
+    """
+    Report retrieval cache size and hit ratio.
+    """
+    return retrieval_cache.stats()
+
+@app.post("/webhooks/jira", status_code=202)
+async def jira_webhook(request: Request, secret: Optional[str] = Query(None, description="Shared secret, if not sent as a header"),
+                       x_hub_signature: Optional[str] = Header(None), x_webhook_secret: Optional[str] = Header(None)):
+    """
+    Receive Jira issue_created/updated/deleted webhooks. Events are coalesced
+    per issue key for JIRA_WEBHOOK_WINDOW seconds and applied to the dataset
+    in micro-batches.
+    """
+    body = await request.body()
+    if not verify_signature(os.getenv("JIRA_WEBHOOK_SECRET"), body, signature=x_hub_signature, token=x_webhook_secret or secret):
+        raise HTTPException(status_code=401, detail="Invalid or missing webhook secret.")
+    try:
+        payload = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {str(e)}")
+    event = parse_webhook(payload)
+    if event is None:
+        return {"accepted": False, "reason": f"Ignored event {payload.get('webhookEvent')}"}
+    try:
+        coalescer = webhook_coalescer or await run_in_threadpool(get_webhook_coalescer)
+        coalescer.submit(event)
+    except DifyConfigurationError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error queuing webhook for {event.key}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"accepted": True, "key": event.key, "action": event.action}
+
+@app.get("/webhooks/jira/stats")
+def jira_webhook_stats():
+    """
+    Report received, coalesced, applied and pending webhook events.
+    """
+    return webhook_coalescer.snapshot() if webhook_coalescer is not None else {"received": 0, "pending": 0}
+
 @app.get("/test_connection")
 def test_connection():
     """
@@ -0,0 +1,65 @@
+"""
+Report the tokens saved by local chunking over the dataset files.
+
+Every issue is formatted with DifyIntegration in "local" chunking mode (no
+request is sent) and compared with the fixed 2000/400 Dify-side rule.
+
+    python -m src.benchmarks.chunking --dataset-dir data/dataset [--advanced]
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+
+from src.core.jira_rag.dify_integration import DifyIntegration, CHUNK_SEPARATOR
+from src.core.jira_rag.cleaning import iter_raw_issues
+
+
+def run(dataset_dir: str, advanced_ingestion: bool = False) -> dict:
+    dify = DifyIntegration(api_key="offline", base_url="http://offline", dataset_id="offline", chunking="local")
+    files = {}
+    for path in sorted(glob.glob(os.path.join(dataset_dir, "*_issues*.json"))):
+        before = dict(dify.chunking_stats)
+        chunks = 0
+        for issue in iter_raw_issues(path):
+            doc = dify._format_issue_for_text(issue, advanced_ingestion=advanced_ingestion)
+            chunks += doc["text"].count(CHUNK_SEPARATOR) + 1
+        after = dify.chunking_stats
+        files[os.path.basename(path)] = {
+            "documents": after["documents"] - before["documents"],
+            "chunks": chunks,
+            "tokens_embedded": after["tokens_embedded"] - before["tokens_embedded"],
+            "baseline_tokens_embedded": after["baseline_tokens_embedded"] - before["baseline_tokens_embedded"],
+        }
+    stats = dify.chunking_stats
+    saved = stats["baseline_tokens_embedded"] - stats["tokens_embedded"]
+    return {
+        "advanced_ingestion": advanced_ingestion,
+        "files": files,
+        "total": {
+            **stats,
+            "tokens_saved": saved,
+            "saved_percent": (100.0 * saved / stats["baseline_tokens_embedded"]) if stats["baseline_tokens_embedded"] else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare local chunking with the fixed 2000/400 Dify rule')
+    parser.add_argument('--dataset-dir', type=str, default='data/dataset',
+                        help='Directory containing *_issues*.json files (default: data/dataset)')
+    parser.add_argument('--advanced', action='store_true', help='Format issues with advanced ingestion (aliases and queries)')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    output = json.dumps(run(args.dataset_dir, args.advanced), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
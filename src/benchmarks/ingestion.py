@@ -0,0 +1,319 @@
+"""
+Ingestion throughput against local Jira and Dify stand-ins.
+
+The stub servers (src.benchmarks.stubs) run in this process and serve a
+corpus replicated from the Atlassian-schema dataset files. Each scenario runs
+in its own child process, so its peak RSS is the client's alone:
+
+    ingest_issues            Jira search pages -> DifyIntegration.ingest_issues
+    ingest_issue_rows        JiraClient.get_issue_rows -> DifyIntegration.ingest_issues
+    ingest_json_file         DifyIntegration.ingest_json_file on a corpus file
+    bulk_create_test_issues  JiraClient.bulk_create_test_issues in chunks
+    get_linked_issues        JiraClient.get_linked_issues for many parents
+
+For every scenario issues/sec, p50/p99 latency of the scenario's unit of
+work, per-endpoint HTTP latency as seen by the client and peak RSS are
+reported. Results carry the git commit so runs can be compared:
+
+    python -m src.benchmarks.ingestion --issues 2000 --latency 20 --jitter 10 --error-rate 0.01 \\
+        [--scenarios ingest_issues,get_linked_issues] [--output results.json] [--baseline old.json]
+"""
+from typing import Dict, List, Optional
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.benchmarks.stubs import Faults, JiraStub, DifyStub
+from src.benchmarks.synthetic_corpus import CorpusProfile, CorpusGenerator
+
+SCENARIOS = ("ingest_issues", "ingest_issue_rows", "ingest_json_file", "bulk_create_test_issues", "get_linked_issues")
+LINKS_PER_PARENT = 5
+
+_ID_SEGMENT_RE = re.compile(r"^(?=.*\d)[\w-]{3,}$")
+
+
+def load_corpus(dataset_dir: str, count: int, synthetic: bool = False, seed: int = 0) -> List[Dict]:
+    """Replicate the Atlassian-schema issues of dataset_dir to count issues with unique keys, or generate them"""
+    if synthetic:
+        profile = CorpusProfile.learn(dataset_dir)
+        return list(CorpusGenerator(profile, seed=seed, schema="atlassian").issues(count))
+    templates = []
+    for path in sorted(glob.glob(os.path.join(dataset_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            templates.extend(i for i in data if isinstance(i, dict) and isinstance(i.get("fields"), dict) and i.get("key"))
+    if not templates:
+        raise ValueError(f"No Atlassian-schema issues found in {dataset_dir}")
+    corpus = []
+    for idx in range(count):
+        template = templates[idx % len(templates)]
+        project = template["key"].rsplit("-", 1)[0]
+        corpus.append({"id": str(500000 + idx), "key": f"{project}-{idx + 1}", "fields": dict(template["fields"])})
+    return corpus
+
+
+def percentiles(samples: List[float]) -> Dict:
+    """p50/p90/p99/mean/max in milliseconds"""
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p90_ms": None, "p99_ms": None, "mean_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p90_ms": pick(0.90), "p99_ms": pick(0.99),
+            "mean_ms": sum(ordered) / len(ordered) * 1000, "max_ms": ordered[-1] * 1000}
+
+
+def _route(method: str, url: str) -> str:
+    path = re.sub(r"^https?://[^/]+", "", url.split("?", 1)[0])
+    return f"{method} " + "/".join("{id}" if _ID_SEGMENT_RE.match(s) else s for s in path.split("/"))
+
+
+def _instrument_http(hosts: tuple) -> Dict[str, List[float]]:
+    """Time every HTTP exchange with the stubs made through requests (module-level calls and the Jira session)"""
+    import requests
+
+    timings = defaultdict(list)
+    send = requests.Session.send
+
+    def timed_send(session, request, **kwargs):
+        started = time.perf_counter()
+        try:
+            return send(session, request, **kwargs)
+        finally:
+            if request.url.startswith(hosts):
+                timings[_route(request.method, request.url)].append(time.perf_counter() - started)
+
+    requests.Session.send = timed_send
+    return timings
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _jira_client(urls: Dict):
+    from src.core.jira_rag.jira_client import JiraClient
+    server = urls["jira"][: -len(JiraStub.prefix)]
+    return JiraClient(server_url=server, email="bench@example.com", api_token="bench")
+
+
+def _dify_client(urls: Dict):
+    from src.core.jira_rag.dify_integration import DifyIntegration
+    return DifyIntegration(api_key="bench", base_url=urls["dify"])
+
+
+def _ingest_issues(urls: Dict, config: Dict) -> Dict:
+    jira, dify = _jira_client(urls), _dify_client(urls)
+    started = time.perf_counter()
+    issues = list(jira.iter_issue_dicts("ORDER BY key", page_size=100))
+    fetched = time.perf_counter() - started
+    succeeded = sum(outcome["status"] == "created" for outcome in dify.iter_ingest_issues(issues))
+    return {"items": len(issues), "succeeded": succeeded, "fetch_seconds": fetched,
+            "unit": "document create request", "unit_route": "POST /v1/datasets/{id}/document/create-by-text"}
+
+
+def _ingest_issue_rows(urls: Dict, config: Dict) -> Dict:
+    jira, dify = _jira_client(urls), _dify_client(urls)
+    started = time.perf_counter()
+    rows = jira.get_issue_rows("ORDER BY key")
+    fetched = time.perf_counter() - started
+    succeeded = sum(outcome["status"] == "created" for outcome in dify.iter_ingest_issues(rows))
+    return {"items": len(rows), "succeeded": succeeded, "fetch_seconds": fetched,
+            "unit": "document create request", "unit_route": "POST /v1/datasets/{id}/document/create-by-text"}
+
+
+def _ingest_json_file(urls: Dict, config: Dict) -> Dict:
+    dify = _dify_client(urls)
+    succeeded = sum(outcome["status"] == "created" for outcome in dify.iter_ingest_json_file(config["corpus_file"]))
+    return {"items": config["issues"], "succeeded": succeeded,
+            "unit": "document create request", "unit_route": "POST /v1/datasets/{id}/document/create-by-text"}
+
+
+def _bulk_create_test_issues(urls: Dict, config: Dict) -> Dict:
+    jira = _jira_client(urls)
+    test_cases = [{
+        "scenario_title": f"Benchmark scenario {idx}",
+        "gherkin": f"Given a seeker\nWhen the snitch {idx} is released\nThen it is caught",
+        "steps_to_reproduce": ["Release the snitch", "Start the match"],
+        "expected_result": "The snitch is caught",
+    } for idx in range(config["issues"])]
+    chunk_latencies, succeeded = [], 0
+    last = time.perf_counter()
+    for record in jira.iter_bulk_create_test_issues("BENCH", test_cases, config["parent_key"]):
+        if record["type"] == "chunk":
+            now = time.perf_counter()
+            chunk_latencies.append(now - last)
+            last = now
+            succeeded += record["linked"]
+    return {"items": len(test_cases), "succeeded": succeeded, "unit": "chunk", "unit_samples": chunk_latencies}
+
+
+def _get_linked_issues(urls: Dict, config: Dict) -> Dict:
+    jira = _jira_client(urls)
+    latencies, found = [], 0
+    for key in config["parents"]:
+        started = time.perf_counter()
+        found += len(jira.get_linked_issues(key, link_type="Tests"))
+        latencies.append(time.perf_counter() - started)
+    return {"items": len(config["parents"]), "succeeded": found, "unit": "get_linked_issues call",
+            "unit_samples": latencies}
+
+
+_RUNNERS = {
+    "ingest_issues": _ingest_issues,
+    "ingest_issue_rows": _ingest_issue_rows,
+    "ingest_json_file": _ingest_json_file,
+    "bulk_create_test_issues": _bulk_create_test_issues,
+    "get_linked_issues": _get_linked_issues,
+}
+
+
+def run_scenario(name: str, urls: Dict, config: Dict) -> Dict:
+    """Run one scenario in the current process (called in a fresh child)"""
+    logging.basicConfig(level=logging.CRITICAL)
+    # jira warns on every link created by type name (and resets its level when a client is built)
+    logging.getLogger("jira").disabled = True
+    # Load the tokenizer (or fail to) outside the timed region
+    from src.core.jira_rag.dify_integration import _get_encoding
+    _get_encoding("text-embedding-ada-002")
+    timings = _instrument_http(tuple(re.match(r"https?://[^/]+", url).group(0) for url in urls.values()))
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    result = _RUNNERS[name](urls, config)
+    seconds = time.perf_counter() - started
+    samples = result.pop("unit_samples", None)
+    if samples is None:
+        samples = timings.get(result.pop("unit_route"), [])
+    else:
+        result.pop("unit_route", None)
+    return {
+        **result,
+        "seconds": seconds,
+        "issues_per_second": result["items"] / seconds if seconds else 0.0,
+        "latency": percentiles(samples),
+        "http": {route: percentiles(values) for route, values in sorted(timings.items())},
+        "peak_rss_mb": _rss_mb(),
+        "peak_rss_delta_mb": _rss_mb() - rss_before,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(dataset_dir: str, issues: int, faults: Dict, scenarios: List[str], seed: int = 0, synthetic: bool = False) -> Dict:
+    corpus = load_corpus(dataset_dir, issues, synthetic=synthetic, seed=seed)
+    parents = [issue["key"] for issue in corpus[:max(1, issues // (LINKS_PER_PARENT + 1))]]
+    results = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {"issues": issues, "seed": seed, "synthetic": synthetic, **faults},
+        "scenarios": {},
+    }
+    # Requests to the stubs must not go through a proxy from the environment
+    os.environ["NO_PROXY"] = ",".join(filter(None, [os.environ.get("NO_PROXY"), "127.0.0.1", "localhost"]))
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_file = os.path.join(tmp, "bench_issues.json")
+        with open(corpus_file, "w", encoding="utf-8") as f:
+            json.dump(corpus, f)
+        context = multiprocessing.get_context("spawn")
+        for name in scenarios:
+            with JiraStub(corpus, Faults(seed=seed, **faults)) as jira, DifyStub(Faults(seed=seed, **faults)) as dify:
+                if name == "bulk_create_test_issues":
+                    jira.add_issue({"key": "BENCH-1", "fields": {"summary": "Benchmark parent", "issuetype": {"name": "Story"}}})
+                if name == "get_linked_issues":
+                    # Every parent is tested by LINKS_PER_PARENT test issues
+                    for idx, parent in enumerate(parents):
+                        for n in range(LINKS_PER_PARENT):
+                            test = jira.add_issue({"key": f"TST-{idx * LINKS_PER_PARENT + n + 1}", "fields": {
+                                "summary": f"Test {n} of {parent}", "description": "Benchmark test case",
+                                "issuetype": {"name": "Test"}}})
+                            jira.add_link(test["key"], parent, "Tests")
+                config = {"issues": issues, "corpus_file": corpus_file, "parent_key": "BENCH-1", "parents": parents}
+                urls = {"jira": jira.url, "dify": dify.url}
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_scenario, name, urls, config).result()
+                result["server"] = {"jira": jira.stats(), "dify": dify.stats()}
+            results["scenarios"][name] = result
+            print(f"{name}: {result['issues_per_second']:.1f} issues/s, p50 {result['latency']['p50_ms']} ms, "
+                  f"p99 {result['latency']['p99_ms']} ms, peak RSS {result['peak_rss_mb']:.0f} MB", file=sys.stderr)
+    return results
+
+
+def compare(results: Dict, baseline: Dict) -> Dict:
+    """Relative change of throughput, p99 and peak RSS against an earlier run"""
+    changes = {}
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+
+        def ratio(a, b):
+            return (a / b - 1.0) if a is not None and b else None
+
+        changes[name] = {
+            "issues_per_second": ratio(current["issues_per_second"], previous["issues_per_second"]),
+            "p99_ms": ratio(current["latency"]["p99_ms"], previous["latency"]["p99_ms"]),
+            "peak_rss_mb": ratio(current["peak_rss_mb"], previous["peak_rss_mb"]),
+        }
+    return {"baseline_commit": baseline.get("commit"), "changes": changes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ingestion paths against local Jira and Dify stubs')
+    parser.add_argument('--dataset-dir', type=str, default='data/dataset', help='Directory with Atlassian-schema issue files')
+    parser.add_argument('--issues', type=int, default=1000, help='Issues per scenario (default: 1000)')
+    parser.add_argument('--scenarios', type=str, default=",".join(SCENARIOS),
+                        help=f'Comma-separated scenarios (default: all of {", ".join(SCENARIOS)})')
+    parser.add_argument('--latency', type=float, default=0.0, help='Added latency per stub request in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform +- jitter in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of stub data requests that fail')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of injected errors (default: 500)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the fault schedule and the synthetic corpus')
+    parser.add_argument('--synthetic', action='store_true',
+                        help='Generate the corpus with src.benchmarks.synthetic_corpus instead of replicating the files')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this file')
+    parser.add_argument('--baseline', type=str, default=None, help='Earlier results file to compare with')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    faults = {"latency": args.latency / 1000, "jitter": args.jitter / 1000,
+              "error_rate": args.error_rate, "error_status": args.error_status}
+    results = run(args.dataset_dir, args.issues, faults, scenarios, seed=args.seed, synthetic=args.synthetic)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            results["comparison"] = compare(results, json.load(f))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
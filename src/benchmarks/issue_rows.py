@@ -0,0 +1,140 @@
+"""
+Compare memory and time of the bulk issue representations.
+
+Search pages are replayed from the Atlassian-schema dataset file (fresh JSON
+per page, as a search response would be) and turned into issues three ways:
+
+    resource  jira Issue resources kept in a result list, then JiraIssue
+              objects (get_issues before IssueRow)
+    pydantic  JiraIssue objects built from each raw page
+    rows      IssueRow records built from each raw page
+
+For each, peak and retained traced memory per issue and build time are
+reported, plus the cost of converting rows to JiraIssue on demand.
+
+    python -m src.benchmarks.issue_rows --issues 20000 [--output results.json]
+"""
+from typing import Dict, Iterator, List
+import argparse
+import gc
+import json
+import logging
+import time
+import tracemalloc
+
+from jira.resources import Issue
+
+from src.core.jira_rag.jira_client import JiraIssue, IssueRow
+
+PAGE_SIZE = 100
+
+
+def _templates(path: str) -> List[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    issues = data if isinstance(data, list) else data.get('issues', [])
+    for issue in issues:
+        # The export has no project; a search response always does
+        issue['fields'].setdefault('project', {'key': 'QUID', 'name': 'Quidditch'})
+    return issues
+
+
+def _pages(templates: List[Dict], total: int) -> Iterator[List[Dict]]:
+    """Yield freshly parsed pages of raw issues with unique keys"""
+    for start in range(0, total, PAGE_SIZE):
+        page = []
+        for idx in range(start, min(start + PAGE_SIZE, total)):
+            issue = dict(templates[idx % len(templates)])
+            issue['key'] = f"QUID-{idx + 1}"
+            issue['id'] = str(900000 + idx)
+            page.append(issue)
+        yield json.loads(json.dumps(page))
+
+
+def _jira_issue_from_resource(issue) -> JiraIssue:
+    return JiraIssue(
+        key=issue.key,
+        summary=issue.fields.summary,
+        description=issue.fields.description,
+        status=issue.fields.status.name,
+        assignee=getattr(issue.fields.assignee, 'displayName', None) or "Unassigned",
+        created=issue.fields.created,
+        updated=issue.fields.updated,
+        project=issue.fields.project.name,
+        issue_type=issue.fields.issuetype.name
+    )
+
+
+def build_resource(templates: List[Dict], total: int) -> List[JiraIssue]:
+    options = {"server": "http://localhost", "rest_path": "api", "rest_api_version": "2"}
+    results = []
+    for page in _pages(templates, total):
+        results.extend(Issue(options, None, raw=raw) for raw in page)
+    return [_jira_issue_from_resource(issue) for issue in results]
+
+
+def build_pydantic(templates: List[Dict], total: int) -> List[JiraIssue]:
+    return [IssueRow.from_raw(raw).to_issue() for page in _pages(templates, total) for raw in page]
+
+
+def build_rows(templates: List[Dict], total: int) -> List[IssueRow]:
+    return [IssueRow.from_raw(raw) for page in _pages(templates, total) for raw in page]
+
+
+def _measure(build, templates: List[Dict], total: int) -> Dict:
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = build(templates, total)
+    seconds = time.perf_counter() - started
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    measurement = {
+        "issues": len(result),
+        "seconds": seconds,
+        "issues_per_second": len(result) / seconds if seconds else 0.0,
+        "peak_bytes_per_issue": (peak - baseline) / total,
+        "retained_bytes_per_issue": (retained - baseline) / total,
+    }
+    del result
+    return measurement
+
+
+def run(dataset_file: str, total: int) -> Dict:
+    templates = _templates(dataset_file)
+    results = {
+        "resource": _measure(build_resource, templates, total),
+        "pydantic": _measure(build_pydantic, templates, total),
+        "rows": _measure(build_rows, templates, total),
+    }
+    rows = build_rows(templates, total)
+    started = time.perf_counter()
+    for row in rows:
+        row.to_issue()
+    seconds = time.perf_counter() - started
+    results["rows_to_issue"] = {"issues": len(rows), "seconds": seconds,
+                                "microseconds_per_issue": seconds / len(rows) * 1e6 if rows else 0.0}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark jira resources vs JiraIssue vs IssueRow for bulk fetches')
+    parser.add_argument('--dataset-file', type=str, default='data/dataset/full_quidditch_issues_atlassian_schema.json',
+                        help='Atlassian-schema issue file used as page template')
+    parser.add_argument('--issues', type=int, default=20000, help='Issues per run (default: 20000)')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run(args.dataset_file, args.issues)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
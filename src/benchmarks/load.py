@@ -0,0 +1,435 @@
+"""
+HTTP load test of the APIs against local Jira and Dify stand-ins.
+
+The API (jira_api or student_api) runs under uvicorn in its own process, once
+for every --workers count, and calls the stub servers (src.benchmarks.stubs)
+running in this process. A load generator in a third process sends a
+weighted mix of requests for --duration seconds at every --concurrency level:
+
+    closed loop (default)  each of the concurrency clients sends its next request once the previous one answered
+    open loop (--rate)     requests arrive as a Poisson process at rate/s, served by up to concurrency clients
+
+In open loop, latency is counted from the planned arrival time, so the time a
+request waits for a free client is part of it, and arrivals still waiting at
+the end of the step are reported as unsent. For every step throughput,
+p50/p90/p99 latency of the successful requests and the error rate by status
+(e.g. 429 from admission control, 503 from an open circuit) are reported,
+overall and per request kind. For every worker count the peak throughput and
+the highest concurrency that still meets --slo-p99 and --slo-errors are
+reported. Results carry the git commit so runs can be compared:
+
+    python -m src.benchmarks.load --app jira_api --workers 1,2,4 --concurrency 1,8,32,128 --duration 10 --latency 20 \\
+        [--mix get_linked_test_cases=6,create_test_case=1] [--rate 200] [--output load.json] [--baseline old.json]
+"""
+from typing import Dict, List, Optional, Tuple
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from src.benchmarks.ingestion import LINKS_PER_PARENT, _git_commit, load_corpus, percentiles
+from src.benchmarks.stubs import Faults, JiraStub, DifyStub
+
+APPS = ("jira_api", "student_api")
+
+# Request kinds each API can be sent
+REQUESTS = {
+    "jira_api": ("get_linked_test_cases", "graph_traverse", "graph_coverage", "create_test_case",
+                 "create_bulk_test_cases"),
+    "student_api": ("retrieve", "retrieve_uncached", "ingest_json"),
+}
+# Chatflow traffic: reads of linked tests and the link graph, some test case creation
+DEFAULT_MIXES = {
+    "jira_api": "get_linked_test_cases=6,graph_traverse=2,create_test_case=2",
+    "student_api": "retrieve=8,retrieve_uncached=2",
+}
+# Probe answering 200 once a worker can serve requests
+READY_PATHS = {"jira_api": "/readyz", "student_api": "/metrics"}
+
+DATASET_ID = "load"
+TEST_PROJECT = "TST"
+INGEST_FILE_ISSUES = 20
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def parse_mix(text: str, app: str) -> Dict[str, float]:
+    """
+    Parse a request mix like "retrieve=8,ingest_json=1" into normalized weights
+    Args:
+        text: Comma-separated kind=weight pairs; a kind without a weight counts 1
+        app: API the kinds must belong to
+    Returns:
+        Weight per request kind, summing to 1
+    """
+    weights = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in REQUESTS[app]:
+            raise ValueError(f"Unknown request kind '{kind}' for {app}. Expected one of: {', '.join(REQUESTS[app])}")
+        weights[kind] = float(weight) if weight else 1.0
+        if weights[kind] < 0:
+            raise ValueError(f"Negative weight for '{kind}'")
+    total = sum(weights.values())
+    if not total:
+        raise ValueError("The request mix is empty")
+    return {kind: weight / total for kind, weight in weights.items()}
+
+
+def _request(kind: str, rnd: random.Random, context: Dict) -> Tuple[str, str, Optional[Dict]]:
+    """Method, path and JSON body of one request of a kind"""
+    parent = rnd.choice(context["parents"])
+    if kind == "get_linked_test_cases":
+        return "GET", f"/get_linked_test_cases/{parent}", None
+    if kind == "graph_traverse":
+        return "GET", f"/graph/traverse/{parent}?depth=2", None
+    if kind == "graph_coverage":
+        return "GET", f"/graph/{parent.rsplit('-', 1)[0]}/coverage", None
+    if kind == "create_test_case":
+        return "POST", "/create_test_case", {"parent_key": parent, "project_key": TEST_PROJECT}
+    if kind == "create_bulk_test_cases":
+        return "POST", "/create_bulk_test_cases", {"main_issue_key": parent, "test_cases": [{
+            "scenario_title": f"Load scenario {idx}",
+            "gherkin": f"Given a seeker\nWhen the snitch {idx} is released\nThen it is caught",
+            "steps_to_reproduce": ["Release the snitch", "Start the match"],
+            "expected_result": "The snitch is caught",
+        } for idx in range(5)]}
+    if kind in ("retrieve", "retrieve_uncached"):
+        return "POST", "/retrieve", {"query": rnd.choice(context["queries"]), "use_cache": kind == "retrieve"}
+    if kind == "ingest_json":
+        return "POST", "/ingest/json?result_mode=compact", {"file_names": [context["ingest_file"]],
+                                                            "dataset_dir": context["ingest_dir"]}
+    raise ValueError(f"Unknown request kind '{kind}'")
+
+
+def _send(session, base_url: str, kind: str, rnd: random.Random, context: Dict, timeout: float) -> str:
+    """Send one request and return its status code, or the exception name when there was no answer"""
+    method, path, body = _request(kind, rnd, context)
+    try:
+        response = session.request(method, base_url + path, json=body, timeout=timeout)
+        # Read streamed bodies to the end, as a client would
+        response.content
+        return str(response.status_code)
+    except Exception as e:
+        return type(e).__name__
+
+
+def _summarize(samples: List[Tuple[str, str, float]], seconds: float) -> Dict:
+    """Throughput, error rate by status and latency of the successful requests"""
+    statuses = defaultdict(int)
+    latencies = []
+    for _, status, latency in samples:
+        statuses[status] += 1
+        if status.isdigit() and int(status) < 400:
+            latencies.append(latency)
+    errors = len(samples) - len(latencies)
+    return {
+        "requests": len(samples),
+        "throughput_rps": len(samples) / seconds if seconds else 0.0,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+        "latency": percentiles(latencies),
+    }
+
+
+def run_step(base_url: str, mix: Dict[str, float], context: Dict, concurrency: int, rate: Optional[float],
+             duration: float, warmup: float, timeout: float, seed: int) -> Dict:
+    """Drive the API for warmup + duration seconds (called in a fresh child); only requests sent after warmup count"""
+    import requests
+
+    kinds, weights = list(mix), list(mix.values())
+    samples: List[Tuple[str, str, float]] = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    measured_from = started + warmup
+    deadline = measured_from + duration
+    arrivals = queue.Queue() if rate else None
+    unsent = 0
+
+    def record(kind: str, status: str, planned: float) -> None:
+        if planned >= measured_from:
+            with lock:
+                samples.append((kind, status, time.perf_counter() - planned))
+
+    def closed_client(idx: int) -> None:
+        rnd = random.Random(f"{seed}-{concurrency}-{idx}")
+        with requests.Session() as session:
+            while True:
+                planned = time.perf_counter()
+                if planned >= deadline:
+                    return
+                kind = rnd.choices(kinds, weights)[0]
+                record(kind, _send(session, base_url, kind, rnd, context, timeout), planned)
+
+    def open_client(idx: int) -> None:
+        rnd = random.Random(f"{seed}-{concurrency}-{idx}")
+        with requests.Session() as session:
+            while True:
+                arrival = arrivals.get()
+                if arrival is None:
+                    return
+                if time.perf_counter() >= deadline:
+                    # Left for the unsent count
+                    arrivals.put(arrival)
+                    return
+                planned, kind = arrival
+                record(kind, _send(session, base_url, kind, rnd, context, timeout), planned)
+
+    clients = [threading.Thread(target=open_client if rate else closed_client, args=(idx,), daemon=True)
+               for idx in range(concurrency)]
+    for client in clients:
+        client.start()
+    if rate:
+        rnd = random.Random(f"{seed}-{concurrency}-arrivals")
+        planned = started
+        while True:
+            planned += rnd.expovariate(rate)
+            if planned >= deadline:
+                break
+            time.sleep(max(0.0, planned - time.perf_counter()))
+            arrivals.put((planned, rnd.choices(kinds, weights)[0]))
+        for _ in clients:
+            arrivals.put(None)
+    for client in clients:
+        client.join()
+    if rate:
+        # Arrivals the clients never got to before the deadline
+        unsent = sum(1 for arrival in list(arrivals.queue) if arrival is not None and arrival[0] >= measured_from)
+    by_kind = defaultdict(list)
+    for sample in samples:
+        by_kind[sample[0]].append(sample)
+    return {
+        "concurrency": concurrency,
+        "rate": rate,
+        **_summarize(samples, duration),
+        "unsent": unsent,
+        "by_request": {kind: _summarize(by_kind[kind], duration) for kind in kinds},
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _log_tail(path: str, lines: int = 20) -> str:
+    with open(path, "r", errors="replace") as f:
+        return "".join(f.readlines()[-lines:])
+
+
+@contextmanager
+def serve(app: str, workers: int, env: Dict[str, str], log_path: str, ready_timeout: float = 60.0):
+    """
+    Run the API under uvicorn with this many worker processes until the block exits
+    Returns:
+        Base URL of the API, once every worker is likely ready
+    """
+    port = _free_port()
+    command = [sys.executable, "-m", "uvicorn", f"src.api.{app}:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    with open(log_path, "a") as log:
+        process = subprocess.Popen(command, env=env, cwd=str(ROOT), stdout=log, stderr=subprocess.STDOUT)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        _wait_ready(url + READY_PATHS[app], workers, process, log_path, ready_timeout)
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def _wait_ready(url: str, workers: int, process, log_path: str, timeout: float) -> None:
+    """Poll the readiness probe until it answers 200 often enough in a row to have reached every worker"""
+    import requests
+
+    needed, streak = 4 * workers, 0
+    deadline = time.monotonic() + timeout
+    while streak < needed:
+        if process.poll() is not None:
+            raise RuntimeError(f"The API exited with code {process.returncode}:\n{_log_tail(log_path)}")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"The API was not ready after {timeout:.0f}s:\n{_log_tail(log_path)}")
+        try:
+            # A new connection each time, so the probes are spread over the workers
+            ok = requests.get(url, timeout=5, headers={"Connection": "close"}).status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        streak = streak + 1 if ok else 0
+        if not ok:
+            time.sleep(0.2)
+
+
+def _seed_stubs(jira: JiraStub, dify: DifyStub, parents: List[str], corpus: List[Dict]) -> None:
+    """Link test issues to every parent and index the corpus in the Dify dataset"""
+    for idx, parent in enumerate(parents):
+        for n in range(LINKS_PER_PARENT):
+            test = jira.add_issue({"key": f"{TEST_PROJECT}-{idx * LINKS_PER_PARENT + n + 1}", "fields": {
+                "summary": f"Test {n} of {parent}", "description": "Load test case", "issuetype": {"name": "Test"}}})
+            jira.add_link(test["key"], parent, "Tests")
+    for issue in corpus:
+        fields = issue["fields"]
+        dify.create_document({"name": issue["key"], "text": f"{fields.get('summary') or ''}\n{fields.get('description') or ''}"},
+                             {}, DATASET_ID)
+
+
+def _capacity(steps: List[Dict], slo_p99: float, slo_errors: float) -> Dict:
+    """Peak throughput per worker count and the highest concurrency meeting the objective"""
+    capacity = {}
+    for workers in sorted({step["workers"] for step in steps}):
+        runs = [step for step in steps if step["workers"] == workers]
+        peak = max(runs, key=lambda step: step["throughput_rps"])
+        # Arrivals never sent count as errors: the API fell behind the arrival rate
+        within = [step["concurrency"] for step in runs
+                  if (step["error_rate"] * step["requests"] + step["unsent"]) <= slo_errors * (step["requests"] + step["unsent"])
+                  and step["latency"]["p99_ms"] is not None and step["latency"]["p99_ms"] <= slo_p99]
+        capacity[str(workers)] = {"peak_throughput_rps": peak["throughput_rps"], "peak_concurrency": peak["concurrency"],
+                                  "max_concurrency_within_slo": max(within) if within else None}
+    return capacity
+
+
+def run(app: str, workers_counts: List[int], concurrencies: List[int], mix: Dict[str, float], faults: Dict,
+        dataset_dir: str, issues: int, duration: float, warmup: float = 2.0, rate: Optional[float] = None,
+        timeout: float = 30.0, slo_p99: float = 1000.0, slo_errors: float = 0.01, seed: int = 0,
+        synthetic: bool = False) -> Dict:
+    corpus = load_corpus(dataset_dir, issues, synthetic=synthetic, seed=seed)
+    parents = [issue["key"] for issue in corpus[:max(1, issues // (LINKS_PER_PARENT + 1))]]
+    queries = [issue["fields"].get("summary") for issue in corpus if issue["fields"].get("summary")][:200] or ["test"]
+    results = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "app": app,
+        "config": {"issues": issues, "mix": mix, "rate": rate, "duration": duration, "warmup": warmup,
+                   "seed": seed, "synthetic": synthetic, **faults},
+        "steps": [],
+    }
+    # Requests to the API and the stubs must not go through a proxy from the environment
+    os.environ["NO_PROXY"] = ",".join(filter(None, [os.environ.get("NO_PROXY"), "127.0.0.1", "localhost"]))
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "load_issues.json"), "w", encoding="utf-8") as f:
+            json.dump(corpus[:INGEST_FILE_ISSUES], f)
+        context = {"parents": parents, "queries": queries, "ingest_dir": tmp, "ingest_file": "load_issues.json"}
+        log_path = os.path.join(tmp, "api.log")
+        spawn = multiprocessing.get_context("spawn")
+        for workers in workers_counts:
+            # Fresh stubs for every worker count, so created issues and documents do not pile up
+            with JiraStub(corpus, Faults(seed=seed, **faults)) as jira, DifyStub(Faults(seed=seed, **faults)) as dify:
+                _seed_stubs(jira, dify, parents, corpus)
+                env = {**os.environ,
+                       "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])),
+                       "JIRA_SERVER_URL": jira.url[:-len(JiraStub.prefix)], "JIRA_EMAIL": "load@example.com",
+                       "JIRA_API_TOKEN": "load", "DIFY_BASE_URL": dify.url, "DIFY_DATASET_API_KEY": "load",
+                       "DIFY_DATASET_ID": DATASET_ID}
+                with serve(app, workers, env, log_path) as url, \
+                        ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    for concurrency in concurrencies:
+                        step = pool.submit(run_step, url, mix, context, concurrency, rate, duration, warmup,
+                                           timeout, seed).result()
+                        step = {"workers": workers, **step}
+                        results["steps"].append(step)
+                        print(f"workers {workers}, concurrency {concurrency}: {step['throughput_rps']:.1f} req/s, "
+                              f"p50 {step['latency']['p50_ms']} ms, p99 {step['latency']['p99_ms']} ms, "
+                              f"errors {step['error_rate']:.1%} {step['statuses']}, unsent {step['unsent']}", file=sys.stderr)
+                results.setdefault("server", {})[str(workers)] = {"jira": jira.stats(), "dify": dify.stats()}
+    results["capacity"] = _capacity(results["steps"], slo_p99, slo_errors)
+    results["config"].update(slo_p99_ms=slo_p99, slo_errors=slo_errors)
+    return results
+
+
+def compare(results: Dict, baseline: Dict) -> Dict:
+    """Relative change of throughput, p99 and error rate per step against an earlier run"""
+    previous = {(step["workers"], step["concurrency"]): step for step in baseline.get("steps", [])}
+    changes = {}
+    for current in results["steps"]:
+        before = previous.get((current["workers"], current["concurrency"]))
+        if not before:
+            continue
+
+        def ratio(a, b):
+            return (a / b - 1.0) if a is not None and b else None
+
+        changes[f"{current['workers']}x{current['concurrency']}"] = {
+            "throughput_rps": ratio(current["throughput_rps"], before["throughput_rps"]),
+            "p99_ms": ratio(current["latency"]["p99_ms"], before["latency"]["p99_ms"]),
+            "error_rate": current["error_rate"] - before["error_rate"],
+        }
+    return {"baseline_commit": baseline.get("commit"), "changes": changes}
+
+
+def _int_list(text: str) -> List[int]:
+    values = [int(v) for v in text.split(",") if v.strip()]
+    if not values or min(values) < 1:
+        raise argparse.ArgumentTypeError("expected comma-separated positive integers")
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test an API under uvicorn against local Jira and Dify stubs')
+    parser.add_argument('--app', type=str, choices=APPS, default='jira_api', help='API to load (default: jira_api)')
+    parser.add_argument('--workers', type=_int_list, default=[1], help='Comma-separated uvicorn worker counts (default: 1)')
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 8, 32],
+                        help='Comma-separated client counts per step (default: 1,8,32)')
+    parser.add_argument('--mix', type=str, default=None,
+                        help=f'Weighted request kinds, e.g. "{DEFAULT_MIXES["jira_api"]}" (default: the app\'s chatflow mix)')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='Open loop: Poisson arrivals per second instead of back-to-back requests per client')
+    parser.add_argument('--duration', type=float, default=10.0, help='Measured seconds per step (default: 10)')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Unmeasured seconds before each step (default: 2)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Client timeout per request in seconds')
+    parser.add_argument('--slo-p99', type=float, default=1000.0, help='p99 objective in ms for the capacity summary')
+    parser.add_argument('--slo-errors', type=float, default=0.01, help='Error rate objective for the capacity summary')
+    parser.add_argument('--dataset-dir', type=str, default='data/dataset', help='Directory with Atlassian-schema issue files')
+    parser.add_argument('--issues', type=int, default=1000, help='Issues served by the Jira stub (default: 1000)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Added latency per stub request in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform +- jitter in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of stub data requests that fail')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of injected errors (default: 500)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the request mix, arrivals, faults and corpus')
+    parser.add_argument('--synthetic', action='store_true',
+                        help='Generate the corpus with src.benchmarks.synthetic_corpus instead of replicating the files')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this file')
+    parser.add_argument('--baseline', type=str, default=None, help='Earlier results file to compare with')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix or DEFAULT_MIXES[args.app], args.app)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+    faults = {"latency": args.latency / 1000, "jitter": args.jitter / 1000,
+              "error_rate": args.error_rate, "error_status": args.error_status}
+    results = run(args.app, args.workers, args.concurrency, mix, faults, args.dataset_dir, args.issues,
+                  args.duration, warmup=args.warmup, rate=args.rate, timeout=args.timeout, slo_p99=args.slo_p99,
+                  slo_errors=args.slo_errors, seed=args.seed, synthetic=args.synthetic)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            results["comparison"] = compare(results, json.load(f))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+In-process stand-ins for the Jira REST API and the Dify dataset API.
+
+Both servers run on a background thread on 127.0.0.1 and implement only the
+endpoints the Jira client and DifyIntegration call. Every data request can be
+delayed (latency +- uniform jitter) and failed at a given rate to see how the
+clients behave against a slow or flaky server; setup calls (server info,
+link types, dataset and metadata creation) are never faulted. Request bodies
+with a Content-Encoding listed in ``content_encodings`` (gzip, and zstd when
+zstandard is installed) are decoded; other encodings get a 415.
+
+    with JiraStub(issues, Faults(latency=0.05, error_rate=0.01)) as jira, DifyStub() as dify:
+        client = JiraClient(server_url=jira.url[:-len(JiraStub.prefix)], email="bench", api_token="bench")
+        dify_client = DifyIntegration(api_key="bench", base_url=dify.url)
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+Route = Tuple[str, "re.Pattern", Callable, bool]
+
+try:
+    import zstandard
+    CONTENT_ENCODINGS = ("gzip", "zstd")
+except ImportError:
+    zstandard = None
+    CONTENT_ENCODINGS = ("gzip",)
+
+
+class Faults:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 500, seed: Optional[int] = None):
+        """
+        Args:
+            latency: Seconds added to every faulted request
+            jitter: Uniform +- seconds around latency
+            error_rate: Fraction of faulted requests answered with error_status
+            error_status: Status of injected errors (the Jira session retries 429 and 503)
+            seed: Seed of the fault schedule
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> Tuple[float, bool]:
+        """Delay and whether to fail for the next request"""
+        with self._lock:
+            delay = self.latency + (self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        return max(0.0, delay), failed
+
+    def to_dict(self) -> Dict:
+        return {"latency": self.latency, "jitter": self.jitter, "error_rate": self.error_rate,
+                "error_status": self.error_status}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this keep-alive clients wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method: str):
+        self.server.stub.handle(self, method)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+def _decode_body(raw: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        try:
+            return gzip.decompress(raw)
+        except OSError as e:
+            raise ValueError(str(e))
+    if encoding == "zstd":
+        try:
+            return zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+        except zstandard.ZstdError as e:
+            raise ValueError(str(e))
+    return raw
+
+
+class StubServer:
+    """Routes requests to handler methods returning (status, body)"""
+
+    prefix = ""
+
+    def __init__(self, faults: Optional[Faults] = None, port: int = 0, content_encodings=CONTENT_ENCODINGS):
+        self.faults = faults or Faults()
+        self.content_encodings = tuple(content_encodings)
+        self.encoded_requests = Counter()
+        self.routes: List[Route] = []
+        self.requests = Counter()
+        self.injected_errors = Counter()
+        self._stats_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.prefix}"
+
+    def route(self, method: str, pattern: str, handler: Callable, faulted: bool = True) -> None:
+        self.routes.append((method, re.compile(f"^{self.prefix}{pattern}$"), handler, faulted))
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {"requests": dict(self.requests), "injected_errors": dict(self.injected_errors),
+                    "encoded_requests": dict(self.encoded_requests), "faults": self.faults.to_dict()}
+
+    def handle(self, request: BaseHTTPRequestHandler, method: str) -> None:
+        parsed = urlparse(request.path)
+        length = int(request.headers.get("Content-Length") or 0)
+        raw = request.rfile.read(length) if length else b""
+        for route_method, pattern, handler, faulted in self.routes:
+            match = pattern.match(parsed.path)
+            if route_method != method or not match:
+                continue
+            name = f"{method} {pattern.pattern[1:-1]}"
+            with self._stats_lock:
+                self.requests[name] += 1
+            if faulted:
+                delay, failed = self.faults.draw()
+                if delay:
+                    time.sleep(delay)
+                if failed:
+                    with self._stats_lock:
+                        self.injected_errors[name] += 1
+                    self._send(request, self.faults.error_status, {"message": "Injected error", "errorMessages": ["Injected error"]})
+                    return
+            encoding = (request.headers.get("Content-Encoding") or "identity").lower()
+            if encoding != "identity":
+                if encoding not in self.content_encodings:
+                    self._send(request, 415, {"message": f"Unsupported Content-Encoding {encoding}"})
+                    return
+                with self._stats_lock:
+                    self.encoded_requests[encoding] += 1
+            try:
+                body = json.loads(_decode_body(raw, encoding)) if raw else {}
+            except ValueError:
+                self._send(request, 400, {"message": "Invalid JSON"})
+                return
+            query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+            status, payload = handler(body=body, query=query, **match.groupdict())
+            self._send(request, status, payload)
+            return
+        self._send(request, 404, {"message": f"No stub route for {method} {parsed.path}"})
+
+    @staticmethod
+    def _send(request: BaseHTTPRequestHandler, status: int, payload) -> None:
+        data = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        if data:
+            request.wfile.write(data)
+
+
+def _project_key(issue_key: str) -> str:
+    return issue_key.rsplit("-", 1)[0]
+
+
+class JiraStub(StubServer):
+    """Jira REST API v2: search, issue, single and bulk create, issue links, project issue types"""
+
+    prefix = "/rest/api/2"
+    LINK_TYPES = [{"id": "10000", "name": "Tests", "inward": "is tested by", "outward": "tests"},
+                  {"id": "10001", "name": "Relates", "inward": "relates to", "outward": "relates to"}]
+    ISSUE_TYPES = [{"id": "10009", "name": "Test", "subtask": False}, {"id": "10001", "name": "Story", "subtask": False}]
+
+    def __init__(self, issues: Optional[List[Dict]] = None, faults: Optional[Faults] = None, port: int = 0):
+        super().__init__(faults, port)
+        self.issues: Dict[str, Dict] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        for issue in issues or []:
+            self.add_issue(issue)
+        self.route("GET", r"/serverInfo", self.server_info, faulted=False)
+        self.route("GET", r"/issueLinkType", self.link_types, faulted=False)
+        self.route("GET", r"/field", self.fields, faulted=False)
+        self.route("GET", r"/search", self.search)
+        self.route("GET", r"/issue/(?P<key>[^/]+)", self.get_issue)
+        self.route("GET", r"/project/(?P<key>[^/]+)", self.get_project, faulted=False)
+        self.route("GET", r"/issue/createmeta/(?P<key>[^/]+)/issuetypes", self.issue_types, faulted=False)
+        self.route("POST", r"/issue", self.create)
+        self.route("POST", r"/issue/bulk", self.bulk_create)
+        self.route("POST", r"/issueLink", self.create_link)
+
+    def add_issue(self, issue: Dict) -> Dict:
+        """Store a raw issue the way Jira returns it (project set, unassigned as null)"""
+        key = issue["key"]
+        project = _project_key(key)
+        fields = dict(issue.get("fields") or {})
+        fields.setdefault("project", {"key": project, "name": project})
+        now = time.strftime("%Y-%m-%dT%H:%M:%S.000+0000", time.gmtime())
+        for name, default in (("summary", ""), ("description", None), ("status", {"name": "To Do"}),
+                              ("issuetype", {"name": "Task"}), ("created", now), ("updated", now)):
+            fields.setdefault(name, default)
+        fields["issuelinks"] = list(fields.get("issuelinks") or [])
+        for name in ("assignee", "reporter"):
+            if not fields.get(name):
+                fields[name] = None
+        stored = {"id": str(issue.get("id") or len(self.issues) + 10000), "key": key,
+                  "self": f"{self.url}/issue/{key}", "fields": fields}
+        with self._lock:
+            self.issues[key] = stored
+            number = int(key.rsplit("-", 1)[1]) if key.rsplit("-", 1)[-1].isdigit() else 0
+            self._counters[project] = max(self._counters.get(project, 0), number)
+        return stored
+
+    def add_link(self, inward_key: str, outward_key: str, link_type: str = "Tests") -> None:
+        """Link two issues; each side sees the other as outwardIssue / inwardIssue"""
+        kind = next((t for t in self.LINK_TYPES if t["name"] == link_type),
+                    {"id": "10099", "name": link_type, "inward": link_type, "outward": link_type})
+        with self._lock:
+            inward, outward = self.issues[inward_key], self.issues[outward_key]
+            link_id = str(uuid.uuid4().int % 10 ** 8)
+            inward["fields"]["issuelinks"].append({"id": link_id, "type": kind, "outwardIssue": self._link_ref(outward)})
+            outward["fields"]["issuelinks"].append({"id": link_id, "type": kind, "inwardIssue": self._link_ref(inward)})
+
+    @staticmethod
+    def _link_ref(issue: Dict) -> Dict:
+        fields = issue["fields"]
+        return {"id": issue["id"], "key": issue["key"],
+                "fields": {name: fields.get(name) for name in ("summary", "status", "priority", "issuetype")}}
+
+    def server_info(self, body, query):
+        return 200, {"baseUrl": self.url, "version": "9.12.0", "versionNumbers": [9, 12, 0],
+                     "deploymentType": "Server", "serverTitle": "Jira stub"}
+
+    def fields(self, body, query):
+        with self._lock:
+            names = sorted({name for issue in self.issues.values() for name in issue["fields"]})
+        return 200, [{"id": name, "key": name, "name": name, "custom": name.startswith("customfield_"),
+                      "navigable": True, "searchable": True, "clauseNames": [name]} for name in names]
+
+    def link_types(self, body, query):
+        return 200, {"issueLinkTypes": self.LINK_TYPES}
+
+    def search(self, body, query):
+        jql = query.get("jql", "")
+        start_at = int(query.get("startAt", 0))
+        max_results = min(int(query.get("maxResults", 50)), 1000)
+        match = re.search(r'project\s*=\s*"?([A-Za-z0-9_]+)"?', jql)
+        with self._lock:
+            issues = list(self.issues.values())
+        if match:
+            project = match.group(1).upper()
+            issues = [issue for issue in issues if _project_key(issue["key"]) == project]
+        page = issues[start_at:start_at + max_results]
+        fields = query.get("fields")
+        if fields and not fields.startswith("*"):
+            wanted = fields.split(",")
+            page = [{**issue, "fields": {name: issue["fields"].get(name) for name in wanted}} for issue in page]
+        return 200, {"startAt": start_at, "maxResults": max_results, "total": len(issues), "issues": page}
+
+    def get_issue(self, body, query, key):
+        issue = self.issues.get(key.upper())
+        if issue is None:
+            return 404, {"errorMessages": ["Issue Does Not Exist"], "errors": {}}
+        return 200, issue
+
+    def get_project(self, body, query, key):
+        key = key.upper()
+        return 200, {"id": str(10000 + sum(map(ord, key))), "key": key, "name": key, "self": f"{self.url}/project/{key}"}
+
+    def issue_types(self, body, query, key):
+        return 200, {"startAt": 0, "maxResults": 50, "total": len(self.ISSUE_TYPES), "isLast": True,
+                     "values": [{**t, "self": f"{self.url}/issuetype/{t['id']}"} for t in self.ISSUE_TYPES]}
+
+    def _create(self, fields: Dict) -> Dict:
+        project = (fields.get("project") or {}).get("key", "TEST")
+        with self._lock:
+            self._counters[project] = self._counters.get(project, 0) + 1
+            key = f"{project}-{self._counters[project]}"
+        # Issue types given by id only are stored with their name, as Jira returns them
+        issue_type = fields.get("issuetype") or {}
+        if "name" not in issue_type:
+            issue_type = next((t for t in self.ISSUE_TYPES if t["id"] == issue_type.get("id")), issue_type)
+        issue = self.add_issue({"key": key, "fields": {
+            "summary": fields.get("summary"), "description": fields.get("description"),
+            "issuetype": issue_type, "priority": fields.get("priority"),
+            "labels": fields.get("labels", []),
+        }})
+        return {"id": issue["id"], "key": key, "self": issue["self"]}
+
+    def create(self, body, query):
+        return 201, self._create(body.get("fields", {}))
+
+    def bulk_create(self, body, query):
+        created = [self._create(update.get("fields", {})) for update in body.get("issueUpdates", [])]
+        return 201, {"issues": created, "errors": []}
+
+    def create_link(self, body, query):
+        inward = (body.get("inwardIssue") or {}).get("key")
+        outward = (body.get("outwardIssue") or {}).get("key")
+        if inward not in self.issues or outward not in self.issues:
+            return 404, {"errorMessages": ["Issue Does Not Exist"], "errors": {}}
+        self.add_link(inward, outward, (body.get("type") or {}).get("name", "Relates"))
+        return 201, None
+
+
+class DifyStub(StubServer):
+    """Dify dataset API: datasets, documents, metadata and retrieval"""
+
+    prefix = "/v1"
+
+    def __init__(self, faults: Optional[Faults] = None, port: int = 0, content_encodings=CONTENT_ENCODINGS):
+        super().__init__(faults, port, content_encodings)
+        # dataset id -> document id -> {"id", "name", "text", "created_at"}
+        self.datasets: Dict[str, Dict[str, Dict]] = {}
+        # Reentrant: handlers holding it call documents(), which takes it too
+        self._lock = threading.RLock()
+        self.route("POST", r"/datasets", self.create_dataset, faulted=False)
+        self.route("POST", r"/datasets/(?P<dataset>[^/]+)/metadata/built-in/enable", self.ok, faulted=False)
+        self.route("POST", r"/datasets/(?P<dataset>[^/]+)/metadata", self.create_metadata, faulted=False)
+        self.route("POST", r"/datasets/(?P<dataset>[^/]+)/document/create-by-text", self.create_document)
+        self.route("POST", r"/datasets/(?P<dataset>[^/]+)/documents/metadata", self.ok)
+        self.route("POST", r"/datasets/(?P<dataset>[^/]+)/documents/(?P<document>[^/]+)/update-by-text", self.update_document)
+        self.route("GET", r"/datasets/(?P<dataset>[^/]+)/documents", self.list_documents)
+        self.route("DELETE", r"/datasets/(?P<dataset>[^/]+)/documents/(?P<document>[^/]+)", self.delete_document)
+        self.route("POST", r"/datasets/(?P<dataset>[^/]+)/retrieve", self.retrieve)
+
+    def documents(self, dataset: str) -> Dict[str, Dict]:
+        with self._lock:
+            return self.datasets.setdefault(dataset, {})
+
+    def create_dataset(self, body, query):
+        dataset_id = str(uuid.uuid4())
+        self.documents(dataset_id)
+        return 200, {"id": dataset_id, "name": body.get("name"), "permission": body.get("permission")}
+
+    def ok(self, body, query, dataset):
+        return 200, {"result": "success"}
+
+    def create_metadata(self, body, query, dataset):
+        return 200, {"id": str(uuid.uuid4()), "name": body.get("name"), "type": body.get("type")}
+
+    def create_document(self, body, query, dataset):
+        document = {"id": str(uuid.uuid4()), "name": body.get("name"), "text": body.get("text", ""),
+                    "created_at": int(time.time())}
+        documents = self.documents(dataset)
+        with self._lock:
+            documents[document["id"]] = document
+        return 200, {"document": {k: document[k] for k in ("id", "name", "created_at")}, "batch": uuid.uuid4().hex}
+
+    def update_document(self, body, query, dataset, document):
+        documents = self.documents(dataset)
+        with self._lock:
+            if document not in documents:
+                return 404, {"message": "Document not found"}
+            documents[document].update(name=body.get("name", documents[document]["name"]), text=body.get("text", ""))
+            stored = documents[document]
+        return 200, {"document": {k: stored[k] for k in ("id", "name", "created_at")}, "batch": uuid.uuid4().hex}
+
+    def list_documents(self, body, query, dataset):
+        page, limit = int(query.get("page", 1)), min(int(query.get("limit", 20)), 100)
+        keyword = query.get("keyword")
+        with self._lock:
+            documents = [d for d in self.documents(dataset).values() if not keyword or keyword in (d["name"] or "")]
+        data = [{k: d[k] for k in ("id", "name", "created_at")} for d in documents[(page - 1) * limit:page * limit]]
+        return 200, {"data": data, "has_more": page * limit < len(documents), "limit": limit,
+                     "total": len(documents), "page": page}
+
+    def delete_document(self, body, query, dataset, document):
+        with self._lock:
+            removed = self.documents(dataset).pop(document, None)
+        return (204, None) if removed else (404, {"message": "Document not found"})
+
+    def retrieve(self, body, query, dataset):
+        text = body.get("query", "")
+        top_k = (body.get("retrieval_model") or {}).get("top_k", 4)
+        terms = {t.lower() for t in re.findall(r"\w+", text)}
+        with self._lock:
+            documents = list(self.documents(dataset).values())
+        scored = []
+        for document in documents:
+            words = set(re.findall(r"\w+", (document["text"] or "").lower()))
+            score = len(terms & words) / len(terms) if terms else 0.0
+            if score:
+                scored.append((score, document))
+        scored.sort(key=lambda item: -item[0])
+        records = [{"segment": {"content": d["text"][:500], "document": {"id": d["id"], "name": d["name"]}},
+                    "score": score} for score, d in scored[:top_k]]
+        return 200, {"query": {"content": text}, "records": records}
@@ -0,0 +1,227 @@
+"""
+Compare the "per_field" and "single" summary ingestion modes.
+
+Offline (default) the documents each mode would send are built from the
+``*_SUMMARY.json`` files and scored without any network access:
+request count, chunks and tokens embedded, and hit@1 of a BM25 ranking over
+the resulting chunks for a fixed set of questions per project. Every chunk
+is tagged with the (project, field) pairs it was generated for; a top chunk
+generated for the queried field scores 1/k when it was generated for k
+fields, so packing several fields into one section is not rewarded.
+
+With ``--live`` both modes are ingested into two fresh Dify datasets and the
+same questions are asked through the retrieve API.
+
+    python -m src.benchmarks.summary_modes --dataset-dir data/dataset [--live]
+"""
+from typing import List, Dict, Set, Tuple
+from collections import Counter
+from pathlib import Path
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import re
+import time
+
+from src.core.jira_rag.dify_integration import DifyIntegration, CHUNK_SEPARATOR, SUMMARY_MODES
+
+logger = logging.getLogger(__name__)
+
+QUESTIONS = [
+    ("summary", "What is project {project} about?"),
+    ("contributors", "Who are the contributors of project {project}?"),
+    ("assignees", "Who are the assignees of project {project}?"),
+    ("reporters", "Who reported issues in project {project}?"),
+    ("issue_count", "How many issues does project {project} have?"),
+]
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _tokens(text: str) -> List[str]:
+    return [t.lower() for t in _WORD_RE.findall(text)]
+
+
+class _BM25:
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.docs = [Counter(_tokens(d)) for d in documents]
+        self.lengths = [sum(d.values()) for d in self.docs]
+        self.avg = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        df = Counter(term for d in self.docs for term in d)
+        n = len(self.docs)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+        self.k1, self.b = k1, b
+
+    def rank(self, query: str) -> List[int]:
+        terms = _tokens(query)
+        scores = []
+        for idx, doc in enumerate(self.docs):
+            score = 0.0
+            for t in terms:
+                tf = doc.get(t)
+                if tf:
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[idx] / self.avg)
+                    score += self.idf[t] * tf * (self.k1 + 1) / norm
+            scores.append(score)
+        return sorted(range(len(scores)), key=lambda i: -scores[i])
+
+
+def _offline_dify() -> DifyIntegration:
+    # Only the document builders are used; no request is sent
+    return DifyIntegration(api_key="offline", base_url="http://offline", dataset_id="offline")
+
+
+def _load_summaries(dataset_dir: str) -> List[Tuple[str, Dict]]:
+    summaries = []
+    for path in sorted(glob.glob(os.path.join(dataset_dir, "*_SUMMARY.json"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        summaries.append((Path(path).stem.replace('_SUMMARY', ''), data[0] if isinstance(data, list) else data))
+    return summaries
+
+
+def build_chunks(dify: DifyIntegration, summaries: List[Tuple[str, Dict]], mode: str) -> Tuple[int, List[str], List[Set]]:
+    """Return (create-by-text request count, chunk texts Dify would embed, (project, field) pairs of each chunk)"""
+    requests_sent = 0
+    chunks, fields = [], []
+    for project_name, data in summaries:
+        if mode == "single":
+            doc = dify._summary_single_document(data, project_name)
+            requests_sent += 1
+            labels = _field_labels(dify, data, project_name)
+            for section in doc["text"].split(CHUNK_SEPARATOR):
+                chunks.append(section.strip())
+                fields.append(_chunk_fields(section, labels))
+        else:
+            for field, doc in dify._summary_field_documents(data.get('fields', {}), project_name):
+                requests_sent += 1
+                chunks.append(doc["text"])
+                fields.append({(project_name, field)})
+    return requests_sent, chunks, fields
+
+
+def _field_labels(dify: DifyIntegration, data: Dict, project_name: str) -> Dict[str, Tuple[str, str]]:
+    """Label -> (project, field) of every non-empty summary field; each piece of a section repeats its label"""
+    return {label: (project_name, name) for name, label, _ in dify._summary_field_map(data.get('fields', {}), project_name)}
+
+
+def _chunk_fields(text: str, labels: Dict[str, Tuple[str, str]]) -> Set[Tuple[str, str]]:
+    return {field for label, field in labels.items() if label in text}
+
+
+def _credit(fields: Set[Tuple[str, str]], expected: Tuple[str, str]) -> float:
+    """Share of a chunk generated for the expected field; 0 if it was not generated for it"""
+    return 1 / len(fields) if expected in fields else 0.0
+
+
+def run_offline(dataset_dir: str) -> Dict:
+    dify = _offline_dify()
+    summaries = _load_summaries(dataset_dir)
+    results = {}
+    for mode in SUMMARY_MODES:
+        requests_sent, chunks, chunk_fields = build_chunks(dify, summaries, mode)
+        bm25 = _BM25(chunks)
+        hits, total = 0.0, 0
+        for project_name, data in summaries:
+            present = set(_field_labels(dify, data, project_name).values())
+            for field, question in QUESTIONS:
+                if (project_name, field) not in present:
+                    continue
+                total += 1
+                top = bm25.rank(question.format(project=project_name))[0]
+                hits += _credit(chunk_fields[top], (project_name, field))
+        tokens = [dify._get_token_count(c) for c in chunks]
+        results[mode] = {
+            "projects": len(summaries),
+            "requests": requests_sent,
+            "chunks": len(chunks),
+            "tokens_embedded": sum(tokens),
+            "mean_chunk_tokens": (sum(tokens) / len(tokens)) if tokens else 0,
+            "hit_at_1": (hits / total) if total else 0.0,
+            "questions": total,
+        }
+    return results
+
+
+def _wait_for_indexing(dify: DifyIntegration, batches: List[str], timeout: float = 300.0) -> None:
+    import requests
+
+    deadline = time.monotonic() + timeout
+    pending = set(batches)
+    while pending and time.monotonic() < deadline:
+        for batch in list(pending):
+            url = f"{dify.base_url}/datasets/{dify.dataset_id}/documents/{batch}/indexing-status"
+            response = requests.get(url, headers=dify.headers)
+            response.raise_for_status()
+            statuses = [d.get("indexing_status") for d in response.json().get("data", [])]
+            if statuses and all(s in ("completed", "error") for s in statuses):
+                pending.discard(batch)
+        if pending:
+            time.sleep(2)
+
+
+def run_live(dataset_dir: str, top_k: int = 3) -> Dict:
+    summaries = _load_summaries(dataset_dir)
+    results = {}
+    for mode in SUMMARY_MODES:
+        dify = DifyIntegration()
+        dify.dataset_id = dify.create_dataset(name=f"Summary_Benchmark_{mode}_{int(time.time())}")
+        batches = []
+        started = time.perf_counter()
+        for project_name, data in summaries:
+            for response in dify._ingest_summary_file(data, f"{project_name}_SUMMARY.json", mode=mode):
+                if response.get("batch"):
+                    batches.append(response["batch"])
+        ingest_seconds = time.perf_counter() - started
+        _wait_for_indexing(dify, batches)
+        labels = {}
+        for project_name, data in summaries:
+            labels.update(_field_labels(dify, data, project_name))
+        hits, total = 0.0, 0
+        for project_name, data in summaries:
+            for field, question in QUESTIONS:
+                if (project_name, field) not in labels.values():
+                    continue
+                total += 1
+                response = dify.retrieve(
+                    question.format(project=project_name),
+                    retrieval_model={"search_method": "hybrid_search", "reranking_enable": False, "top_k": top_k,
+                                     "score_threshold_enabled": False},
+                    use_cache=False,
+                )
+                contents = [r.get("segment", {}).get("content", "") for r in response.get("records", [])]
+                hits += max((_credit(_chunk_fields(content, labels), (project_name, field)) for content in contents),
+                            default=0.0)
+        results[mode] = {
+            "dataset_id": dify.dataset_id,
+            "requests": len(batches),
+            "ingest_seconds": ingest_seconds,
+            f"hit_at_{top_k}": (hits / total) if total else 0.0,
+            "questions": total,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-field vs single-document summary ingestion')
+    parser.add_argument('--dataset-dir', type=str, default='data/dataset',
+                        help='Directory containing *_SUMMARY.json files (default: data/dataset)')
+    parser.add_argument('--live', action='store_true',
+                        help='Ingest into two new Dify datasets and query the retrieve API')
+    parser.add_argument('--output', type=str, default=None, help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run_live(args.dataset_dir) if args.live else run_offline(args.dataset_dir)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
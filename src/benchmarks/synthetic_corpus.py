@@ -0,0 +1,440 @@
+"""
+Seeded synthetic Jira corpora for load testing.
+
+A CorpusProfile is learned from the issue files of a dataset directory, in any
+of their schemas (flat records, the Jira REST export with ``creator`` and
+``parent``, the Atlassian ``fields.*`` schema and its tech-spec enriched
+variant). It keeps the distributions the generator samples from:
+
+    issue types, statuses per type, priorities, components, labels, people
+    summary word chains per issue type
+    description sentences and sentence counts, tech-spec blocks
+    link types, links per issue, epic membership, created/updated spread
+
+CorpusGenerator yields issues one at a time in the requested schema; links and
+epics only point back at a small window of recent issues per project, so the
+corpus is never held in memory. write_corpus streams them to a JSON array,
+JSONL or a ``.jstore`` compact store:
+
+    python -m src.benchmarks.synthetic_corpus --count 100000 --seed 7 --output corpus.jsonl
+    python -m src.benchmarks.synthetic_corpus --count 1000000 --schema atlassian --projects 40 --output corpus.jstore
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from bisect import bisect
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import re
+import time
+
+from src.core.jira_rag.issue_store import write_store, is_store_path
+
+logger = logging.getLogger(__name__)
+
+SCHEMAS = ("flat", "jira", "atlassian", "enriched")
+FORMATS = ("json", "jsonl", "jstore")
+RECENT_ISSUES = 256
+MAX_SUMMARY_WORDS = 16
+SPEC_HEADING = "h3. Technical Specs"
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_START, _END = "\x02", "\x03"
+
+
+class _Sampler:
+    """Weighted choice over a Counter with one bisect per draw"""
+
+    def __init__(self, counts: Counter):
+        self.values = list(counts)
+        self.cumulative = []
+        total = 0
+        for value in self.values:
+            total += counts[value]
+            self.cumulative.append(total)
+        self.total = total
+
+    def __bool__(self) -> bool:
+        return bool(self.values)
+
+    def draw(self, rng: random.Random):
+        return self.values[bisect(self.cumulative, rng.random() * self.total)]
+
+
+def _schema_of(issue: Dict) -> str:
+    fields = issue.get("fields")
+    if not isinstance(fields, dict):
+        return "flat"
+    if SPEC_HEADING in (fields.get("description") or ""):
+        return "enriched"
+    if "priority" in fields or any(name.startswith("customfield_") for name in fields):
+        return "atlassian"
+    return "jira"
+
+
+def _name(value) -> Optional[str]:
+    return value.get("name") if isinstance(value, dict) else value
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value[:19]) if value else None
+    except ValueError:
+        return None
+
+
+def _freeze(value) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+class CorpusProfile:
+    def __init__(self):
+        self.schemas = Counter()
+        self.projects = Counter()
+        self.project_names: Dict[str, str] = {}
+        self.issue_types = Counter()
+        self.type_objects: Dict[str, Dict] = {}
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.status_objects: Dict[str, Dict] = {}
+        self.priorities = Counter()
+        # Whole values, drawn in one go: JSON text -> count
+        self.components = Counter()
+        self.labels = Counter()
+        self.assignees = Counter()
+        self.reporters = Counter()
+        self.creators = Counter()
+        self.custom_fields = Counter()
+        self.summary_chains: Dict[str, Dict[str, Counter]] = defaultdict(lambda: defaultdict(Counter))
+        self.summaries: Dict[str, List[str]] = defaultdict(list)
+        self.sentences = Counter()
+        self.sentence_counts = Counter()
+        self.spec_blocks = Counter()
+        self.link_types = Counter()
+        self.link_counts = Counter()
+        self.link_directions = Counter()
+        self.with_parent = Counter()
+        self.update_days: List[float] = []
+        self.created_range: Optional[Tuple[datetime, datetime]] = None
+        self.issues = 0
+
+    @classmethod
+    def learn(cls, dataset_dir: str) -> "CorpusProfile":
+        """Learn from every JSON list of issues in dataset_dir (summaries and other files are skipped)"""
+        profile = cls()
+        for path in sorted(glob.glob(os.path.join(dataset_dir, "*.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, list):
+                continue
+            for issue in data:
+                if isinstance(issue, dict) and issue.get("key"):
+                    profile.add(issue)
+        if not profile.issues:
+            raise ValueError(f"No issues found in {dataset_dir}")
+        logger.info(f"[CORPUS] Learned profile from {profile.issues} issues in {dataset_dir}: "
+                    f"{dict(profile.schemas)} schemas, {len(profile.projects)} projects")
+        return profile
+
+    def add(self, issue: Dict) -> None:
+        schema = _schema_of(issue)
+        fields = issue["fields"] if schema != "flat" else issue
+        self.issues += 1
+        self.schemas[schema] += 1
+
+        project = fields.get("project")
+        project_key = (project or {}).get("key") if isinstance(project, dict) else None
+        project_key = project_key or issue["key"].rsplit("-", 1)[0]
+        self.projects[project_key] += 1
+        if isinstance(project, dict) and project.get("name"):
+            self.project_names[project_key] = project["name"]
+        elif isinstance(project, str):
+            self.project_names.setdefault(project_key, project)
+
+        issue_type = _name(fields.get("issuetype") or fields.get("issue_type")) or "Task"
+        self.issue_types[issue_type] += 1
+        if isinstance(fields.get("issuetype"), dict):
+            self.type_objects.setdefault(issue_type, fields["issuetype"])
+        status = _name(fields.get("status")) or "To Do"
+        self.statuses[issue_type][status] += 1
+        if isinstance(fields.get("status"), dict):
+            self.status_objects.setdefault(status, fields["status"])
+        if isinstance(fields.get("priority"), dict):
+            self.priorities[_freeze(fields["priority"])] += 1
+
+        for name, counter in (("components", self.components), ("labels", self.labels),
+                              ("assignee", self.assignees), ("reporter", self.reporters), ("creator", self.creators)):
+            if name in fields:
+                counter[_freeze(fields[name])] += 1
+        custom = {name: value for name, value in fields.items() if name.startswith("customfield_")}
+        if custom:
+            self.custom_fields[_freeze(custom)] += 1
+
+        summary = (fields.get("summary") or "").strip()
+        if summary:
+            self.summaries[issue_type].append(summary)
+            words = [_START] + summary.split() + [_END]
+            chain = self.summary_chains[issue_type]
+            for current, following in zip(words, words[1:]):
+                chain[current][following] += 1
+
+        description = fields.get("description") or ""
+        if SPEC_HEADING in description:
+            description, spec = description.split(SPEC_HEADING, 1)
+            self.spec_blocks[spec.strip("\n")] += 1
+        body = [line for line in description.splitlines() if line.strip() and not re.match(r"^h\d\. ", line)]
+        sentences = [s.strip() for s in _SENTENCE_RE.split(" ".join(body)) if len(s.strip()) > 3]
+        self.sentence_counts[len(sentences)] += 1
+        self.sentences.update(sentences)
+
+        if schema != "flat":
+            links = fields.get("issuelinks")
+            if links is not None:
+                self.link_counts[len(links)] += 1
+                for link in links:
+                    self.link_types[_freeze(link.get("type") or {"name": "Relates"})] += 1
+                    self.link_directions["outward" if link.get("outwardIssue") else "inward"] += 1
+            if "parent" in fields or issue_type == "Epic":
+                self.with_parent[bool(fields.get("parent"))] += 1
+
+        created, updated = _parse_date(fields.get("created")), _parse_date(fields.get("updated"))
+        if created:
+            low, high = self.created_range or (created, created)
+            self.created_range = (min(low, created), max(high, created))
+            if updated and updated >= created:
+                self.update_days.append((updated - created).total_seconds() / 86400)
+
+
+class CorpusGenerator:
+    def __init__(self, profile: CorpusProfile, seed: int = 0, schema: str = "mixed", projects: Optional[int] = None):
+        """
+        Args:
+            profile: Learned distributions
+            seed: Same seed, profile and arguments give the same corpus
+            schema: One of SCHEMAS, or "mixed" to follow the learned schema mix
+            projects: Number of projects (learned ones first, then numbered copies of them)
+        """
+        if schema != "mixed" and schema not in SCHEMAS:
+            raise ValueError(f"Unknown schema '{schema}'. Expected one of: mixed, {', '.join(SCHEMAS)}")
+        self.profile = profile
+        self.seed = seed
+        self.schema = schema
+        self.rng = random.Random(seed)
+        learned = [key for key, _ in sorted(profile.projects.items(), key=lambda item: (-item[1], item[0]))]
+        count = projects or len(learned)
+        self.projects = []
+        weights = Counter()
+        for idx in range(count):
+            base = learned[idx % len(learned)]
+            suffix = idx // len(learned)
+            name = profile.project_names.get(base, base)
+            self.projects.append((f"{base}{suffix + 1}" if suffix else base, f"{name} {suffix + 1}" if suffix else name))
+            # Numbered copies are as large as the project they copy
+            weights[idx] = profile.projects[base]
+        self._project_weights = _Sampler(weights)
+        self._schemas = _Sampler(profile.schemas)
+        self._types = _Sampler(profile.issue_types)
+        self._statuses = {t: _Sampler(c) for t, c in profile.statuses.items()}
+        self._summaries = {t: {word: _Sampler(following) for word, following in chain.items()}
+                           for t, chain in profile.summary_chains.items()}
+        self._samplers = {name: _Sampler(getattr(profile, name)) for name in (
+            "priorities", "components", "labels", "assignees", "reporters", "creators", "custom_fields",
+            "sentence_counts", "spec_blocks", "link_types", "link_counts", "link_directions", "with_parent")}
+        self._sentences = list(profile.sentences)
+        self._decoded: Dict[str, object] = {}
+        self._update_days = sorted(profile.update_days) or [30.0]
+        low, high = profile.created_range or (datetime(2020, 1, 1), datetime(2024, 1, 1))
+        self._created_from, self._created_span = low, max((high - low).total_seconds(), 86400.0)
+
+    def _value(self, sampler: str):
+        """Draw a whole learned value; decoded once and shared, so callers must not mutate it"""
+        frozen = self._samplers[sampler].draw(self.rng)
+        if frozen not in self._decoded:
+            self._decoded[frozen] = json.loads(frozen)
+        return self._decoded[frozen]
+
+    def _summary(self, issue_type: str) -> str:
+        chain = self._summaries.get(issue_type)
+        for _ in range(3):
+            if not chain:
+                break
+            words, word = [], _START
+            while len(words) < MAX_SUMMARY_WORDS:
+                word = chain[word].draw(self.rng) if word in chain else _END
+                if word == _END:
+                    break
+                words.append(word)
+            if len(words) >= 3:
+                return " ".join(words)
+        pool = self.profile.summaries.get(issue_type) or [f"{issue_type} work item"]
+        return self.rng.choice(pool)
+
+    def _description(self, summary: str, enriched: bool) -> Optional[str]:
+        count = self._samplers["sentence_counts"].draw(self.rng) if self._samplers["sentence_counts"] else 0
+        if not count or not self._sentences:
+            return None
+        body = " ".join(self.rng.choice(self._sentences) for _ in range(count))
+        if enriched and self._samplers["spec_blocks"]:
+            spec = self._samplers["spec_blocks"].draw(self.rng)
+            return f"h2. {summary}\n\n{body}\n\n{SPEC_HEADING}\n{spec}\n"
+        return body
+
+    def _dates(self, position: float) -> Tuple[datetime, datetime]:
+        # Creation dates grow with the issue number, with a little noise
+        offset = self._created_span * min(1.0, max(0.0, position + self.rng.uniform(-0.01, 0.01)))
+        created = self._created_from + timedelta(seconds=offset)
+        days = self._update_days[int(self.rng.random() * len(self._update_days))]
+        return created, created + timedelta(days=days * self.rng.uniform(0.5, 1.5))
+
+    def issues(self, count: int) -> Iterator[Dict]:
+        """Yield count issues; the same generator arguments always yield the same sequence"""
+        self.rng.seed(self.seed)
+        counters = [0] * len(self.projects)
+        recent = [deque(maxlen=RECENT_ISSUES) for _ in self.projects]
+        epics = [None] * len(self.projects)
+        for idx in range(count):
+            project_idx = self._project_weights.draw(self.rng)
+            project_key, project_name = self.projects[project_idx]
+            counters[project_idx] += 1
+            key = f"{project_key}-{counters[project_idx]}"
+            schema = self.schema if self.schema != "mixed" else self._schemas.draw(self.rng)
+            issue_type = self._types.draw(self.rng)
+            status = self._statuses[issue_type].draw(self.rng)
+            summary = self._summary(issue_type)
+            description = self._description(summary, enriched=schema == "enriched")
+            created, updated = self._dates(idx / max(1, count - 1))
+            parent = None
+            if issue_type == "Epic":
+                epics[project_idx] = key
+            elif epics[project_idx] and self._samplers["with_parent"] and self._samplers["with_parent"].draw(self.rng):
+                parent = epics[project_idx]
+
+            if schema == "flat":
+                issue = {"key": key, "summary": summary, "description": description, "status": status,
+                         "project": project_name, "issue_type": issue_type}
+            else:
+                issue = {"id": str(1000000 + idx), "key": key,
+                         "fields": self._fields(schema, issue_type, status, summary, description, created, updated,
+                                                project_key, project_name, parent, recent[project_idx])}
+            recent[project_idx].append((key, summary, status))
+            yield issue
+
+    def _fields(self, schema, issue_type, status, summary, description, created, updated,
+                project_key, project_name, parent, recent) -> Dict:
+        issuetype = self.profile.type_objects.get(issue_type, {"name": issue_type})
+        status_object = self.profile.status_objects.get(status, {"name": status})
+        fields = {"summary": summary, "description": description}
+        if schema == "jira":
+            fields.update(issuetype={"name": issue_type}, status={"name": status},
+                          project={"key": project_key, "name": project_name, "id": f"{project_key}-ID"},
+                          components=self._value("components") if self._samplers["components"] else [],
+                          creator=self._value("creators") if self._samplers["creators"] else {"name": "unknown"},
+                          created=created.strftime("%Y-%m-%dT%H:%M:%S"), updated=updated.strftime("%Y-%m-%dT%H:%M:%S"),
+                          parent={"key": parent} if parent else None)
+            return fields
+        fields.update(
+            status=status_object,
+            priority=self._value("priorities") if self._samplers["priorities"] else {"name": "Major"},
+            issuetype=issuetype,
+            project={"key": project_key, "name": project_name},
+            created=created.strftime("%Y-%m-%dT%H:%M:%S.000+0000"),
+            updated=updated.strftime("%Y-%m-%dT%H:%M:%S.000+0000"),
+            labels=self._value("labels") if self._samplers["labels"] else [],
+            components=self._value("components") if self._samplers["components"] else [],
+            assignee=self._value("assignees") if self._samplers["assignees"] else {},
+            reporter=self._value("reporters") if self._samplers["reporters"] else {},
+            issuelinks=self._links(recent),
+        )
+        if parent:
+            fields["parent"] = {"key": parent}
+        if self._samplers["custom_fields"]:
+            fields.update(self._value("custom_fields"))
+        return fields
+
+    def _links(self, recent) -> List[Dict]:
+        if not recent or not self._samplers["link_counts"]:
+            return []
+        links = []
+        for _ in range(self._samplers["link_counts"].draw(self.rng)):
+            key, summary, status = recent[int(self.rng.random() * len(recent))]
+            direction = self._samplers["link_directions"].draw(self.rng) if self._samplers["link_directions"] else "outward"
+            links.append({
+                "id": str(self.rng.randrange(100000, 999999)),
+                "type": self._value("link_types") if self._samplers["link_types"] else {"name": "Relates"},
+                f"{direction}Issue": {"key": key, "fields": {
+                    "summary": summary, "status": self.profile.status_objects.get(status, {"name": status})}},
+            })
+        return links
+
+
+def format_for_path(path: str) -> str:
+    if is_store_path(path):
+        return "jstore"
+    return "jsonl" if str(path).endswith((".jsonl", ".ndjson")) else "json"
+
+
+def write_corpus(issues: Iterable[Dict], path: str, fmt: Optional[str] = None) -> int:
+    """
+    Stream issues to path as a JSON array (one issue per line), JSONL or a compact store
+    Returns:
+        Number of issues written
+    """
+    fmt = fmt or format_for_path(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Expected one of: {', '.join(FORMATS)}")
+    if fmt == "jstore":
+        return write_store(issues, path, source=Path(path).with_suffix(".json").name)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            f.write("[")
+        for issue in issues:
+            line = json.dumps(issue, ensure_ascii=False, separators=(",", ":"))
+            if fmt == "json":
+                f.write(",\n" if count else "\n")
+                f.write(line)
+            else:
+                f.write(line + "\n")
+            count += 1
+        if fmt == "json":
+            f.write("\n]\n")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a seeded synthetic Jira corpus learned from the dataset files')
+    parser.add_argument('--dataset-dir', type=str, default='data/dataset', help='Directory with issue files to learn from')
+    parser.add_argument('--count', type=int, default=10000, help='Issues to generate (default: 10000)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--schema', type=str, default='mixed', choices=('mixed',) + SCHEMAS,
+                        help='Output schema; "mixed" follows the learned mix (default)')
+    parser.add_argument('--projects', type=int, default=None, help='Number of projects (default: the learned ones)')
+    parser.add_argument('--output', type=str, required=True, help='Output file (.json, .jsonl or .jstore)')
+    parser.add_argument('--format', type=str, default=None, choices=FORMATS, help='Output format (default: from the suffix)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    profile = CorpusProfile.learn(args.dataset_dir)
+    generator = CorpusGenerator(profile, seed=args.seed, schema=args.schema, projects=args.projects)
+    started = time.perf_counter()
+    count = write_corpus(generator.issues(args.count), args.output, args.format)
+    seconds = time.perf_counter() - started
+    print(json.dumps({
+        "output": args.output,
+        "format": args.format or format_for_path(args.output),
+        "issues": count,
+        "projects": len(generator.projects),
+        "seed": args.seed,
+        "schema": args.schema,
+        "seconds": seconds,
+        "issues_per_second": count / seconds if seconds else 0.0,
+        "bytes": os.path.getsize(args.output),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Admission control for the APIs: concurrency budgets and priority classes per route.
+
+Each route template is mapped to a class. A class has a priority, a
+concurrency budget and a bounded wait queue; all classes also share
+ADMISSION_MAX_CONCURRENCY slots. Sync endpoints run on the event loop's
+default executor, which asyncio sizes at min(32, CPUs + 4) threads;
+install_sync_executor() replaces it at startup with API_SYNC_THREADS
+threads (default 40), and the shared budget defaults to 8 fewer, leaving
+threads for unlimited routes such as probes and /metrics. A request that finds its class or the shared pool full
+waits in the queue for up to the class's queue timeout. When a slot frees
+up, waiting requests of higher-priority classes go first. A request that
+finds the queue full, or is still waiting at the timeout, gets a 429 with a
+Retry-After estimated from the class's recent request durations. This beats
+holding the connection in an unbounded queue.
+
+Routes without a class are not limited. A class is tuned with
+ADMISSION_<CLASS>_CONCURRENCY, _QUEUE and _QUEUE_TIMEOUT, e.g.
+ADMISSION_BULK_CONCURRENCY=4. ADMISSION_ENABLED=0 turns admission off.
+"""
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import time
+
+from .metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Threads kept free of admitted requests for routes without a class
+UNLIMITED_HEADROOM = 8
+
+ADMISSION_REJECTED = Counter("jira_rag_admission_rejected_total", "Requests answered 429 by admission control",
+                             ["class", "reason"])
+ADMISSION_IN_FLIGHT = Gauge("jira_rag_admission_in_flight", "Admitted requests running, by class", ["class"])
+ADMISSION_WAITING = Gauge("jira_rag_admission_waiting", "Requests waiting for a slot, by class", ["class"])
+ADMISSION_WAIT_SECONDS = Histogram("jira_rag_admission_wait_seconds", "Time admitted requests waited for a slot",
+                                   ["class"])
+
+
+def sync_threads() -> int:
+    """Threads running sync endpoints once install_sync_executor() has run"""
+    return max(1, int(os.getenv("API_SYNC_THREADS", "40")))
+
+
+def install_sync_executor() -> int:
+    """
+    Give the running event loop a default executor of sync_threads() threads,
+    the pool Starlette runs sync endpoints on. Call from a startup handler.
+    Returns:
+        Number of threads
+    """
+    threads = sync_threads()
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=threads, thread_name_prefix="sync"))
+    logger.info(f"[ADMISSION] Running sync endpoints on {threads} threads")
+    return threads
+
+
+class AdmissionClass:
+    def __init__(self, name: str, priority: int, concurrency: int, queue: int, queue_timeout: float):
+        """
+        Args:
+            name: Class name, used in metrics and the ADMISSION_<NAME>_* variables
+            priority: Waiting requests of higher priorities are admitted first
+            concurrency: Requests of the class running at once
+            queue: Requests of the class that may wait for a slot
+            queue_timeout: Seconds a request waits before it is rejected
+        """
+        prefix = f"ADMISSION_{name.upper()}_"
+        self.name = name
+        self.priority = priority
+        self.concurrency = int(os.getenv(prefix + "CONCURRENCY", str(concurrency)))
+        self.queue = int(os.getenv(prefix + "QUEUE", str(queue)))
+        self.queue_timeout = float(os.getenv(prefix + "QUEUE_TIMEOUT", str(queue_timeout)))
+        self.in_flight = 0
+        self.waiting = 0
+        # Moving average of request seconds, for Retry-After
+        self.mean_seconds = 1.0
+
+    def to_dict(self) -> Dict:
+        return {"priority": self.priority, "concurrency": self.concurrency, "queue": self.queue,
+                "queue_timeout": self.queue_timeout, "in_flight": self.in_flight, "waiting": self.waiting,
+                "mean_seconds": self.mean_seconds}
+
+
+def default_classes() -> List[AdmissionClass]:
+    """interactive: chatflow calls that a user waits on; bulk: ingestion and bulk creation"""
+    return [
+        AdmissionClass("interactive", priority=10, concurrency=32, queue=64, queue_timeout=2.0),
+        AdmissionClass("bulk", priority=0, concurrency=4, queue=8, queue_timeout=30.0),
+    ]
+
+
+class AdmissionController:
+    """
+    Slot accounting for one event loop. Waiters are plain futures resolved by
+    release, so no lock is needed as long as all calls come from that loop.
+    """
+
+    def __init__(self, classes: List[AdmissionClass], max_concurrency: Optional[int] = None):
+        self.classes = {cls.name: cls for cls in classes}
+        self.max_concurrency = max_concurrency or int(os.getenv("ADMISSION_MAX_CONCURRENCY",
+                                                                str(max(1, sync_threads() - UNLIMITED_HEADROOM))))
+        self.in_flight = 0
+        self._waiters = []  # [(-priority, seq, cls, future)], kept sorted
+        self._seq = itertools.count()
+
+    def _has_slot(self, cls: AdmissionClass) -> bool:
+        return cls.in_flight < cls.concurrency and self.in_flight < self.max_concurrency
+
+    def _take(self, cls: AdmissionClass) -> None:
+        cls.in_flight += 1
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.labels(cls.name).inc()
+
+    async def acquire(self, cls: AdmissionClass) -> Optional[str]:
+        """
+        Take a slot of the class, waiting if needed
+        Returns:
+            None once admitted, or why the request is rejected ("queue_full" or "timeout")
+        """
+        # Waiters of the same or a higher priority that could run keep their turn
+        if self._has_slot(cls) and not any(-w[0] >= cls.priority and self._has_slot(w[2]) for w in self._waiters):
+            self._take(cls)
+            return None
+        if cls.waiting >= cls.queue or cls.queue_timeout <= 0:
+            return "queue_full"
+        future = asyncio.get_running_loop().create_future()
+        waiter = (-cls.priority, next(self._seq), cls, future)
+        self._waiters.append(waiter)
+        self._waiters.sort(key=lambda w: w[:2])
+        cls.waiting += 1
+        ADMISSION_WAITING.labels(cls.name).inc()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({future}, timeout=cls.queue_timeout)
+        except BaseException:
+            # The client went away while waiting
+            self._abandon(waiter)
+            raise
+        finally:
+            cls.waiting -= 1
+            ADMISSION_WAITING.labels(cls.name).dec()
+        if future.done():
+            ADMISSION_WAIT_SECONDS.labels(cls.name).observe(time.perf_counter() - started)
+            return None
+        self._abandon(waiter)
+        return "timeout"
+
+    def _abandon(self, waiter) -> None:
+        """Drop a waiter, giving back the slot if it was granted in the meantime"""
+        cls, future = waiter[2], waiter[3]
+        if future.done() and not future.cancelled():
+            self.release(cls)
+            return
+        future.cancel()
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        # The slot this waiter was first in line for may fit another one
+        self._dispatch()
+
+    def release(self, cls: AdmissionClass, seconds: Optional[float] = None) -> None:
+        cls.in_flight -= 1
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.labels(cls.name).dec()
+        if seconds is not None:
+            cls.mean_seconds = 0.8 * cls.mean_seconds + 0.2 * seconds
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, highest priority first, skipping classes at their budget"""
+        for waiter in list(self._waiters):
+            if self.in_flight >= self.max_concurrency:
+                return
+            cls, future = waiter[2], waiter[3]
+            if self._has_slot(cls):
+                self._waiters.remove(waiter)
+                self._take(cls)
+                future.set_result(None)
+
+    def retry_after(self, cls: AdmissionClass) -> int:
+        """Seconds until the requests ahead of a new one should be done"""
+        ahead = cls.in_flight + cls.waiting
+        return max(1, math.ceil(cls.mean_seconds * (ahead + 1) / max(cls.concurrency, 1)))
+
+    def stats(self) -> Dict:
+        return {"max_concurrency": self.max_concurrency, "in_flight": self.in_flight,
+                "classes": {name: cls.to_dict() for name, cls in self.classes.items()}}
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting requests by the class of their route:
+
+        app.add_middleware(AdmissionMiddleware, routes={"/retrieve": "interactive", "/ingest/json": "bulk"})
+
+    Routes are matched by template, so "/graph/{project}/coverage" covers
+    every project. Add it after ProfilingMiddleware and before
+    MetricsMiddleware, so that rejected requests are still counted and traced.
+    """
+
+    def __init__(self, app, routes: Dict[str, str], classes: Optional[List[AdmissionClass]] = None,
+                 max_concurrency: Optional[int] = None):
+        self.app = app
+        self.controller = AdmissionController(classes or default_classes(), max_concurrency)
+        self.routes = routes
+        unknown = set(routes.values()) - set(self.controller.classes)
+        if unknown:
+            raise ValueError(f"Unknown admission classes: {', '.join(sorted(unknown))}")
+        self.enabled = os.getenv("ADMISSION_ENABLED", "1") != "0"
+
+    def _route(self, scope) -> Optional[Dict]:
+        """The first route matching the request, as the router would pick it, with its child scope"""
+        for route in getattr(scope.get("app"), "routes", []):
+            match, child_scope = route.matches(scope)
+            if getattr(match, "name", None) == "FULL":
+                return {"path": getattr(route, "path", None), **child_scope}
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self._route(scope)
+        name = self.routes.get(route["path"]) if route else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        cls = self.controller.classes[name]
+        reason = await self.controller.acquire(cls)
+        if reason is not None:
+            # Let the metrics and tracing middleware label the 429 with its route
+            scope["endpoint"] = route.get("endpoint")
+            await self._reject(cls, reason, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cls, time.perf_counter() - started)
+
+    async def _reject(self, cls: AdmissionClass, reason: str, send) -> None:
+        ADMISSION_REJECTED.labels(cls.name, reason).inc()
+        retry_after = self.controller.retry_after(cls)
+        logger.warning(f"[ADMISSION] Rejected a {cls.name} request ({reason}), "
+                       f"{cls.in_flight} running and {cls.waiting} waiting; retry after {retry_after}s")
+        body = json.dumps({"detail": f"Too many {cls.name} requests, retry after {retry_after}s",
+                           "class": cls.name, "reason": reason}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 429,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                                (b"retry-after", str(retry_after).encode())]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,191 @@
+"""
+Structure-aware, token-exact chunking of Jira issue text.
+
+Descriptions are split into sections on Jira wiki (``h1.`` - ``h6.``) and
+Markdown headings, each section into paragraph and list blocks, and blocks are
+packed into chunks of at most ``max_tokens``. Overlap is only added between
+consecutive chunks of a section that does not fit in a single chunk, so short
+issues are embedded exactly once instead of paying a fixed 400-token overlap.
+"""
+from typing import List, Callable, Optional, Tuple
+import math
+import re
+
+HEADING_RE = re.compile(r'^\s*(?:h[1-6]\.|#{1,6})\s+(.*\S)\s*$')
+LIST_ITEM_RE = re.compile(r'^\s*(?:[-*#]+|\d+[.)])\s+')
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Dify-side rule used before local chunking: fixed size with 20% overlap
+BASELINE_MAX_TOKENS = 2000
+BASELINE_OVERLAP = 400
+
+
+def baseline_tokens(total_tokens: int, max_tokens: int = BASELINE_MAX_TOKENS, overlap: int = BASELINE_OVERLAP) -> int:
+    """Tokens embedded when Dify splits a text at a fixed size with fixed overlap"""
+    if total_tokens <= max_tokens:
+        return total_tokens
+    chunks = math.ceil((total_tokens - overlap) / (max_tokens - overlap))
+    return total_tokens + overlap * (chunks - 1)
+
+
+def split_sections(text: str) -> List[Tuple[Optional[str], List[str]]]:
+    """Split text into (heading, lines) sections; text before the first heading has no heading"""
+    sections: List[Tuple[Optional[str], List[str]]] = [(None, [])]
+    for line in text.splitlines():
+        match = HEADING_RE.match(line)
+        if match:
+            sections.append((match.group(1), []))
+        else:
+            sections[-1][1].append(line)
+    return [(heading, lines) for heading, lines in sections if heading or any(l.strip() for l in lines)]
+
+
+def split_blocks(lines: List[str]) -> List[str]:
+    """Group lines into paragraphs and runs of list items"""
+    blocks, current, in_list = [], [], False
+    for line in lines:
+        if not line.strip():
+            if current:
+                blocks.append("\n".join(current))
+            current, in_list = [], False
+            continue
+        is_item = bool(LIST_ITEM_RE.match(line))
+        if current and is_item != in_list and not (in_list and line.startswith((' ', '\t'))):
+            blocks.append("\n".join(current))
+            current = []
+        current.append(line.rstrip())
+        in_list = is_item or (in_list and line.startswith((' ', '\t')))
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+class IssueChunker:
+    """
+    Packs issue text into chunks of at most max_tokens using the given token
+    counter (tiktoken in production) and token-level splitting as a last resort.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        max_tokens: int = 500,
+        overlap_tokens: int = 50,
+        encode: Optional[Callable[[str], List[int]]] = None,
+        decode: Optional[Callable[[List[int]], str]] = None,
+    ):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.encode = encode
+        self.decode = decode
+
+    def _split_oversized(self, block: str, budget: int) -> List[str]:
+        """Split a single block that exceeds the budget: lines, sentences, then tokens"""
+        units = block.split("\n") if "\n" in block else SENTENCE_RE.split(block)
+        if len(units) == 1:
+            if self.encode and self.decode:
+                ids = self.encode(block)
+                return [self.decode(ids[i:i + budget]) for i in range(0, len(ids), budget)]
+            # Character fallback at the usual ~4 characters per token
+            step = budget * 4
+            return [block[i:i + step] for i in range(0, len(block), step)]
+        joiner = "\n" if "\n" in block else " "
+        pieces, current, used = [], [], 0
+        for unit in units:
+            tokens = self.count_tokens(unit)
+            if tokens > budget:
+                if current:
+                    pieces.append(joiner.join(current))
+                    current, used = [], 0
+                pieces.extend(self._split_oversized(unit, budget))
+                continue
+            if current and used + tokens > budget:
+                pieces.append(joiner.join(current))
+                current, used = [], 0
+            current.append(unit)
+            used += tokens + 1
+        if current:
+            pieces.append(joiner.join(current))
+        return pieces
+
+    def _pack_section(self, prefix: str, blocks: List[str], lead: str = "") -> List[str]:
+        """
+        Pack a section's blocks; overlap is only added when the section spills over.
+        The prefix starts every chunk; lead (e.g. the issue header) starts the first one instead.
+        """
+        budget = self.max_tokens - self.count_tokens(prefix) - 2 if prefix else self.max_tokens
+        first_budget = self.max_tokens - self.count_tokens(lead) - 2 if lead else budget
+        sized = []
+        for block in blocks:
+            tokens = self.count_tokens(block)
+            if tokens > budget:
+                sized.extend((piece, self.count_tokens(piece)) for piece in self._split_oversized(block, budget))
+            else:
+                sized.append((block, tokens))
+
+        chunks, current, used = [], [], 0
+        for block, tokens in sized:
+            if current and used + tokens > (first_budget if not chunks else budget):
+                chunks.append(current)
+                # Carry trailing blocks up to the overlap budget into the next chunk
+                carried, carried_tokens = [], 0
+                for prev_block, prev_tokens in reversed(current):
+                    if carried_tokens + prev_tokens > self.overlap_tokens or carried_tokens + prev_tokens + tokens > budget:
+                        break
+                    carried.insert(0, (prev_block, prev_tokens))
+                    carried_tokens += prev_tokens
+                current, used = carried, carried_tokens
+            current.append((block, tokens))
+            used += tokens
+        if current:
+            chunks.append(current)
+        texts = []
+        for idx, chunk in enumerate(chunks):
+            head = lead if idx == 0 and lead else prefix
+            body = "\n\n".join(block for block, _ in chunk)
+            texts.append(f"{head}\n\n{body}" if head else body)
+        return texts
+
+    def chunk(self, header: str, description: str, context: str = "") -> List[str]:
+        """
+        Chunk an issue.
+        Args:
+            header: Metadata block (summary, key, status...) kept at the start of the first chunk
+            description: Issue description, possibly with wiki headings and lists
+            context: Short line repeated at the start of every later chunk (e.g. the issue key)
+        Returns:
+            Chunk texts, each within max_tokens
+        """
+        sections = split_sections(description or "")
+        chunks: List[str] = []
+        pending = header.strip()
+        if self.count_tokens(pending) > self.max_tokens:
+            header_chunks = self._pack_section("", split_blocks(pending.splitlines()))
+            chunks.extend(header_chunks[:-1])
+            pending = header_chunks[-1]
+        for heading, lines in sections:
+            blocks = split_blocks(lines)
+            title = heading or ""
+            candidate = "\n\n".join(part for part in [pending, title] + blocks if part)
+            if pending and self.count_tokens(candidate) <= self.max_tokens:
+                # Small sections are merged with the running chunk
+                pending = candidate
+                continue
+            section_prefix = "\n".join(part for part in [context, title] if part)
+            lead = "\n\n".join(part for part in [pending, title] if part)
+            if pending and self.count_tokens(lead) > self.max_tokens * 3 // 4:
+                # Not enough room left to share a chunk with the running text
+                chunks.append(pending)
+                lead = ""
+            section_chunks = self._pack_section(section_prefix, blocks, lead=lead) if blocks else [lead or section_prefix]
+            if len(section_chunks) == 1:
+                pending = section_chunks[0]
+            else:
+                chunks.extend(section_chunks[:-1])
+                pending = section_chunks[-1]
+        if pending:
+            chunks.append(pending)
+        return chunks
@@ -0,0 +1,357 @@
+"""
+Streaming cleaning stage for raw Jira exports.
+
+Turns multi-GB raw exports (a JSON array of Atlassian-schema issues, or JSONL)
+into the per-project ``<PROJECT>_<collection>_issues.json`` and
+``<PROJECT>_<collection>_SUMMARY.json`` files that ``DifyIntegration`` ingests.
+Input is read in fixed-size chunks and parsed one top-level item at a time
+in the parent, which also projects each issue onto the ingested fields.
+Markup stripping, content hashing and serialization, the bulk of the CPU
+time, run in worker processes with a bounded number of batches in flight.
+"""
+from typing import List, Dict, Optional, Iterator, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import re
+import textwrap
+import traceback
+
+from .compression import open_text
+from .summary_builder import SummaryBuilder
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+# Largest single item (or JSON line) buffered before the input is rejected as malformed
+MAX_ITEM_SIZE = 64 * 1024 * 1024
+
+_URL_RE = re.compile(r'\b(?:https?|ftp)://\S+|\bwww\.\S+', re.IGNORECASE)
+_CODE_BLOCK_RE = re.compile(r'\{(?:code|noformat)(?::[^}]*)?\}(.*?)\{(?:code|noformat)\}', re.DOTALL)
+_PANEL_TAG_RE = re.compile(r'\{(?:quote|panel|color|code|noformat|anchor)(?::[^}]*)?\}')
+_LINK_RE = re.compile(r'\[([^|\]]*)\|[^\]]*\]')
+_USER_LINK_RE = re.compile(r'\[~([^\]]+)\]')
+_ATTACHMENT_LINK_RE = re.compile(r'\[\^[^\]]*\]')
+_IMAGE_RE = re.compile(r'![^!\s][^!]*!')
+_HEADING_RE = re.compile(r'^\s*h[1-6]\.\s*', re.MULTILINE)
+_BLOCKQUOTE_RE = re.compile(r'^\s*bq\.\s*', re.MULTILINE)
+_LIST_RE = re.compile(r'^\s*[*#-]+\s+', re.MULTILINE)
+_EMPHASIS_RE = re.compile(r'(?<![\w*_+^~?-])([*_+^~-]|\?\?)(\S(?:.*?\S)?)\1(?![\w*_+^~?-])')
+_TABLE_RE = re.compile(r'\|\|?')
+_SPACES_RE = re.compile(r'[ \t\r\f\v]+')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+
+class RawExportFormatError(Exception):
+    pass
+
+
+def iter_raw_issues(path: str, chunk_size: int = READ_CHUNK_SIZE, max_item_size: int = MAX_ITEM_SIZE) -> Iterator[Dict]:
+    """
+    Yield each top-level issue of an export file without loading the whole file.
+    Supports a top-level JSON array of objects or JSON Lines, plain or
+    gzip/zstd compressed (decompressed while reading). An item that is still
+    incomplete after max_item_size characters raises RawExportFormatError.
+    """
+    decoder = json.JSONDecoder()
+    with open_text(path) as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf:
+            return
+        if buf[0] != '[':
+            # JSON Lines: one issue object per line
+            while True:
+                *lines, buf = buf.split('\n')
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+                if len(buf) > max_item_size:
+                    raise RawExportFormatError(f"Line longer than {max_item_size} characters in {path}")
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                buf += chunk
+            if buf.strip():
+                yield json.loads(buf)
+            return
+
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                if pos >= len(buf):
+                    raise json.JSONDecodeError("Buffer exhausted", buf, pos)
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # The item continues past the buffer: keep the tail and read more
+                if eof:
+                    raise RawExportFormatError(f"Unexpected end of file in {path}")
+                buf = buf[pos:]
+                pos = 0
+                if len(buf) > max_item_size:
+                    raise RawExportFormatError(f"Malformed item or item larger than {max_item_size} characters in {path}")
+                # Grow reads with the buffer so huge items are not re-parsed per chunk
+                chunk = f.read(max(chunk_size, len(buf)))
+                eof = not chunk
+                buf += chunk
+                continue
+            yield item
+            pos = end
+
+
+def strip_wiki_markup(text: Optional[str]) -> str:
+    """Reduce Jira wiki markup to plain text, dropping URLs and images"""
+    if not text:
+        return ""
+    text = _CODE_BLOCK_RE.sub(lambda m: m.group(1), text)
+    text = _PANEL_TAG_RE.sub('', text)
+    text = _IMAGE_RE.sub('', text)
+    text = _LINK_RE.sub(r'\1', text)
+    text = _URL_RE.sub('', text)
+    text = _USER_LINK_RE.sub(r'\1', text)
+    text = _ATTACHMENT_LINK_RE.sub('', text)
+    text = _HEADING_RE.sub('', text)
+    text = _BLOCKQUOTE_RE.sub('', text)
+    text = _LIST_RE.sub('- ', text)
+    text = _EMPHASIS_RE.sub(r'\2', text)
+    text = _TABLE_RE.sub(' ', text)
+    text = _SPACES_RE.sub(' ', text)
+    text = _BLANK_LINES_RE.sub('\n\n', text)
+    return "\n".join(line.strip() for line in text.split('\n')).strip()
+
+
+def _name_of(value, attr: str = 'name') -> Optional[str]:
+    if isinstance(value, dict):
+        return value.get(attr) or value.get('name') or None
+    return value or None
+
+
+def select_fields(raw: Dict) -> Optional[Dict]:
+    """
+    Project a raw export issue onto the fields the ingestion path reads.
+    Runs in the parent; free text is left untouched so the expensive cleaning
+    can run in workers.
+    """
+    if not isinstance(raw, dict) or not raw.get('key'):
+        return None
+    key = raw['key']
+    fields = raw.get('fields') or {}
+    assignee = _name_of(fields.get('assignee'), 'displayName')
+    reporter = _name_of(fields.get('reporter'), 'displayName')
+    return {
+        "id": raw.get('id'),
+        "key": key,
+        "fields": {
+            "summary": fields.get('summary'),
+            "description": fields.get('description'),
+            "status": {"name": _name_of(fields.get('status'))},
+            "priority": {"name": _name_of(fields.get('priority'))},
+            "issuetype": {"name": _name_of(fields.get('issuetype'))},
+            "project": {"key": key.rsplit('-', 1)[0]},
+            "created": fields.get('created'),
+            "updated": fields.get('updated'),
+            "labels": fields.get('labels') or [],
+            "components": [{"name": _name_of(c)} for c in fields.get('components') or [] if _name_of(c)],
+            "assignee": {"displayName": assignee} if assignee else {},
+            "reporter": {"displayName": reporter} if reporter else {},
+        }
+    }
+
+
+def clean_issue(issue: Dict) -> Optional[Dict]:
+    """Strip markup from a projected issue; returns None if no text is left"""
+    fields = issue['fields']
+    fields['summary'] = strip_wiki_markup(fields['summary'])
+    fields['description'] = strip_wiki_markup(fields['description'])
+    if not fields['summary'] and not fields['description']:
+        return None
+    return issue
+
+
+def _clean_batch(issues: List[Dict]) -> List[Optional[Tuple[Dict, bytes, str]]]:
+    """
+    Worker entry point: clean a batch of projected issues.
+    Returns (issue, content digest, serialized JSON) per issue, or None when dropped.
+    """
+    cleaned = []
+    for issue in issues:
+        issue = clean_issue(issue)
+        if issue is None:
+            cleaned.append(None)
+            continue
+        fields = issue['fields']
+        digest = hashlib.blake2b(
+            f"{fields['project']['key']}\0{fields['summary']}\0{fields['description']}".encode('utf-8'), digest_size=16
+        ).digest()
+        serialized = textwrap.indent(json.dumps(issue, indent=2, ensure_ascii=False), '  ')
+        cleaned.append((issue, digest, serialized))
+    return cleaned
+
+
+class _ProjectWriter:
+    """Streams one project's issues into a JSON array"""
+
+    def __init__(self, project: str, issues_path: Path):
+        self.project = project
+        self.issues_path = issues_path
+        self.file = open(issues_path, 'w', encoding='utf-8')
+        self.file.write('[\n')
+        self.count = 0
+        self.bytes_written = 2
+
+    def write(self, text: str) -> None:
+        if self.count:
+            text = ',\n' + text
+        self.file.write(text)
+        self.bytes_written += len(text.encode('utf-8'))
+        self.count += 1
+
+    def close(self) -> None:
+        self.file.write('\n]')
+        self.bytes_written += 2
+        self.file.close()
+
+
+def _batched(items: Iterator[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def clean_export(
+    raw_path: str,
+    output_dir: str,
+    collection: Optional[str] = None,
+    workers: Optional[int] = None,
+    batch_size: int = 256,
+    max_in_flight: Optional[int] = None,
+) -> Dict:
+    """
+    Clean a raw Jira export into per-project issue and summary files.
+    Args:
+        raw_path: Raw export (JSON array or JSONL)
+        output_dir: Directory receiving the cleaned files
+        collection: Collection name used in file names (default: input file stem)
+        workers: Worker processes (default: CPU count)
+        batch_size: Issues per worker task
+        max_in_flight: Batches submitted but not yet written (bounds memory)
+    Returns:
+        Extraction statistics in the extraction_summary.json format
+    """
+    collection = collection or Path(raw_path).stem.split('.')[0]
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+
+    writers: Dict[str, _ProjectWriter] = {}
+    summaries = SummaryBuilder()
+    seen_keys = set()
+    seen_content = set()
+    raw_count = 0
+    raw_bytes = os.path.getsize(raw_path)
+    dropped = {"empty": 0, "duplicate_key": 0, "duplicate_content": 0}
+
+    def selected() -> Iterator[Dict]:
+        nonlocal raw_count
+        for raw in iter_raw_issues(raw_path):
+            raw_count += 1
+            issue = select_fields(raw)
+            if issue is None:
+                dropped["empty"] += 1
+            elif issue['key'] in seen_keys:
+                dropped["duplicate_key"] += 1
+            else:
+                seen_keys.add(issue['key'])
+                yield issue
+
+    def consume(results: List[Optional[Tuple[Dict, bytes, str]]]) -> None:
+        for result in results:
+            if result is None:
+                dropped["empty"] += 1
+                continue
+            issue, digest, text = result
+            if digest in seen_content:
+                dropped["duplicate_content"] += 1
+                continue
+            seen_content.add(digest)
+            project = issue['fields']['project']['key']
+            writer = writers.get(project)
+            if writer is None:
+                writer = _ProjectWriter(project, output / f"{project}_{collection}_issues.json")
+                writers[project] = writer
+            writer.write(text)
+            summaries.add_issue(issue)
+
+    try:
+        logger.info(f"[CLEAN] Cleaning {raw_path} with {workers} workers")
+        batches = _batched(selected(), batch_size)
+        if workers == 1:
+            for batch in batches:
+                consume(_clean_batch(batch))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for batch in batches:
+                    pending.append(pool.submit(_clean_batch, batch))
+                    if len(pending) >= max_in_flight:
+                        consume(pending.popleft().result())
+                while pending:
+                    consume(pending.popleft().result())
+    except Exception as e:
+        logger.error(f"[CLEAN] Error cleaning {raw_path}: {e}\n{traceback.format_exc()}")
+        raise
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    projects = {}
+    cleaned_bytes = 0
+    for project, writer in sorted(writers.items()):
+        summary_path = output / f"{project}_{collection}_SUMMARY.json"
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summaries.summary_document(project), f, indent=2, ensure_ascii=False)
+        cleaned_bytes += writer.bytes_written
+        projects[project] = {"document_count": writer.count, "size_mb": writer.bytes_written / (1024 * 1024)}
+
+    cleaned_count = sum(w.count for w in writers.values())
+    stats = {
+        "raw_count": raw_count,
+        "cleaned_count": cleaned_count,
+        "raw_size_mb": raw_bytes / (1024 * 1024),
+        "cleaned_size_mb": cleaned_bytes / (1024 * 1024),
+        "reduction_percent": (100.0 * (1 - cleaned_bytes / raw_bytes)) if raw_bytes else 0.0,
+        "dropped": dropped,
+        "projects": projects,
+    }
+    _update_extraction_summary(output / "extraction_summary.json", collection, stats)
+    logger.info(f"[CLEAN] Cleaned {raw_count} raw issues into {cleaned_count} documents across {len(projects)} projects")
+    return stats
+
+
+def _update_extraction_summary(path: Path, collection: str, stats: Dict) -> None:
+    summary = {}
+    if path.exists():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except ValueError:
+            logger.warning(f"[CLEAN] Ignoring unreadable {path}")
+    summary["timestamp"] = datetime.now().isoformat()
+    summary.setdefault("projects_processed", {})[collection] = stats
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
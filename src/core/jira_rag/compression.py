@@ -0,0 +1,112 @@
+"""
+Compressed dataset files and upload bodies.
+
+Dataset files can be stored compressed, e.g. ``PROJ_issues.json.gz`` or
+``PROJ_issues.jsonl.zst``. ``open_text`` streams them through the
+decompressor, so a file is never inflated on disk or held in memory twice,
+and ``base_name`` strips the compression suffix for the checks that look
+at the file name (``.json``/``.jsonl``, ``_SUMMARY``).
+
+zstd needs the optional ``zstandard`` package; gzip is in the standard
+library.
+"""
+from pathlib import Path
+from typing import List, Optional, TextIO, Union
+import glob
+import gzip
+import io
+import os
+
+GZIP = "gzip"
+ZSTD = "zstd"
+COMPRESSIONS = (GZIP, ZSTD)
+
+COMPRESSION_SUFFIXES = {".gz": GZIP, ".gzip": GZIP, ".zst": ZSTD, ".zstd": ZSTD}
+_MAGIC = {b"\x1f\x8b": GZIP, b"\x28\xb5\x2f\xfd": ZSTD}
+
+# File patterns of issue dataset files, plain and compressed
+DATASET_PATTERNS = ("*.json", "*.json.gz", "*.json.zst", "*.jsonl", "*.jsonl.gz", "*.jsonl.zst")
+# Bookkeeping files kept next to the dataset, matching the patterns but holding no issues
+BOOKKEEPING_FILES = frozenset({"extraction_summary.json", "summary_state.json", "shard_map.json", "watch_state.json"})
+
+PathLike = Union[str, Path]
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstd files and bodies need the zstandard package: pip install zstandard")
+    return zstandard
+
+
+def compression_of(path: PathLike) -> Optional[str]:
+    """
+    Compression of a file, from its suffix or, for an unknown suffix, its magic bytes
+    Returns:
+        "gzip", "zstd" or None for a plain file
+    """
+    kind = COMPRESSION_SUFFIXES.get(Path(path).suffix.lower())
+    if kind or not os.path.isfile(path):
+        return kind
+    with open(path, "rb") as f:
+        head = f.read(4)
+    for magic, kind in _MAGIC.items():
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def base_name(path: PathLike) -> str:
+    """File name without a compression suffix: PROJ_issues.json.gz -> PROJ_issues.json"""
+    name = Path(path).name
+    suffix = Path(name).suffix
+    return name[:-len(suffix)] if suffix.lower() in COMPRESSION_SUFFIXES else name
+
+
+def base_path(path: PathLike) -> Path:
+    """Path without a compression suffix"""
+    return Path(path).with_name(base_name(path))
+
+
+def is_json_lines(path: PathLike) -> bool:
+    """Whether the file holds one JSON document per line (.jsonl, compressed or not)"""
+    return base_name(path).lower().endswith(".jsonl")
+
+
+def open_text(path: PathLike, encoding: str = "utf-8") -> TextIO:
+    """Open a plain, gzip or zstd file for reading text, decompressing while reading"""
+    kind = compression_of(path)
+    if kind == GZIP:
+        return gzip.open(path, "rt", encoding=encoding)
+    if kind == ZSTD:
+        reader = _zstandard().ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(reader, encoding=encoding)
+    return open(path, "r", encoding=encoding)
+
+
+def compress(data: bytes, kind: str) -> bytes:
+    """Compress a request body with gzip or zstd"""
+    if kind == GZIP:
+        return gzip.compress(data, compresslevel=6)
+    if kind == ZSTD:
+        return _zstandard().ZstdCompressor().compress(data)
+    raise ValueError(f"Unknown compression '{kind}'. Expected one of: {', '.join(COMPRESSIONS)}")
+
+
+def decompress(data: bytes, kind: str) -> bytes:
+    """Inverse of compress, for servers and stubs reading a Content-Encoding body"""
+    if kind == GZIP:
+        return gzip.decompress(data)
+    if kind == ZSTD:
+        return _zstandard().ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unknown compression '{kind}'. Expected one of: {', '.join(COMPRESSIONS)}")
+
+
+def glob_dataset_files(directory: PathLike, patterns=DATASET_PATTERNS) -> List[str]:
+    """Sorted dataset files of a directory matching any of the patterns, without the bookkeeping files"""
+    found = set()
+    for pattern in patterns:
+        found.update(path for path in glob.glob(os.path.join(str(directory), pattern))
+                     if base_name(path) not in BOOKKEEPING_FILES)
+    return sorted(found)
@@ -1,8 +1,18 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterator, Iterable
 import requests
 import os
 from dotenv import load_dotenv
 from .jira_client import JiraIssue
+from .retrieval_cache import retrieval_cache
+from .issue_store import IssueStore, is_store_path
+from .compression import COMPRESSIONS, open_text, base_name, is_json_lines, compress
+from .cleaning import iter_raw_issues
+from .chunker import IssueChunker, baseline_tokens
+from .rate_limit import RateLimiter
+from .metrics import timed_upstream, INGEST_IN_PROGRESS, DOCUMENTS_INGESTED, TOKENS_INGESTED
+from .tracing import span, propagate, activate
+from .resilience import CircuitOpenError, HEDGED_REQUESTS, breaker, latency_window, hedged
+from concurrent.futures import ThreadPoolExecutor
 import uuid 
 import json
 from pathlib import Path
@@ -12,27 +22,100 @@ from datetime import datetime
 import tiktoken
 import re
 import random
+import time
 
 logger = logging.getLogger(__name__)
 
+CHUNK_SEPARATOR = "###CHUNK###"
+SUMMARY_MODES = ("per_field", "single")
+CHUNKING_MODES = ("local", "dify")
+CHUNK_MAX_TOKENS = 500
+CHUNK_OVERLAP_TOKENS = 50
+# Read timeouts in seconds; document writes wait for Dify to embed the text
+DIFY_TIMEOUTS = {"create_document": 120.0, "update_document": 120.0}
+# Idempotent reads that may be hedged
+HEDGED_OPERATIONS = ("retrieve", "list_documents")
+# Smaller bodies are sent as-is: compressing them saves less than it costs
+REQUEST_COMPRESSION_MIN_BYTES = 32 * 1024
+# Issue documents are named "Jira Issue <KEY>"
+ISSUE_DOCUMENT_NAME_RE = re.compile(r'^Jira Issue ([A-Z][A-Z0-9_]+-\d+)$')
+
+_encodings: Dict[str, object] = {}
+
+def _get_encoding(model: str):
+    """Load a tiktoken encoding once per process; None if it cannot be loaded"""
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except Exception as e:
+            logger.error(f"[DIFY] Error loading tokenizer for {model}, falling back to estimates: {str(e)}")
+            _encodings[model] = None
+    return _encodings[model]
+
+def _estimate_tokens(text: str) -> int:
+    """Length-based token estimate for metrics, without tokenizing the text again"""
+    return len(text) // 4
+
 class DifyConfigurationError(Exception):
     pass
 
+def collect_responses(outcomes: Iterator[Dict]) -> List[Dict]:
+    """Raw Dify responses of ingest outcomes produced with raw=True, in order"""
+    responses = []
+    for outcome in outcomes:
+        responses.extend(outcome.get("responses", ()))
+    return responses
+
+_issue_jobs = INGEST_IN_PROGRESS.labels("issues")
+_summary_jobs = INGEST_IN_PROGRESS.labels("summary")
+_issue_documents = DOCUMENTS_INGESTED.labels("issue")
+_issue_tokens = TOKENS_INGESTED.labels("issue")
+_summary_documents = DOCUMENTS_INGESTED.labels("summary")
+_summary_tokens = TOKENS_INGESTED.labels("summary")
+
 class DifyIntegration:
-    def __init__(self, api_key: str = None, base_url: str = None, dataset_id: str = None, advanced_ingestion: bool = False):
+    def __init__(self, api_key: str = None, base_url: str = None, dataset_id: str = None, advanced_ingestion: bool = False, chunking: str = None):
         load_dotenv()
         
         self.dataset_api_key = api_key or os.getenv('DIFY_DATASET_API_KEY')
         self.base_url = base_url or os.getenv('DIFY_BASE_URL', 'http://localhost/v1')
         self.dataset_id = dataset_id or os.getenv('DIFY_DATASET_ID')
         self.advanced_ingestion = advanced_ingestion
+        # "local": structure-aware chunks with explicit separators; "dify": fixed-size split by Dify
+        self.chunking = chunking or os.getenv('DIFY_CHUNKING', 'local')
+        self.chunking_stats = {"documents": 0, "tokens": 0, "tokens_embedded": 0, "baseline_tokens_embedded": 0}
+        # Content-Encoding for create/update-by-text bodies of at least request_compression_min_bytes; off by default
+        self.request_compression = os.getenv('DIFY_REQUEST_COMPRESSION', '').lower() or None
+        self.request_compression_min_bytes = int(os.getenv('DIFY_REQUEST_COMPRESSION_MIN_BYTES', str(REQUEST_COMPRESSION_MIN_BYTES)))
+        # (connect, read) timeout per operation; DIFY_TIMEOUT_<OPERATION> overrides DIFY_TIMEOUT for one operation
+        self.connect_timeout = float(os.getenv('DIFY_CONNECT_TIMEOUT', '5'))
+        self.timeout = float(os.getenv('DIFY_TIMEOUT', '30'))
+        self.timeouts = dict(DIFY_TIMEOUTS)
+        for name, value in os.environ.items():
+            if name.startswith('DIFY_TIMEOUT_'):
+                self.timeouts[name[len('DIFY_TIMEOUT_'):].lower()] = float(value)
+        # Shared by every client of this Dify server in the process
+        self.breaker = breaker(f"dify {self.base_url}", failures=int(os.getenv('DIFY_BREAKER_FAILURES', '5')),
+                               reset_timeout=float(os.getenv('DIFY_BREAKER_RESET', '30')))
+        # Hedge reads slower than this percentile of recent ones (0 disables hedging)
+        self.hedge_percentile = float(os.getenv('DIFY_HEDGE_PERCENTILE', '0'))
         
+        if self.chunking not in CHUNKING_MODES:
+            raise ValueError(f"Unknown chunking mode '{self.chunking}'. Expected one of: {', '.join(CHUNKING_MODES)}")
+        if self.request_compression and self.request_compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown request compression '{self.request_compression}'. Expected one of: {', '.join(COMPRESSIONS)}")
         if not self.dataset_api_key:
             raise ValueError("Missing Dify API key. Please provide it or set DIFY_DATASET_API_KEY environment variable.")
         self.headers = {
             'Authorization': f'Bearer {self.dataset_api_key}',
             'Content-Type': 'application/json'
         }
+        # Keep-alive connections, reused across calls and threads of this client
+        self.session = requests.Session()
+        pool_size = int(os.getenv('DIFY_POOL_SIZE', '16'))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         try:
             if not self.dataset_id or self.dataset_id == "your-dataset-id":
                 self.dataset_id = self.create_dataset(name=None, advanced_ingestion=self.advanced_ingestion)
@@ -44,12 +127,10 @@ class DifyIntegration:
             raise
     
     def _get_token_count(self, text: str, model: str = "text-embedding-ada-002") -> int:
-        try:
-            enc = tiktoken.encoding_for_model(model)
-            return len(enc.encode(text))
-        except Exception as e:
-            logger.error(f"[DIFY] Error counting tokens: {str(e)}")
+        enc = _get_encoding(model)
+        if enc is None:
             return len(text) // 4  # fallback estimate
+        return len(enc.encode(text))
 
     def _get_chunk_params(self, text: str, default_max=2000, overlap_ratio=0.25):
         token_count = self._get_token_count(text)
@@ -64,15 +145,19 @@ class DifyIntegration:
 
     def _format_issue_for_text(self, issue: Dict, advanced_ingestion: bool = False) -> Dict:
         """Format a Jira issue into a document suitable for Dify ingestion by text"""
-        logger.debug(f"[DIFY] Raw issue data: {json.dumps(issue, indent=2)}")
+        # JiraIssue objects and IssueRow records are formatted from their flat dict form
+        if hasattr(issue, 'dict'):
+            issue = issue.dict()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[DIFY] Raw issue data: {json.dumps(issue, indent=2)}")
         
         try:
             # Extract values using the helper method
             key = self._get_nested_value(issue, ['key', 'fields.key'], 'Unknown')
-            project = self._get_nested_value(issue, ['project.key', 'fields.project.key'], 'Unknown Project')
-            issue_type = self._get_nested_value(issue, ['issuetype.name', 'fields.issuetype.name'], 'Unknown Type')
-            status = self._get_nested_value(issue, ['status.name', 'fields.status.name'], 'Unknown Status')
-            assignee = self._get_nested_value(issue, ['assignee.name', 'fields.assignee.name'], 'Unassigned')
+            project = self._get_nested_value(issue, ['project.key', 'fields.project.key', 'project'], 'Unknown Project')
+            issue_type = self._get_nested_value(issue, ['issuetype.name', 'fields.issuetype.name', 'issue_type'], 'Unknown Type')
+            status = self._get_nested_value(issue, ['status.name', 'fields.status.name', 'status'], 'Unknown Status')
+            assignee = self._get_nested_value(issue, ['assignee.name', 'fields.assignee.name', 'assignee'], 'Unassigned')
             created = self._get_nested_value(issue, ['created', 'fields.created'], 'Unknown')
             updated = self._get_nested_value(issue, ['updated', 'fields.updated'], 'Unknown')
             summary = self._get_nested_value(issue, ['summary', 'fields.summary'], 'No summary provided')
@@ -140,10 +225,17 @@ class DifyIntegration:
                 example_queries_line = "Example queries:\n- " + "\n- ".join(example_queries) + "\n"
                 text_parts.append(aliases_line)
                 text_parts.append(example_queries_line)
-            text_parts.append(f"Summary: {summary}\n\nJira Issue: {key}\nProject: {project}\nType: {issue_type}\nStatus: {status}\nAssignee: {assignee}\nCreated: {created}\nUpdated: {updated}\n\nDescription:\n{description}\n")
+            header = f"Summary: {summary}\n\nJira Issue: {key}\nProject: {project}\nType: {issue_type}\nStatus: {status}\nAssignee: {assignee}\nCreated: {created}\nUpdated: {updated}\n\nDescription:\n"
+            text_parts.append(f"{header}{description}\n")
             text = "".join(text_parts)
-            # Set your desired chunking config
-            max_tokens, chunk_overlap = 2000, 400
+            separator = CHUNK_SEPARATOR
+            if self.chunking == "local":
+                with span("dify.chunk"):
+                    text, max_tokens = self._chunk_issue_text(key, summary, "".join(text_parts[:-1]) + header, description, text)
+                chunk_overlap = 0
+            else:
+                # Set your desired chunking config
+                max_tokens, chunk_overlap = 2000, 400
             process_rule = {
                 "mode": "custom",
                 "rules": {
@@ -152,7 +244,7 @@ class DifyIntegration:
                         {"id": "remove_urls_emails", "enabled": False}
                     ],
                     "segmentation": {
-                        "separator": "###CHUNK###",
+                        "separator": separator,
                         "max_tokens": max_tokens,
                         "chunk_overlap": chunk_overlap
                     }
@@ -171,16 +263,102 @@ class DifyIntegration:
             logger.error(f"[DIFY] Error formatting issue: {str(e)}\n{traceback.format_exc()}")
             raise
     
+    def _chunk_issue_text(self, key: str, summary: str, header: str, description: str, full_text: str) -> tuple:
+        """
+        Chunk an issue locally and join the chunks with CHUNK_SEPARATOR
+        Returns:
+            (text to send, max_tokens for the segmentation rule)
+        """
+        enc = _get_encoding("text-embedding-ada-002")
+        chunker = IssueChunker(
+            self._get_token_count,
+            max_tokens=CHUNK_MAX_TOKENS,
+            overlap_tokens=CHUNK_OVERLAP_TOKENS,
+            encode=enc.encode if enc else None,
+            decode=enc.decode if enc else None,
+        )
+        chunks = chunker.chunk(header, description, context=f"Jira Issue: {key} - {summary}")
+        chunk_tokens = [self._get_token_count(chunk) for chunk in chunks]
+        total = self._get_token_count(full_text)
+        baseline = baseline_tokens(total)
+        embedded = sum(chunk_tokens)
+        self.chunking_stats["documents"] += 1
+        self.chunking_stats["tokens"] += total
+        self.chunking_stats["tokens_embedded"] += embedded
+        self.chunking_stats["baseline_tokens_embedded"] += baseline
+        logger.info(f"[DIFY] Document '{key}': {len(chunks)} local chunks, {embedded} tokens embedded "
+                    f"vs {baseline} with the fixed 2000/400 rule ({baseline - embedded} saved)")
+        # Headroom for tokenizer differences so Dify never re-splits a chunk
+        max_tokens = max(CHUNK_MAX_TOKENS, int(max(chunk_tokens, default=0) * 1.1) + 1)
+        return f"\n{CHUNK_SEPARATOR}\n".join(chunks), max_tokens
+
+    def _request(self, operation: str, method: str, url: str, headers: Optional[Dict] = None, **kwargs) -> requests.Response:
+        """
+        Send one dataset API request, counted and timed as operation in the upstream metrics.
+        Every request has a timeout and goes through the server's circuit breaker (CircuitOpenError
+        while it is open); reads in HEDGED_OPERATIONS are hedged when DIFY_HEDGE_PERCENTILE is set.
+        """
+        kwargs.setdefault("timeout", (self.connect_timeout, self.timeouts.get(operation, self.timeout)))
+        window = latency_window(f"dify {self.base_url} {operation}")
+
+        def send() -> requests.Response:
+            self.breaker.allow()
+            started = time.perf_counter()
+            try:
+                with timed_upstream("dify", operation) as call:
+                    response = self.session.request(method, url, headers=headers or self.headers, **kwargs)
+                    call.status = response.status_code
+            except Exception:
+                self.breaker.record(False)
+                raise
+            self.breaker.record(response.status_code < 500 and response.status_code != 429)
+            window.add(time.perf_counter() - started)
+            return response
+
+        delay = window.percentile(self.hedge_percentile) if self.hedge_percentile and operation in HEDGED_OPERATIONS else None
+        if delay is None:
+            return send()
+        response, winner = hedged(send, delay)
+        if winner:
+            logger.info(f"[DIFY] {operation} hedged after {delay:.3f}s, {winner} request answered first")
+            HEDGED_REQUESTS.labels("dify", operation, winner).inc()
+        return response
+
+    def _send_document(self, operation: str, url: str, body: Dict) -> requests.Response:
+        """
+        POST a create/update-by-text body, compressed with request_compression when it is large enough.
+        A server that rejects the encoding (400/415) gets the body again uncompressed, and compression
+        is turned off for this client if that works.
+        """
+        encoding = self.request_compression
+        if not encoding:
+            return self._request(operation, "POST", url, json=body)
+        data = json.dumps(body).encode("utf-8")
+        if len(data) < self.request_compression_min_bytes:
+            return self._request(operation, "POST", url, data=data)
+        with span("dify.compress", encoding=encoding, bytes=len(data)):
+            compressed = compress(data, encoding)
+        response = self._request(operation, "POST", url, data=compressed,
+                                 headers={**self.headers, 'Content-Encoding': encoding})
+        if response.status_code not in (400, 415):
+            return response
+        logger.warning(f"[DIFY] Server rejected a {encoding} request body ({response.status_code}), retrying uncompressed")
+        response = self._request(operation, "POST", url, data=data)
+        if response.ok:
+            logger.warning(f"[DIFY] Server does not accept {encoding} request bodies, disabling request compression")
+            self.request_compression = None
+        return response
+
     def _format_issue_metadata(self, issue: Dict, document_id: str, metadata_id:str):
-        # Handle both JiraIssue objects and dictionary issues
-        issue_key = issue.key if isinstance(issue, JiraIssue) else issue['key']
+        # Handle JiraIssue objects, IssueRow records and dictionary issues
+        issue_key = issue.key if hasattr(issue, 'key') else issue['key']
         return {"operation_data": [{"document_id": document_id, "metadata_list":[{"id": metadata_id, "value": issue_key, "name": "issue_key"}]}]}
     
     def _enable_builtin_metadata(self):
         url = f"{self.base_url}/datasets/{self.dataset_id}/metadata/built-in/enable"
         try:
             logger.info(f"[DIFY] Enabling built-in metadata: POST {url}")
-            response = requests.post(url, headers=self.headers)
+            response = self._request("enable_builtin_metadata", "POST", url)
             logger.info(f"[DIFY] Response {response.status_code}: {response.text}")
             response.raise_for_status()
             return response
@@ -194,7 +372,7 @@ class DifyIntegration:
         metadata= {"type": "string", "name": "issue_key"}
         try:
             logger.info(f"[DIFY] Creating knowledge metadata: POST {url} {metadata}")
-            response = requests.post(url, headers=self.headers, json=metadata)
+            response = self._request("create_metadata", "POST", url, json=metadata)
             logger.info(f"[DIFY] Response {response.status_code}: {response.text}")
             response.raise_for_status()
             return response
@@ -211,67 +389,140 @@ class DifyIntegration:
         Returns:
             List of responses from Dify API
         """
+        return collect_responses(self.iter_ingest_issues(issues, advanced_ingestion=advanced_ingestion, raw=True))
+
+    def iter_ingest_issues(self, issues: Iterable[Dict], advanced_ingestion: bool = False, raw: bool = False) -> Iterator[Dict]:
+        """
+        Ingest Jira issues one at a time, yielding the outcome of each as soon as it is done
+        Args:
+            issues: List (or stream, e.g. of a JSON Lines file) of JiraIssue objects or dictionaries to ingest
+            advanced_ingestion: Whether to use advanced ingestion (aliases and queries)
+            raw: Include the Dify responses (document and metadata) in each outcome
+        Yields:
+            {"type": "issue", "index", "issue_key", "status": "created" | "failed", "document_id", "error"}
+        """
+        _issue_jobs.inc()
+        try:
+            with span("dify.ingest_issues") as job:
+                total = len(issues) if hasattr(issues, "__len__") else "?"
+                logger.info(f"[DIFY] Starting ingestion of {total} issues")
+                self._enable_builtin_metadata()
+                metadata_id = self._create_knowledge_metadata().json()["id"]
+                logger.info(f"[DIFY] Created metadata with ID: {metadata_id}")
+
+                created = 0
+                for idx, issue in enumerate(issues, 1):
+                    # Each step of a streamed response may run in a different context
+                    with activate(job):
+                        outcome = self._ingest_issue(idx, total, issue, metadata_id, advanced_ingestion, raw)
+                    created += outcome["status"] == "created"
+                    yield outcome
+
+                logger.info(f"[DIFY] Completed ingestion. Successfully processed {created} issues")
+                job.set("issues", created)
+                if self.chunking == "local" and self.chunking_stats["documents"]:
+                    stats = self.chunking_stats
+                    logger.info(f"[DIFY] Local chunking embedded {stats['tokens_embedded']} tokens for {stats['documents']} documents, "
+                                f"{stats['baseline_tokens_embedded'] - stats['tokens_embedded']} fewer than the fixed 2000/400 rule")
+        except Exception as e:
+            error_msg = f"[DIFY] Error in ingest_issues: {str(e)}"
+            logger.error(f"{error_msg}\n{traceback.format_exc()}")
+            raise
+        finally:
+            _issue_jobs.dec()
+
+    def _ingest_issue(self, idx: int, total, issue, metadata_id: str, advanced_ingestion: bool, raw: bool) -> Dict:
+        """Create the document of one issue and attach its issue_key metadata"""
+        outcome = {"type": "issue", "index": idx, "issue_key": None, "status": "failed", "document_id": None, "error": None}
         responses = []
         try:
-            logger.info(f"[DIFY] Starting ingestion of {len(issues)} issues")
-            self._enable_builtin_metadata()
-            metadata_id = self._create_knowledge_metadata().json()["id"]
-            logger.info(f"[DIFY] Created metadata with ID: {metadata_id}")
-            
-            for idx, issue in enumerate(issues, 1):
-                try:
-                    logger.info(f"[DIFY] Processing issue {idx}/{len(issues)}: {issue.key if hasattr(issue, 'key') else issue.get('key', 'unknown')}")
-                    url = f"{self.base_url}/datasets/{self.dataset_id}/document/create-by-text"
+            issue_key = outcome["issue_key"] = issue.key if hasattr(issue, 'key') else issue.get('key', 'unknown')
+            with span("dify.ingest_issue", issue_key=issue_key):
+                logger.info(f"[DIFY] Processing issue {idx}/{total}: {issue_key}")
+                url = f"{self.base_url}/datasets/{self.dataset_id}/document/create-by-text"
+                embedded = self.chunking_stats["tokens_embedded"]
+                with span("dify.format_issue"):
                     data = self._format_issue_for_text(issue, advanced_ingestion=advanced_ingestion)
+                if logger.isEnabledFor(logging.DEBUG):
                     logger.debug(f"[DIFY] Formatted issue data: {json.dumps(data, indent=2)}")
-                    
-                    logger.info(f"[DIFY] Creating document: POST {url}")
-                    response = requests.post(url, headers=self.headers, json=data)
-                    logger.debug(f"[DIFY] Create document response: {response.text}")
-                    response.raise_for_status()
-                    responses.append(response.json())
-                    
-                    document_id = response.json()["document"]["id"]
-                    logger.info(f"[DIFY] Document created with ID: {document_id}")
-                    
-                    metadata = self._format_issue_metadata(issue=issue, document_id=document_id, metadata_id=metadata_id)
-                    url_metadata = f"{self.base_url}/datasets/{self.dataset_id}/documents/metadata"
-                    logger.info(f"[DIFY] Attaching metadata: POST {url_metadata}")
-                    response = requests.post(url_metadata, headers=self.headers, json=metadata)
-                    logger.debug(f"[DIFY] Metadata response: {response.text}")
-                    response.raise_for_status()
-                    responses.append(response.json())
-                    
-                except Exception as e:
-                    error_msg = f"[DIFY] Error processing issue {idx}: {str(e)}"
-                    logger.error(f"{error_msg}\n{traceback.format_exc()}")
-                    continue
-                    
-            logger.info(f"[DIFY] Completed ingestion. Successfully processed {len(responses)//2} issues")
-            return responses
+
+                logger.info(f"[DIFY] Creating document: POST {url}")
+                response = self._send_document("create_document", url, data)
+                logger.debug(f"[DIFY] Create document response: {response.text}")
+                response.raise_for_status()
+                retrieval_cache.bump_generation(self.dataset_id)
+                _issue_documents.inc()
+                # Local chunking already counted the tokens; Dify-side chunking sends the whole text
+                if self.chunking == "local":
+                    _issue_tokens.inc(self.chunking_stats["tokens_embedded"] - embedded)
+                else:
+                    _issue_tokens.inc(_estimate_tokens(data["text"]))
+                document = response.json()
+                responses.append(document)
+
+                document_id = outcome["document_id"] = document["document"]["id"]
+                logger.info(f"[DIFY] Document created with ID: {document_id}")
+
+                metadata = self._format_issue_metadata(issue=issue, document_id=document_id, metadata_id=metadata_id)
+                url_metadata = f"{self.base_url}/datasets/{self.dataset_id}/documents/metadata"
+                logger.info(f"[DIFY] Attaching metadata: POST {url_metadata}")
+                response = self._request("attach_metadata", "POST", url_metadata, json=metadata)
+                logger.debug(f"[DIFY] Metadata response: {response.text}")
+                response.raise_for_status()
+                responses.append(response.json())
+                outcome["status"] = "created"
+
+        except CircuitOpenError:
+            # Failing every remaining issue in a few milliseconds would lose them; stop the run instead
+            logger.warning(f"[DIFY] Circuit open at issue {idx}/{total}, stopping ingestion")
+            raise
         except Exception as e:
-            error_msg = f"[DIFY] Error in ingest_issues: {str(e)}"
+            error_msg = f"[DIFY] Error processing issue {idx}: {str(e)}"
             logger.error(f"{error_msg}\n{traceback.format_exc()}")
-            raise
+            outcome["error"] = str(e)
+        if raw:
+            outcome["responses"] = responses
+        return outcome
 
-    def ingest_json_file(self, json_file_path: str, advanced_ingestion: bool = False) -> List[Dict]:
+    def ingest_json_file(self, json_file_path: str, advanced_ingestion: bool = False, summary_mode: str = "per_field") -> List[Dict]:
         """
         Ingest issues from a JSON file into Dify Knowledge Base
         Args:
             json_file_path: Path to the JSON file containing Jira issues
             advanced_ingestion: Whether to use advanced ingestion (aliases and queries)
+            summary_mode: How summary files are ingested: "per_field" (one document per field)
+                          or "single" (one sectioned document per project)
         Returns:
             List of responses from Dify API
         """
+        return collect_responses(self.iter_ingest_json_file(json_file_path, advanced_ingestion=advanced_ingestion,
+                                                            summary_mode=summary_mode, raw=True))
+
+    def iter_ingest_json_file(self, json_file_path: str, advanced_ingestion: bool = False, summary_mode: str = "per_field",
+                              raw: bool = False) -> Iterator[Dict]:
+        """
+        Ingest a JSON, JSON Lines or .jstore file, yielding one outcome per issue (see iter_ingest_issues)
+        or per summary document ({"type": "summary_document", "field", "status", "document_id"}).
+        JSON and JSON Lines files may be gzip/zstd compressed (.json.gz, .jsonl.zst, ...).
+        """
+        if is_store_path(json_file_path):
+            yield from self.iter_ingest_store_file(json_file_path, advanced_ingestion=advanced_ingestion,
+                                                   summary_mode=summary_mode, raw=raw)
+            return
         try:
+            if is_json_lines(json_file_path):
+                # One issue per line: stream the issues instead of loading the file
+                logger.info(f"[DIFY] Streaming JSON Lines file: {json_file_path}")
+                yield from self.iter_ingest_issues(iter_raw_issues(json_file_path), advanced_ingestion=advanced_ingestion, raw=raw)
+                return
             logger.info(f"[DIFY] Reading JSON file: {json_file_path}")
-            with open(json_file_path, 'r') as f:
+            with span("dify.read_file", path=json_file_path), open_text(json_file_path) as f:
                 content = f.read()
                 logger.debug(f"[DIFY] Raw JSON content: {content[:500]}...")  # Log first 500 chars
                 data = json.loads(content)
             
             # Check if this is a summary file
-            if json_file_path.endswith('_SUMMARY.json'):
+            if base_name(json_file_path).endswith('_SUMMARY.json'):
                 logger.info("[DIFY] Detected summary file, processing as a single document")
                 # If it's a list, use the first item as the summary dict
                 if isinstance(data, list):
@@ -280,19 +531,20 @@ class DifyIntegration:
                     summary_data = data[0]
                 else:
                     summary_data = data
-                return self._ingest_summary_file(summary_data, json_file_path)
+                yield from self._iter_summary_file(summary_data, json_file_path, mode=summary_mode, raw=raw)
+                return
             
             # Handle different data structures
             if isinstance(data, list):
                 logger.info(f"[DIFY] Processing list of {len(data)} items")
-                return self.ingest_issues(data, advanced_ingestion=advanced_ingestion)
+                yield from self.iter_ingest_issues(data, advanced_ingestion=advanced_ingestion, raw=raw)
             elif isinstance(data, dict):
                 if 'issues' in data:
                     logger.info(f"[DIFY] Processing issues from 'issues' field")
-                    return self.ingest_issues(data['issues'], advanced_ingestion=advanced_ingestion)
+                    yield from self.iter_ingest_issues(data['issues'], advanced_ingestion=advanced_ingestion, raw=raw)
                 else:
                     logger.info("[DIFY] Processing single issue document")
-                    return self.ingest_issues([data], advanced_ingestion=advanced_ingestion)
+                    yield from self.iter_ingest_issues([data], advanced_ingestion=advanced_ingestion, raw=raw)
             else:
                 error_msg = f"Unexpected data type in JSON file: {type(data)}"
                 logger.error(f"[DIFY] {error_msg}")
@@ -307,108 +559,286 @@ class DifyIntegration:
             logger.error(f"{error_msg}\n{traceback.format_exc()}")
             raise
 
-    def _ingest_summary_file(self, data: Dict, file_path: str) -> List[Dict]:
+    def ingest_store_file(self, store_path: str, issue_keys: Optional[List[str]] = None, advanced_ingestion: bool = False, summary_mode: str = "per_field") -> List[Dict]:
         """
-        Process a summary file as multiple documents, one for each major field
+        Ingest issues from a compact issue store (.jstore) into Dify Knowledge Base.
+        Records are parsed one at a time as they are ingested.
+        Args:
+            store_path: Path to the store file
+            issue_keys: Optional subset of issue keys to ingest, looked up through the store index
+            advanced_ingestion: Whether to use advanced ingestion (aliases and queries)
+            summary_mode: How summary stores are ingested ("per_field" or "single")
+        Returns:
+            List of responses from Dify API
         """
+        return collect_responses(self.iter_ingest_store_file(store_path, issue_keys=issue_keys, advanced_ingestion=advanced_ingestion,
+                                                             summary_mode=summary_mode, raw=True))
+
+    def iter_ingest_store_file(self, store_path: str, issue_keys: Optional[List[str]] = None, advanced_ingestion: bool = False,
+                               summary_mode: str = "per_field", raw: bool = False) -> Iterator[Dict]:
+        """Ingest a compact issue store, yielding one outcome per issue or summary document"""
+        try:
+            logger.info(f"[DIFY] Reading issue store: {store_path}")
+            with IssueStore(store_path) as store:
+                if Path(store_path).stem.endswith('_SUMMARY'):
+                    logger.info("[DIFY] Detected summary store, processing as a single document")
+                    if len(store) == 0:
+                        raise ValueError("Summary store is empty!")
+                    yield from self._iter_summary_file(store[0], store_path, mode=summary_mode, raw=raw)
+                    return
+                if issue_keys:
+                    issues = []
+                    for key in issue_keys:
+                        issue = store.get(key)
+                        if issue is None:
+                            logger.warning(f"[DIFY] Issue {key} not found in {store_path}")
+                        else:
+                            issues.append(issue)
+                    yield from self.iter_ingest_issues(issues, advanced_ingestion=advanced_ingestion, raw=raw)
+                    return
+                yield from self.iter_ingest_issues(store, advanced_ingestion=advanced_ingestion, raw=raw)
+        except Exception as e:
+            error_msg = f"[DIFY] Error ingesting issue store {store_path}: {str(e)}"
+            logger.error(f"{error_msg}\n{traceback.format_exc()}")
+            raise
+
+    def _ingest_summary_file(self, data: Dict, file_path: str, mode: str = "per_field") -> List[Dict]:
+        """
+        Process a summary file as multiple documents, one for each major field,
+        or as a single document with one section per field when mode is "single"
+        """
+        return collect_responses(self._iter_summary_file(data, file_path, mode=mode, raw=True))
+
+    def _iter_summary_file(self, data: Dict, file_path: str, mode: str = "per_field", raw: bool = False) -> Iterator[Dict]:
+        """Create the documents of a summary file, yielding the outcome of each"""
+        if mode not in SUMMARY_MODES:
+            raise ValueError(f"Unknown summary mode '{mode}'. Expected one of: {', '.join(SUMMARY_MODES)}")
+        _summary_jobs.inc()
         try:
-            logger.info("[DIFY] Formatting summary fields as separate documents")
             project_name = Path(file_path).stem.replace('_SUMMARY', '')
-            fields = data.get('fields', {})
-            responses = []
-            url = f"{self.base_url}/datasets/{self.dataset_id}/document/create-by-text"
-            
-            # Define the fields to ingest and their descriptions
-            field_map = [
-                ("summary", f"Summary of the project {project_name} is:", fields.get("summary")),
-                ("contributors", f"Contributors of the project {project_name} are:", ", ".join(fields.get("contributors", []))),
-                ("assignees", f"Assignees of the project {project_name} are:", ", ".join(fields.get("assignees", []))),
-                ("reporters", f"Reporters of the project {project_name} are:", ", ".join(fields.get("reporters", []))),
-                ("issue_count", f"Issue count of the project {project_name} is:", str(fields.get("issue_count")) if fields.get("issue_count") is not None else None),
-                ("type", f"Type of the project {project_name} is:", str(fields.get("type")) if fields.get("type") else None),
-            ]
-            
-            for field, label, value in field_map:
-                if value and value.strip():
-                    text = f"{label}\n{value}"
-                    max_tokens, chunk_overlap = self._get_chunk_params(text)
-                    process_rule = {
-                        "mode": "custom",
-                        "rules": {
-                            "pre_processing_rules": [
-                                {"id": "remove_extra_spaces", "enabled": True},
-                                {"id": "remove_urls_emails", "enabled": False}
-                            ],
-                            "segmentation": {
-                                "separator": "\n\n",
-                                "max_tokens": max_tokens,
-                                "chunk_overlap": chunk_overlap
-                            }
-                        }
-                    }
-                    doc = {
-                        "name": f"{label[:60]}",
-                        "text": text,
-                        "indexing_technique": "high_quality",
-                        "process_rule": process_rule
-                    }
-                    logger.info(f"[DIFY] Creating document for field '{field}': POST {url}")
-                    logger.info(f"[DIFY] Full request body: {json.dumps(doc)}")
-                    response = requests.post(url, headers=self.headers, json=doc)
-                    logger.debug(f"[DIFY] Create document response: {response.text}")
-                    response.raise_for_status()
-                    responses.append(response.json())
-            return responses
+            with span("dify.ingest_summary", project=project_name, mode=mode) as job:
+                url = f"{self.base_url}/datasets/{self.dataset_id}/document/create-by-text"
+                if mode == "single":
+                    logger.info("[DIFY] Formatting summary fields as a single sectioned document")
+                    documents = [("all", self._summary_single_document(data, project_name))]
+                else:
+                    logger.info("[DIFY] Formatting summary fields as separate documents")
+                    documents = self._summary_field_documents(data.get('fields', {}), project_name)
+                for field, doc in documents:
+                    with activate(job):
+                        logger.info(f"[DIFY] Creating document for field '{field}': POST {url}")
+                        logger.info(f"[DIFY] Full request body: {json.dumps(doc)}")
+                        response = self._send_document("create_document", url, doc)
+                        logger.debug(f"[DIFY] Create document response: {response.text}")
+                        response.raise_for_status()
+                        retrieval_cache.bump_generation(self.dataset_id)
+                        _summary_documents.inc()
+                        _summary_tokens.inc(_estimate_tokens(doc["text"]))
+                        document = response.json()
+                    outcome = {"type": "summary_document", "field": field, "status": "created",
+                               "document_id": (document.get("document") or {}).get("id")}
+                    if raw:
+                        outcome["responses"] = [document]
+                    yield outcome
         except Exception as e:
             error_msg = f"[DIFY] Error processing summary file: {str(e)}"
             logger.error(f"{error_msg}\n{traceback.format_exc()}")
             raise
+        finally:
+            _summary_jobs.dec()
+
+    def _summary_field_map(self, fields: Dict, project_name: str) -> List[tuple]:
+        """
+        Label and rendered value of each summary field that has content
+        Returns:
+            List of (field name, label, value) tuples
+        """
+        # Define the fields to ingest and their descriptions
+        field_map = [
+            ("summary", f"Summary of the project {project_name} is:", fields.get("summary")),
+            ("contributors", f"Contributors of the project {project_name} are:", ", ".join(fields.get("contributors", []))),
+            ("assignees", f"Assignees of the project {project_name} are:", ", ".join(fields.get("assignees", []))),
+            ("reporters", f"Reporters of the project {project_name} are:", ", ".join(fields.get("reporters", []))),
+            ("issue_count", f"Issue count of the project {project_name} is:", str(fields.get("issue_count")) if fields.get("issue_count") is not None else None),
+            ("type", f"Type of the project {project_name} is:", str(fields.get("type")) if fields.get("type") else None),
+        ]
+        return [(field, label, value) for field, label, value in field_map if value and value.strip()]
+
+    def _summary_field_documents(self, fields: Dict, project_name: str) -> List[tuple]:
+        """
+        Build one create-by-text body per non-empty summary field
+        Returns:
+            List of (field name, document body) tuples
+        """
+        documents = []
+        for field, label, value in self._summary_field_map(fields, project_name):
+            text = f"{label}\n{value}"
+            max_tokens, chunk_overlap = self._get_chunk_params(text)
+            process_rule = {
+                "mode": "custom",
+                "rules": {
+                    "pre_processing_rules": [
+                        {"id": "remove_extra_spaces", "enabled": True},
+                        {"id": "remove_urls_emails", "enabled": False}
+                    ],
+                    "segmentation": {
+                        "separator": "\n\n",
+                        "max_tokens": max_tokens,
+                        "chunk_overlap": chunk_overlap
+                    }
+                }
+            }
+            documents.append((field, {
+                "name": f"{label[:60]}",
+                "text": text,
+                "indexing_technique": "high_quality",
+                "process_rule": process_rule
+            }))
+        return documents
+
+    def update_document_by_text(self, document_id: str, doc: Dict) -> Dict:
+        """
+        Replace the text of an existing document in place
+        Args:
+            document_id: Dify document ID
+            doc: Body in the create-by-text format (name, text, process_rule)
+        Returns:
+            Response from Dify API
+        """
+        url = f"{self.base_url}/datasets/{self.dataset_id}/documents/{document_id}/update-by-text"
+        body = {key: doc[key] for key in ("name", "text", "process_rule") if key in doc}
+        try:
+            logger.info(f"[DIFY] Updating document {document_id}: POST {url}")
+            response = self._send_document("update_document", url, body)
+            logger.debug(f"[DIFY] Update document response: {response.text}")
+            response.raise_for_status()
+            retrieval_cache.bump_generation(self.dataset_id)
+            return response.json()
+        except Exception as e:
+            logger.error(f"[DIFY] Error updating document {document_id}: {e}\n{traceback.format_exc()}")
+            raise
+
+    def sync_summaries(self, builder, collection: str = None) -> List[Dict]:
+        """
+        Upload only the summary documents whose fields changed since the last sync.
+        Documents created by an earlier sync are updated in place.
+        Args:
+            builder: SummaryBuilder holding the per-project state
+            collection: Optional collection suffix used in document labels (e.g. "JiraEcosystem")
+        Returns:
+            List of responses from Dify API
+        """
+        responses = []
+        url = f"{self.base_url}/datasets/{self.dataset_id}/document/create-by-text"
+        for project, changed in builder.changed():
+            state = builder.projects[project]
+            project_name = f"{project}_{collection}" if collection else project
+            logger.info(f"[DIFY] Syncing summary of {project_name}, changed fields: {changed}")
+            documents = dict(self._summary_field_documents(state.fields(), project_name))
+            for field in changed:
+                doc = documents.get(field)
+                if doc is None:
+                    state.mark_uploaded(field)
+                    continue
+                try:
+                    if field in state.documents:
+                        result = self.update_document_by_text(state.documents[field], doc)
+                    else:
+                        logger.info(f"[DIFY] Creating document for field '{field}': POST {url}")
+                        response = self._send_document("create_document", url, doc)
+                        response.raise_for_status()
+                        retrieval_cache.bump_generation(self.dataset_id)
+                        _summary_documents.inc()
+                        _summary_tokens.inc(_estimate_tokens(doc["text"]))
+                        result = response.json()
+                    state.mark_uploaded(field, result.get("document", {}).get("id"))
+                    responses.append(result)
+                except Exception as e:
+                    logger.error(f"[DIFY] Error syncing summary field '{field}' of {project_name}: {e}\n{traceback.format_exc()}")
+                    continue
+        logger.info(f"[DIFY] Summary sync uploaded {len(responses)} documents")
+        return responses
 
-    def _format_summary_text(self, data: Dict, project_name: str) -> str:
+    def _format_summary_text(self, data: Dict, project_name: str, max_tokens: int = 500) -> str:
         """
-        Format summary data into a readable text document
+        Format summary data into one text whose sections are separated by CHUNK_SEPARATOR.
+        Small fields share a section and long fields are split, so that every section
+        stays within max_tokens.
         """
         try:
-            summary_parts = [
-                f"Project Summary: {project_name}\n",
-                f"Generated: {datetime.now().isoformat()}\n\n"
-            ]
-            
-            # Extract fields from the summary structure
-            fields = data.get('fields', {})
-            
-            # Add main summary text
-            summary_text = fields.get('summary')
-            if summary_text:
-                summary_parts.append("Summary:\n")
-                summary_parts.append(summary_text + "\n\n")
-        
-            # Add contributors
-            contributors = fields.get('contributors')
-            if contributors:
-                summary_parts.append("Contributors: " + ", ".join(contributors) + "\n")
-            # Add assignees
-            assignees = fields.get('assignees')
-            if assignees:
-                summary_parts.append("Assignees: " + ", ".join(assignees) + "\n")
-            # Add reporters
-            reporters = fields.get('reporters')
-            if reporters:
-                summary_parts.append("Reporters: " + ", ".join(reporters) + "\n")
-            # Add issue count
-            issue_count = fields.get('issue_count')
-            if issue_count is not None:
-                summary_parts.append(f"Issue count: {issue_count}\n")
-            # Add type if present
-            type_ = fields.get('type')
-            if type_:
-                summary_parts.append(f"Type: {type_}\n")
-            
-            return "".join(summary_parts)
-            
+            sections = []
+            current, current_tokens = [], 0
+            for _, label, value in self._summary_field_map(data.get('fields', {}), project_name):
+                for piece in self._split_section(label, value, max_tokens):
+                    tokens = self._get_token_count(piece)
+                    if current and current_tokens + tokens > max_tokens:
+                        sections.append("\n\n".join(current))
+                        current, current_tokens = [], 0
+                    current.append(piece)
+                    current_tokens += tokens
+            if current:
+                sections.append("\n\n".join(current))
+            return f"\n{CHUNK_SEPARATOR}\n".join(sections)
         except Exception as e:
             logger.error(f"[DIFY] Error formatting summary text: {str(e)}\n{traceback.format_exc()}")
-            return f"Error formatting summary: {str(e)}"
+            raise
+
+    def _split_section(self, label: str, value: str, max_tokens: int) -> List[str]:
+        """
+        Render "label\nvalue", splitting the value on paragraphs, then sentences or
+        list items, when it exceeds max_tokens. Every piece repeats the label.
+        """
+        text = f"{label}\n{value}"
+        if self._get_token_count(text) <= max_tokens:
+            return [text]
+        budget = max_tokens - self._get_token_count(label) - 1
+        units = []
+        for paragraph in value.split("\n\n"):
+            if self._get_token_count(paragraph) <= budget:
+                units.append(paragraph)
+            else:
+                units.extend(u for u in re.split(r"(?<=[.!?])\s+|(?<=,)\s+", paragraph) if u)
+        pieces, current, current_tokens = [], [], 0
+        for unit in units:
+            tokens = self._get_token_count(unit) + 1
+            if current and current_tokens + tokens > budget:
+                pieces.append(current)
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += tokens
+        if current:
+            pieces.append(current)
+        joiner = "\n\n" if "\n\n" in value else " "
+        return [f"{label}\n{joiner.join(piece)}" for piece in pieces]
+
+    def _summary_single_document(self, data: Dict, project_name: str, max_tokens: int = 500) -> Dict:
+        """
+        Build one create-by-text body holding every summary field, with explicit
+        section separators so Dify creates one chunk per section
+        """
+        text = self._format_summary_text(data, project_name, max_tokens=max_tokens)
+        largest = max((self._get_token_count(section) for section in text.split(CHUNK_SEPARATOR)), default=0)
+        process_rule = {
+            "mode": "custom",
+            "rules": {
+                "pre_processing_rules": [
+                    {"id": "remove_extra_spaces", "enabled": True},
+                    {"id": "remove_urls_emails", "enabled": False}
+                ],
+                "segmentation": {
+                    "separator": CHUNK_SEPARATOR,
+                    # Headroom for tokenizer differences so Dify never re-splits a section
+                    "max_tokens": max(max_tokens, int(largest * 1.1) + 1),
+                    "chunk_overlap": 0
+                }
+            }
+        }
+        return {
+            "name": f"Project Summary: {project_name}"[:60],
+            "text": text,
+            "indexing_technique": "high_quality",
+            "process_rule": process_rule
+        }
 
     def _get_nested_value(self, data: Dict, possible_paths: List[str], default: str = "Unknown") -> str:
         """
@@ -425,27 +855,126 @@ class DifyIntegration:
                 continue
         return default
 
-    def delete_documents(self, document_ids: List[str]) -> Dict:
+    def retrieve(self, query: str, retrieval_model: Optional[Dict] = None, use_cache: bool = True) -> Dict:
         """
-        Delete documents from Dify RAG (if supported by your Dify version)
+        Query the dataset through Dify's retrieve (hit-testing) API
         Args:
-            document_ids: List of document IDs to delete
+            query: Free-text query
+            retrieval_model: Optional retrieval settings (search_method, top_k, score_threshold...)
+            use_cache: Serve repeated queries from the in-process retrieval cache
         Returns:
-            Response from Dify API
+            Response from Dify API, with a 'cached' flag added
+        """
+        if use_cache:
+            cached = retrieval_cache.get(self.dataset_id, query, retrieval_model)
+            if cached is not None:
+                logger.info(f"[DIFY] Retrieval cache hit for dataset {self.dataset_id}")
+                return {**cached, "cached": True}
+        generation = retrieval_cache.generation(self.dataset_id)
+        url = f"{self.base_url}/datasets/{self.dataset_id}/retrieve"
+        data = {"query": query}
+        if retrieval_model:
+            data["retrieval_model"] = retrieval_model
+        try:
+            logger.info(f"[DIFY] Retrieving from dataset: POST {url}")
+            response = self._request("retrieve", "POST", url, json=data)
+            logger.debug(f"[DIFY] Retrieve response: {response.text}")
+            response.raise_for_status()
+            result = response.json()
+            if use_cache:
+                retrieval_cache.put(self.dataset_id, query, retrieval_model, result, generation=generation)
+            return {**result, "cached": False}
+        except Exception as e:
+            logger.error(f"[DIFY] Error retrieving from dataset: {e}\n{traceback.format_exc()}")
+            raise
+
+    def list_documents_page(self, page: int = 1, limit: int = 100, keyword: Optional[str] = None) -> Dict:
         """
+        Fetch one page of the dataset's document list
+        Returns:
+            Dify response with "data", "has_more" and "total"
+        """
+        url = f"{self.base_url}/datasets/{self.dataset_id}/documents"
+        params = {"page": page, "limit": limit}
+        if keyword:
+            params["keyword"] = keyword
         try:
-            response = requests.delete(
-                f"{self.base_url}/documents",
-                headers=self.headers,
-                json={"document_ids": document_ids}
-            )
-            logger.info(f"[DIFY] Delete documents response {response.status_code}: {response.text}")
+            logger.debug(f"[DIFY] Listing documents: GET {url} page={page}")
+            response = self._request("list_documents", "GET", url, params=params)
             response.raise_for_status()
             return response.json()
         except Exception as e:
-            logger.error(f"[DIFY] Error deleting documents: {e}\n{traceback.format_exc()}")
+            logger.error(f"[DIFY] Error listing documents: {e}\n{traceback.format_exc()}")
             raise
 
+    def iter_documents(self, keyword: Optional[str] = None, limit: int = 100) -> Iterator[Dict]:
+        """
+        Page through the documents of the dataset
+        Args:
+            keyword: Only documents whose name contains this keyword
+            limit: Page size (Dify accepts up to 100)
+        Returns:
+            Iterator over document dicts (id, name, created_at, ...)
+        """
+        page = 1
+        while True:
+            body = self.list_documents_page(page, limit, keyword)
+            yield from body.get("data", [])
+            if not body.get("has_more"):
+                return
+            page += 1
+
+    def delete_document(self, document_id: str) -> Dict:
+        """
+        Delete a single document from the dataset
+        Args:
+            document_id: Dify document ID
+        Returns:
+            Response from Dify API
+        """
+        url = f"{self.base_url}/datasets/{self.dataset_id}/documents/{document_id}"
+        try:
+            logger.info(f"[DIFY] Deleting document {document_id}: DELETE {url}")
+            response = self._request("delete_document", "DELETE", url)
+            response.raise_for_status()
+            retrieval_cache.bump_generation(self.dataset_id)
+            return response.json() if response.content else {"result": "success"}
+        except Exception as e:
+            logger.error(f"[DIFY] Error deleting document {document_id}: {e}\n{traceback.format_exc()}")
+            raise
+
+    def delete_documents(self, document_ids: List[str], max_workers: int = 8, rate: Optional[float] = None) -> Dict:
+        """
+        Delete documents from the dataset, several at a time
+        Args:
+            document_ids: List of document IDs to delete
+            max_workers: Concurrent delete requests
+            rate: Maximum delete requests per second (unlimited if None)
+        Returns:
+            {"deleted": [ids], "failed": {id: error}}
+        """
+        limiter = RateLimiter(rate) if rate else None
+
+        @propagate
+        def delete(document_id: str):
+            if limiter:
+                limiter.acquire()
+            return self.delete_document(document_id)
+
+        result = {"deleted": [], "failed": {}}
+        if not document_ids:
+            return result
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {document_id: pool.submit(delete, document_id) for document_id in document_ids}
+            for document_id, future in futures.items():
+                try:
+                    future.result()
+                    result["deleted"].append(document_id)
+                except Exception as e:
+                    result["failed"][document_id] = str(e)
+        logger.info(f"[DIFY] Deleted {len(result['deleted'])} documents, {len(result['failed'])} failed")
+        return result
+
     def create_dataset(self, name: str = None, permission: str = "only_me", search_method: str = "hybrid_search", advanced_ingestion: bool = False) -> str:
         if name is None:
             mode = "Advanced" if advanced_ingestion else "Basic"
@@ -467,7 +996,7 @@ class DifyIntegration:
         }
         try:
             logger.info(f"[DIFY] Creating dataset: POST {url} {data}")
-            response = requests.post(url, headers= self.headers, json=data)
+            response = self._request("create_dataset", "POST", url, json=data)
             logger.info(f"[DIFY] Response {response.status_code}: {response.text}")
             try:
                 response.raise_for_status()
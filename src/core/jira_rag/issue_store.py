@@ -0,0 +1,334 @@
+"""
+Compact, memory-mapped on-disk store for Jira issue files.
+
+A ``.jstore`` file keeps every issue of a JSON dataset file as a compact JSON
+record plus one column per commonly read field, and a sorted key index:
+
+    header   magic, version, issue count, offset and length of the meta block
+    records  compact JSON of each issue in the original schema, zlib-compressed
+    columns  per column: uint64 offsets (count + 1) followed by UTF-8 values
+    index    uint64 key offsets (count + 1), sorted key bytes, uint32 record order
+    meta     JSON describing where each region starts
+
+Opening a store only reads the header and the meta block. Single issues are
+found by binary search over the key index and column subsets are read without
+touching the records region.
+"""
+from typing import List, Dict, Optional, Iterator, Iterable, Tuple
+from collections.abc import Sequence
+from array import array
+from pathlib import Path
+import bisect
+import json
+import logging
+import mmap
+import struct
+import sys
+import tempfile
+import traceback
+import zlib
+
+from .compression import open_text, base_path
+
+logger = logging.getLogger(__name__)
+
+STORE_SUFFIX = '.jstore'
+MAGIC = b'JISSTORE'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQ')
+HEADER_SIZE = 64
+
+# Column name -> candidate paths, in the same order DifyIntegration looks them up
+COLUMNS: Dict[str, List[str]] = {
+    'key': ['key', 'fields.key'],
+    'project': ['project.key', 'fields.project.key', 'project'],
+    'issue_type': ['issuetype.name', 'fields.issuetype.name', 'issue_type'],
+    'status': ['status.name', 'fields.status.name', 'status'],
+    'priority': ['priority.name', 'fields.priority.name', 'priority'],
+    'assignee': ['assignee.name', 'fields.assignee.name', 'fields.assignee.displayName', 'assignee'],
+    'reporter': ['reporter.name', 'fields.reporter.name', 'fields.reporter.displayName', 'reporter'],
+    'created': ['created', 'fields.created'],
+    'updated': ['updated', 'fields.updated'],
+    'summary': ['summary', 'fields.summary'],
+    'description': ['description', 'fields.description'],
+}
+
+
+class IssueStoreError(Exception):
+    pass
+
+
+def is_store_path(path: str) -> bool:
+    return str(path).endswith(STORE_SUFFIX)
+
+
+def extract_column(issue: Dict, column: str) -> Optional[str]:
+    """Return the first scalar value found on the column's candidate paths"""
+    for path in COLUMNS[column]:
+        value = issue
+        for part in path.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+            if value is None:
+                break
+        if value is not None and not isinstance(value, (dict, list)) and value != '':
+            return str(value)
+    return None
+
+
+def _to_le(values: array) -> bytes:
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode: str, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _pad(f) -> int:
+    """Align the next region on 8 bytes and return its offset"""
+    offset = f.tell()
+    padding = (-offset) % 8
+    if padding:
+        f.write(b'\0' * padding)
+    return offset + padding
+
+
+def write_store(issues: Iterable[Dict], store_path: str, source: Optional[str] = None, compress: bool = True) -> int:
+    """
+    Stream issues into a store file without holding the corpus in memory.
+    Only the per-issue offsets and the keys are kept until the end.
+    Args:
+        issues: Issues in any of the dataset schemas
+        store_path: Output path
+        source: Original file name, used when converting back to JSON
+        compress: Compress each record independently so single reads stay cheap
+    Returns:
+        Number of issues written
+    """
+    column_names = list(COLUMNS)
+    record_offsets = array('Q')
+    column_offsets = {name: array('Q', [0]) for name in column_names}
+    column_files = {name: tempfile.TemporaryFile() for name in column_names}
+    keys: List[Tuple[bytes, int]] = []
+    try:
+        with open(store_path, 'wb') as f:
+            f.write(b'\0' * HEADER_SIZE)
+            for idx, issue in enumerate(issues):
+                record_offsets.append(f.tell())
+                record = json.dumps(issue, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+                f.write(zlib.compress(record, 1) if compress else record)
+                for name in column_names:
+                    value = extract_column(issue, name)
+                    data = value.encode('utf-8') if value is not None else b''
+                    column_files[name].write(data)
+                    column_offsets[name].append(column_offsets[name][-1] + len(data))
+                keys.append(((extract_column(issue, 'key') or '').encode('utf-8'), idx))
+            record_offsets.append(f.tell())
+            count = len(keys)
+
+            meta = {"version": VERSION, "count": count, "source": source,
+                    "compression": "zlib" if compress else None, "columns": {}}
+            meta["records"] = _pad(f)
+            f.write(_to_le(record_offsets))
+            for name in column_names:
+                offsets_at = _pad(f)
+                f.write(_to_le(column_offsets[name]))
+                data_at = f.tell()
+                column_files[name].seek(0)
+                while True:
+                    block = column_files[name].read(1024 * 1024)
+                    if not block:
+                        break
+                    f.write(block)
+                meta["columns"][name] = {"offsets": offsets_at, "data": data_at}
+
+            keys.sort()
+            key_offsets = array('Q', [0])
+            for key, _ in keys:
+                key_offsets.append(key_offsets[-1] + len(key))
+            meta["index"] = {"offsets": _pad(f)}
+            f.write(_to_le(key_offsets))
+            meta["index"]["keys"] = f.tell()
+            for key, _ in keys:
+                f.write(key)
+            meta["index"]["order"] = _pad(f)
+            f.write(_to_le(array('I', [idx for _, idx in keys])))
+
+            meta_bytes = json.dumps(meta).encode('utf-8')
+            meta_at = f.tell()
+            f.write(meta_bytes)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, count, meta_at, len(meta_bytes)))
+        logger.info(f"[STORE] Wrote {count} issues to {store_path}")
+        return count
+    finally:
+        for column_file in column_files.values():
+            column_file.close()
+
+
+class IssueStore(Sequence):
+    """
+    Read-only view over a store file. Behaves as a sequence of issue dicts in
+    the original schema, parsed on access, so it can be handed directly to
+    DifyIntegration.ingest_issues.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self._file = open(self.path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise IssueStoreError(f"Empty store file: {self.path}")
+        magic, version, count, meta_at, meta_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise IssueStoreError(f"Not an issue store: {self.path}")
+        if version != VERSION:
+            self.close()
+            raise IssueStoreError(f"Unsupported store version {version} in {self.path}")
+        self.count = count
+        self.meta = json.loads(self._mm[meta_at:meta_at + meta_len])
+        self._record_offsets = self._offsets(self.meta["records"])
+        self._compressed = self.meta.get("compression") == "zlib"
+        self._column_offsets: Dict[str, array] = {}
+        self._key_offsets = None
+        self._order = None
+
+    def _offsets(self, at: int) -> array:
+        return _from_le('Q', self._mm[at:at + 8 * (self.count + 1)])
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self.count))]
+        if idx < 0:
+            idx += self.count
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        start, end = self._record_offsets[idx], self._record_offsets[idx + 1]
+        record = self._mm[start:end]
+        return json.loads(zlib.decompress(record) if self._compressed else record)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for idx in range(self.count):
+            yield self[idx]
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.meta["columns"])
+
+    def column(self, name: str) -> Iterator[Optional[str]]:
+        """Iterate one column's values in record order"""
+        if name not in self.meta["columns"]:
+            raise KeyError(f"Unknown column '{name}'. Available: {', '.join(self.column_names)}")
+        if name not in self._column_offsets:
+            self._column_offsets[name] = self._offsets(self.meta["columns"][name]["offsets"])
+        offsets = self._column_offsets[name]
+        data_at = self.meta["columns"][name]["data"]
+        mm = self._mm
+        for idx in range(self.count):
+            start, end = offsets[idx], offsets[idx + 1]
+            yield mm[data_at + start:data_at + end].decode('utf-8') if end > start else None
+
+    def columns(self, names: List[str]) -> Iterator[Tuple[Optional[str], ...]]:
+        """Iterate rows made of the requested columns only"""
+        return zip(*(self.column(name) for name in names))
+
+    def _key_at(self, pos: int) -> bytes:
+        at = self.meta["index"]["keys"]
+        return self._mm[at + self._key_offsets[pos]:at + self._key_offsets[pos + 1]]
+
+    def index_of(self, key: str) -> Optional[int]:
+        """Binary search the sorted key index; returns the record position"""
+        if self._key_offsets is None:
+            self._key_offsets = self._offsets(self.meta["index"]["offsets"])
+            order_at = self.meta["index"]["order"]
+            self._order = _from_le('I', self._mm[order_at:order_at + 4 * self.count])
+        target = key.encode('utf-8')
+        keys = _SortedKeys(self)
+        pos = bisect.bisect_left(keys, target)
+        if pos < self.count and self._key_at(pos) == target:
+            return self._order[pos]
+        return None
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a single issue by key without reading any other record"""
+        idx = self.index_of(key)
+        return self[idx] if idx is not None else None
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _SortedKeys(Sequence):
+    """Lazy sequence over the key index so bisect never materialises all keys"""
+
+    def __init__(self, store: IssueStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return self.store.count
+
+    def __getitem__(self, pos: int) -> bytes:
+        return self.store._key_at(pos)
+
+
+def json_to_store(json_path: str, store_path: Optional[str] = None) -> str:
+    """
+    Convert a dataset JSON file (array, JSONL or {"issues": [...]}, plain or gzip/zstd
+    compressed) into a store; PROJ_issues.json.gz becomes PROJ_issues.jstore.
+    Returns:
+        Path of the written store
+    """
+    from .cleaning import iter_raw_issues
+
+    store_path = store_path or str(base_path(json_path).with_suffix(STORE_SUFFIX))
+    try:
+        logger.info(f"[STORE] Converting {json_path} -> {store_path}")
+        with open_text(json_path) as f:
+            head = f.read(4096).lstrip()
+        if head.startswith('{') and '"issues"' in head:
+            with open_text(json_path) as f:
+                issues = json.load(f).get('issues', [])
+        else:
+            issues = iter_raw_issues(json_path)
+        write_store(issues, store_path, source=Path(json_path).name)
+        return store_path
+    except Exception as e:
+        logger.error(f"[STORE] Error converting {json_path}: {e}\n{traceback.format_exc()}")
+        raise
+
+
+def store_to_json(store_path: str, json_path: Optional[str] = None) -> str:
+    """
+    Write a store back out as a pretty-printed JSON array in the original schema.
+    Returns:
+        Path of the written JSON file
+    """
+    with IssueStore(store_path) as store:
+        json_path = json_path or str(Path(store_path).with_name(store.meta.get("source") or Path(store_path).stem + '.json'))
+        logger.info(f"[STORE] Converting {store_path} -> {json_path}")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            f.write('[')
+            for idx, issue in enumerate(store):
+                f.write(',\n  ' if idx else '\n  ')
+                f.write(json.dumps(issue, indent=2, ensure_ascii=False).replace('\n', '\n  '))
+            f.write('\n]' if len(store) else ']')
+    return json_path
@@ -1,4 +1,5 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
+import sys
 from jira import JIRA
 from pydantic import BaseModel
 import os
@@ -9,9 +10,18 @@ import logging
 import base64
 import traceback
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .single_flight import SingleFlight
+from .metrics import timed_upstream
+from .tracing import span, propagate
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Jira's bulk create endpoint accepts at most 50 issues per request
+BULK_CREATE_CHUNK_SIZE = 50
+
 # Add Jira domain to NO_PROXY
 os.environ['NO_PROXY'] = os.environ.get('NO_PROXY', '') + ',jira.biscrum.com'
 
@@ -26,6 +36,57 @@ class JiraIssue(BaseModel):
     project: str
     issue_type: str
 
+# Fields read into JiraIssue / IssueRow; bulk searches request nothing else
+ISSUE_ROW_FIELDS = "summary,description,status,assignee,created,updated,project,issuetype"
+
+
+class IssueRow:
+    """
+    Compact, slotted form of JiraIssue for bulk fetches. Built straight from
+    the search JSON so no jira Resource objects are kept, with the
+    low-cardinality fields interned. Converts to JiraIssue on demand.
+    """
+    __slots__ = ("key", "summary", "description", "status", "assignee", "created", "updated", "project", "issue_type")
+
+    def __init__(self, key: str, summary: str, description: Optional[str], status: str, assignee: Optional[str],
+                 created: str, updated: str, project: str, issue_type: str):
+        self.key = key
+        self.summary = summary
+        self.description = description
+        self.status = status
+        self.assignee = assignee
+        self.created = created
+        self.updated = updated
+        self.project = project
+        self.issue_type = issue_type
+
+    @classmethod
+    def from_raw(cls, raw: Dict) -> "IssueRow":
+        """Build a row from a raw search result ({"key", "fields": {...}})"""
+        fields = raw.get("fields") or {}
+        assignee = fields.get("assignee")
+        return cls(
+            key=raw["key"],
+            summary=fields.get("summary"),
+            description=fields.get("description"),
+            status=sys.intern((fields.get("status") or {}).get("name") or ""),
+            assignee=sys.intern(assignee.get("displayName") or "") if assignee else "Unassigned",
+            created=fields.get("created"),
+            updated=fields.get("updated"),
+            project=sys.intern((fields.get("project") or {}).get("name") or ""),
+            issue_type=sys.intern((fields.get("issuetype") or {}).get("name") or ""),
+        )
+
+    def dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_issue(self) -> JiraIssue:
+        return JiraIssue(**self.dict())
+
+    def __repr__(self) -> str:
+        return f"IssueRow(key={self.key!r}, summary={self.summary!r})"
+
+
 class JiraClient:
     def __init__(self, server_url: Optional[str] = None, 
                  email: Optional[str] = None, 
@@ -39,6 +100,9 @@ class JiraClient:
         if not all([self.server_url, self.email, self.api_token]):
             raise ValueError("Missing required Jira credentials. Please provide them or set environment variables.")
 
+        # Concurrent identical reads share one request
+        self._flights = SingleFlight()
+
         
         # Disable proxy usage
         #self.session.trust_env = False
@@ -63,33 +127,92 @@ class JiraClient:
         
         Args:
             jql_query: JQL query string
-            max_results: Maximum number of results to return
+            max_results: Maximum number of results to return (all if 0)
             
         Returns:
             List of JiraIssue objects
         """
+        key = ("search", " ".join(jql_query.split()), max_results)
+        return self._flights.do(key, lambda: self._get_issues(jql_query, max_results))
+
+    def _get_issues(self, jql_query: str, max_results: int) -> List[JiraIssue]:
         try:
             logger.info(f"[JIRA] Fetching issues with JQL: {jql_query}, max_results={max_results}")
-            issues = self.client.search_issues(jql_query, maxResults=max_results)
+            with span("jira.get_issues", jql=jql_query) as current:
+                issues = [row.to_issue() for row in self.iter_issue_rows(jql_query, max_results=max_results)]
+                current.set("issues", len(issues))
             logger.info(f"[JIRA] Fetched {len(issues)} issues.")
-            return [
-                JiraIssue(
-                    key=issue.key,
-                    summary=issue.fields.summary,
-                    description=issue.fields.description,
-                    status=issue.fields.status.name,
-                    assignee=issue.fields.assignee.displayName if issue.fields.assignee else "Unassigned",
-                    created=issue.fields.created,
-                    updated=issue.fields.updated,
-                    project=issue.fields.project.name,
-                    issue_type=issue.fields.issuetype.name
-                )
-                for issue in issues
-            ]
+            return issues
         except Exception as e:
             logger.error(f"[JIRA] Error fetching issues: {e}\n{traceback.format_exc()}")
             raise
-    
+
+    def iter_issue_rows(self, jql_query: str, max_results: Optional[int] = None, page_size: int = 100) -> Iterator[IssueRow]:
+        """
+        Page through a JQL search yielding compact IssueRow records.
+        Only the fields of JiraIssue are requested and each page of raw JSON
+        is released as soon as its rows are built.
+        
+        Args:
+            jql_query: JQL query string
+            max_results: Stop after this many issues (all if None or 0, like maxResults=0)
+            page_size: Issues requested per search call
+        """
+        if max_results is not None and max_results <= 0:
+            max_results = None
+        if max_results is not None:
+            page_size = min(page_size, max_results)
+        count = 0
+        for raw in self.iter_issue_dicts(jql_query, page_size=page_size, fields=ISSUE_ROW_FIELDS):
+            yield IssueRow.from_raw(raw)
+            count += 1
+            if max_results is not None and count >= max_results:
+                return
+
+    def get_issue_rows(self, jql_query: str, max_results: Optional[int] = None) -> List[IssueRow]:
+        """
+        Fetch issues as compact rows for bulk paths; call to_issue() on a row for a JiraIssue
+        """
+        try:
+            logger.info(f"[JIRA] Fetching issue rows with JQL: {jql_query}, max_results={max_results}")
+            rows = list(self.iter_issue_rows(jql_query, max_results=max_results))
+            logger.info(f"[JIRA] Fetched {len(rows)} issue rows.")
+            return rows
+        except Exception as e:
+            logger.error(f"[JIRA] Error fetching issue rows: {e}\n{traceback.format_exc()}")
+            raise
+
+    def iter_issue_dicts(self, jql_query: str, page_size: int = 100, fields: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Page through a JQL search yielding raw issue dicts in the Atlassian schema
+        
+        Args:
+            jql_query: JQL query string
+            page_size: Issues requested per search call
+            fields: Optional comma-separated list of fields to return
+            
+        Yields:
+            Raw issue dicts ({"id", "key", "fields": {...}})
+        """
+        start_at = 0
+        while True:
+            try:
+                logger.info(f"[JIRA] Searching issues with JQL: {jql_query}, startAt={start_at}, maxResults={page_size}")
+                with timed_upstream("jira", "search") as call:
+                    page = self.client.search_issues(
+                        jql_query, startAt=start_at, maxResults=page_size, fields=fields, json_result=True
+                    )
+                    call.status = 200
+            except Exception as e:
+                logger.error(f"[JIRA] Error searching issues: {e}\n{traceback.format_exc()}")
+                raise
+            issues = page.get("issues", [])
+            for issue in issues:
+                yield issue
+            start_at += len(issues)
+            if not issues or start_at >= page.get("total", 0):
+                break
+
     def get_issue(self, issue_key: str) -> JiraIssue:
         """
         Fetch a single issue by its key
@@ -100,9 +223,14 @@ class JiraClient:
         Returns:
             JiraIssue object
         """
+        return self._flights.do(("issue", issue_key.upper()), lambda: self._get_issue(issue_key))
+
+    def _get_issue(self, issue_key: str) -> JiraIssue:
         try:
             logger.info(f"[JIRA] Fetching issue: {issue_key}")
-            issue = self.client.issue(issue_key)
+            with timed_upstream("jira", "get_issue") as call:
+                issue = self.client.issue(issue_key)
+                call.status = 200
             return JiraIssue(
                 key=issue.key,
                 summary=issue.fields.summary,
@@ -118,6 +246,10 @@ class JiraClient:
             logger.error(f"[JIRA] Error fetching issue {issue_key}: {e}\n{traceback.format_exc()}")
             raise
 
+    def coalescing_stats(self) -> Dict:
+        """Counters of reads served by an identical in-flight request"""
+        return self._flights.stats()
+
     def create_test_issue(self, project_key: str) -> JiraIssue:
         """
         Create a test issue with hardcoded values
@@ -147,7 +279,9 @@ class JiraClient:
             logger.info(f"[JIRA] Issue dict: {issue_dict}")
             logger.info(f"[JIRA] Creating test issue in {project_key} project...")
             
-            new_issue = self.client.create_issue(fields=issue_dict)
+            with timed_upstream("jira", "create_issue") as call:
+                new_issue = self.client.create_issue(fields=issue_dict)
+                call.status = 201
             logger.info(f"[JIRA] New issue created: {new_issue.key}")
             
         except Exception as e:
@@ -181,12 +315,14 @@ class JiraClient:
                 }
             
             # Use the built-in create_issue_link method
-            self.client.create_issue_link(
-                type=link_type,
-                inwardIssue=inward_key,
-                outwardIssue=outward_key,
-                comment=comment_data
-            )
+            with timed_upstream("jira", "link_issues") as call:
+                response = self.client.create_issue_link(
+                    type=link_type,
+                    inwardIssue=inward_key,
+                    outwardIssue=outward_key,
+                    comment=comment_data
+                )
+                call.status = getattr(response, "status_code", 201)
             
             logger.info(f"[JIRA] Successfully linked issues {inward_key} and {outward_key}")
                 
@@ -207,7 +343,53 @@ class JiraClient:
             logger.error(f"[JIRA] Error checking test case by summary: {e}\n{traceback.format_exc()}")
             raise
 
-    def bulk_create_test_issues(
+    def _test_case_fields(
+        self,
+        tc: Dict,
+        project_key: str,
+        labels: Optional[list] = None,
+        reporter: Optional[str] = None,
+        component: Optional[str] = None
+    ) -> Dict:
+        """Build the create-issue fields of one LLM-generated test case"""
+        description = (
+            f"Gherkin:\n{tc['gherkin']}\n\n"
+            f"Steps to Reproduce:\n" + "\n".join(f"- {step}" for step in tc.get("steps_to_reproduce", [])) +
+            f"\n\nExpected Result:\n{tc.get('expected_result', '')}"
+        )
+        issue_dict = {
+            "project": {"key": project_key},
+            "summary": tc["scenario_title"],
+            "description": description,
+            "issuetype": {"name": tc.get("test_case_type", "Test")},
+            "priority": {"name": tc.get("priority", "Medium")},
+            "assignee": {"name": "Unassigned"}  # Set default assignee
+        }
+        if labels:
+            issue_dict["labels"] = labels
+        if component:
+            issue_dict["components"] = [{"name": component}]
+        if reporter:
+            issue_dict["reporter"] = {"name": reporter}
+        return issue_dict
+
+    @staticmethod
+    def _created_issue_key(issue) -> Optional[str]:
+        """Extract the key from a create_issues entry, an Issue or a dict"""
+        if isinstance(issue, dict):
+            if issue.get('issue') is not None and hasattr(issue['issue'], 'key'):
+                return issue['issue'].key
+            return issue.get('key')
+        return getattr(issue, 'key', None)
+
+    def _create_chunk(self, issue_fields: List[Dict]) -> list:
+        # No prefetch: only the keys are needed, not one GET per created issue
+        with timed_upstream("jira", "bulk_create") as call:
+            created = self.client.create_issues(field_list=issue_fields, prefetch=False)
+            call.status = 201
+        return created
+
+    def iter_bulk_create_test_issues(
         self,
         project_key: str,
         test_cases: list,
@@ -215,114 +397,124 @@ class JiraClient:
         link_type: str = "Tests",
         labels: Optional[list] = None,
         reporter: Optional[str] = None,
-        component: Optional[str] = None
-    ) -> list:
+        component: Optional[str] = None,
+        chunk_size: int = BULK_CREATE_CHUNK_SIZE,
+        link_workers: int = 4
+    ) -> Iterator[Dict]:
         """
-        Bulk create test issues, avoiding duplicates, and link them to the parent.
+        Create test issues in chunks of at most chunk_size and link them to the parent.
+        Chunk N+1 is created while chunk N is being linked.
+
+        Yields:
+            One record per test case as soon as it is done
+                {"type": "test_case", "chunk", "index", "summary", "status": "linked" | "link_failed" | "create_failed",
+                 "test_case_key", "url", "message"}
+            and one record per chunk once all of its cases are done
+                {"type": "chunk", "chunk", "created", "linked", "failed", "errors"}
         """
-        logger.info(f"[JIRA] Starting bulk_create_test_issues with project_key: {project_key}, parent_key: {parent_key}")
-        logger.info(f"[JIRA] Received {len(test_cases)} test cases to process")
-        
-        issue_fields = []
-        summaries = []
-        for tc in test_cases:
-            summary = tc["scenario_title"]
-            logger.info(f"[JIRA] Processing test case: {summary}")
-            
-            #existing_issue = self.get_test_case_by_summary(project_key, summary)
-            #if existing_issue:
-            #    logger.info(f"Duplicate found: {summary}, skipping.")
-            #    continue
-
-            description = (
-                f"Gherkin:\n{tc['gherkin']}\n\n"
-                f"Steps to Reproduce:\n" + "\n".join(f"- {step}" for step in tc.get("steps_to_reproduce", [])) +
-                f"\n\nExpected Result:\n{tc.get('expected_result', '')}"
-            )
+        logger.info(f"[JIRA] Starting chunked bulk creation of {len(test_cases)} test cases for {parent_key} "
+                    f"(chunks of {chunk_size})")
+        chunks = []
+        for start in range(0, len(test_cases), chunk_size):
+            cases = test_cases[start:start + chunk_size]
+            chunks.append([(start + offset, tc) for offset, tc in enumerate(cases)])
+        if not chunks:
+            return
 
-            issue_dict = {
-                "project": {"key": project_key},
-                "summary": summary,
-                "description": description,
-                "issuetype": {"name": tc.get("test_case_type", "Test")},
-                "priority": {"name": tc.get("priority", "Medium")},
-                "assignee": {"name": "Unassigned"}  # Set default assignee
-            }
-            if labels:
-                issue_dict["labels"] = labels
-                logger.info(f"[JIRA] Adding labels: {labels}")
-            if component:
-                issue_dict["components"] = [{"name": component}]
-                logger.info(f"[JIRA] Adding component: {component}")
-            if reporter:
-                issue_dict["reporter"] = {"name": reporter}
-                logger.info(f"[JIRA] Setting reporter: {reporter}")
-            
-            logger.info(f"[JIRA] Prepared issue dict: {issue_dict}")
-            issue_fields.append(issue_dict)
-            summaries.append(summary)
+        browse_url = self.server_url.rstrip('/')
 
-        logger.info(f"[JIRA] Prepared {len(issue_fields)} issues for creation")
-        
-        # Bulk create issues
-        try:
-            created_issues = self.client.create_issues(field_list=issue_fields, prefetch=True) if issue_fields else []
-            logger.info(f"[JIRA] Successfully created {len(created_issues)} issues")
-            logger.info(f"[JIRA] Created issues response: {created_issues}")
-        except Exception as e:
-            logger.error(f"[JIRA] Error creating issues: {e}\n{traceback.format_exc()}")
-            raise
+        def create(number, chunk):
+            with span("jira.create_chunk", chunk=number, test_cases=len(chunk)):
+                return prepare_and_create(chunk)
 
-        # Link each created issue to the parent
-        results = []
-        for issue, summary in zip(created_issues, summaries):
+        def prepare_and_create(chunk):
+            prepared, failed = [], []
+            for index, tc in chunk:
+                try:
+                    prepared.append((index, tc, self._test_case_fields(tc, project_key, labels, reporter, component)))
+                except Exception as e:
+                    failed.append((index, tc, f"Invalid test case: {str(e)}"))
+            created = self._create_chunk([fields for _, _, fields in prepared]) if prepared else []
+            return prepared, created, failed
+
+        def link(index, summary, issue_key):
+            record = {"type": "test_case", "index": index, "summary": summary, "test_case_key": issue_key,
+                      "url": f"{browse_url}/browse/{issue_key}"}
             try:
-                # Extract issue key with better error handling and logging
-                logger.info(f"[JIRA] Processing created issue: {issue}")
-                issue_key = None
-                
-                if isinstance(issue, dict):
-                    if 'issue' in issue and hasattr(issue['issue'], 'key'):
-                        issue_key = issue['issue'].key
-                        logger.info(f"[JIRA] Extracted key from issue object: {issue_key}")
-                    elif 'key' in issue:
-                        issue_key = issue['key']
-                        logger.info(f"[JIRA] Extracted key from dict: {issue_key}")
-                elif hasattr(issue, 'key'):
-                    issue_key = issue.key
-                    logger.info(f"[JIRA] Extracted key from object: {issue_key}")
-                else:
-                    logger.error(f"[JIRA] Unexpected issue format: {type(issue)}")
-                    continue
-                
-                if not issue_key:
-                    logger.error(f"[JIRA] Could not extract key from issue: {issue}")
-                    continue
-                
-                logger.info(f"[JIRA] Linking issue {issue_key} to parent {parent_key}")
                 self.link_issues(
                     inward_key=parent_key,
                     outward_key=issue_key,
                     link_type=link_type,
                     comment=f"Test case generated for scenario: {summary}"
                 )
-                results.append({
-                    "test_case_key": issue_key,
-                    "summary": summary,
-                    "url": f"{self.server_url.rstrip('/')}/browse/{issue_key}",
-                    "message": "Test case created and linked."
-                })
-                logger.info(f"[JIRA] Successfully linked issue {issue_key}")
+                record.update(status="linked", message="Test case created and linked.")
             except Exception as e:
-                logger.error(f"[JIRA] Error linking issue: {e}\n{traceback.format_exc()}")
-                if issue_key:
-                    results.append({
-                        "test_case_key": issue_key,
-                        "summary": summary,
-                        "url": f"{self.server_url.rstrip('/')}/browse/{issue_key}",
-                        "message": f"Test case created, but linking failed: {str(e)}"
-                    })
-        
+                logger.error(f"[JIRA] Error linking issue {issue_key}: {e}")
+                record.update(status="link_failed", message=f"Test case created, but linking failed: {str(e)}")
+            return record
+
+        with ThreadPoolExecutor(max_workers=1) as creator, ThreadPoolExecutor(max_workers=link_workers) as linker:
+            # Run under the request's span so chunk and link calls land in its trace
+            create, link = propagate(create), propagate(link)
+            pending_create = creator.submit(create, 0, chunks[0])
+            for number, chunk in enumerate(chunks):
+                summary_record = {"type": "chunk", "chunk": number, "created": 0, "linked": 0, "failed": 0, "errors": []}
+                try:
+                    prepared, created, failed = pending_create.result()
+                except Exception as e:
+                    logger.error(f"[JIRA] Error creating chunk {number}: {e}\n{traceback.format_exc()}")
+                    prepared, created = [], []
+                    failed = [(index, tc, f"Bulk create failed: {str(e)}") for index, tc in chunk]
+                if number + 1 < len(chunks):
+                    pending_create = creator.submit(create, number + 1, chunks[number + 1])
+
+                for (index, tc, _), entry in zip(prepared, created):
+                    if isinstance(entry, dict) and entry.get("status") == "Error":
+                        failed.append((index, tc, f"Create failed: {entry.get('error')}"))
+                for index, tc, error in failed:
+                    summary_record["failed"] += 1
+                    summary_record["errors"].append({"index": index, "error": error})
+                    yield {"type": "test_case", "chunk": number, "index": index, "summary": tc.get("scenario_title"),
+                           "status": "create_failed", "test_case_key": None, "url": None, "message": error}
+
+                links = []
+                for (index, tc, _), entry in zip(prepared, created):
+                    issue_key = self._created_issue_key(entry)
+                    if not issue_key:
+                        continue
+                    summary_record["created"] += 1
+                    links.append(linker.submit(link, index, tc["scenario_title"], issue_key))
+                for future in as_completed(links):
+                    record = future.result()
+                    record["chunk"] = number
+                    if record["status"] == "linked":
+                        summary_record["linked"] += 1
+                    else:
+                        summary_record["errors"].append({"index": record["index"], "error": record["message"]})
+                    yield record
+                logger.info(f"[JIRA] Chunk {number}: {summary_record['created']} created, {summary_record['linked']} linked, "
+                            f"{summary_record['failed']} failed")
+                yield summary_record
+
+    def bulk_create_test_issues(
+        self,
+        project_key: str,
+        test_cases: list,
+        parent_key: str,
+        link_type: str = "Tests",
+        labels: Optional[list] = None,
+        reporter: Optional[str] = None,
+        component: Optional[str] = None
+    ) -> list:
+        """
+        Bulk create test issues in chunks and link them to the parent.
+        Returns the created test cases once all of them are processed.
+        """
+        results = []
+        for record in self.iter_bulk_create_test_issues(project_key, test_cases, parent_key, link_type=link_type,
+                                                        labels=labels, reporter=reporter, component=component):
+            if record["type"] == "test_case" and record["test_case_key"]:
+                results.append({key: record[key] for key in ("test_case_key", "summary", "url", "message")})
         logger.info(f"[JIRA] Completed bulk_create_test_issues. Created {len(results)} test cases")
         return results
 
@@ -331,9 +523,15 @@ class JiraClient:
         Retrieve all inward linked issues of a given type (e.g., 'Test'), optionally filtered by link type.
         Returns a list of dicts with keys: key, summary, description, link_type, direction.
         """
+        key = ("linked", issue_key.upper(), (link_type or "").lower(), issue_type.lower())
+        return self._flights.do(key, lambda: self._get_linked_issues(issue_key, link_type, issue_type))
+
+    def _get_linked_issues(self, issue_key: str, link_type: Optional[str], issue_type: str) -> list:
         try:
             logger.info(f"[JIRA] Getting linked issues for {issue_key} with link_type={link_type} and issue_type={issue_type}")
-            issue = self.client.issue(issue_key)
+            with timed_upstream("jira", "get_issue_links") as call:
+                issue = self.client.issue(issue_key)
+                call.status = 200
             linked = []
             for link in issue.fields.issuelinks:
                 # Only check inward links (this issue is the target)
@@ -0,0 +1,316 @@
+"""
+Local cache of the issue link graph of Jira projects.
+
+The graph is built from a few paged project-wide searches that only request
+the fields needed here (type, summary, status, updated, issue links and the
+epic/parent reference), then kept fresh by re-reading issues updated since
+the last sync. Traversals (epic -> stories -> tests) and the test coverage
+matrix of a project are answered from memory.
+
+Edges are stored as (outward issue, link type, inward issue) with adjacency
+lists in both directions. A link shows up in the issue links of both of its
+issues, so every edge remembers which issues reported it and is dropped once
+neither does. Epic membership is stored as an "Epic" edge from the epic to
+the child issue.
+
+Issues of other projects (e.g. tests kept in a QA project) are not synced,
+but the link payload carries their type, summary and status, which is kept
+for them so that they count in traversals and coverage.
+"""
+from typing import List, Dict, Optional, Iterable, Set, Tuple
+from collections import deque
+from datetime import datetime, timezone
+import math
+import json
+import logging
+import os
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Minutes re-read before the last synced update, covering clock skew between this host and Jira
+SYNC_MARGIN_MINUTES = 5
+
+EPIC_LINK = "Epic"
+GRAPH_FIELDS = ["issuetype", "summary", "status", "updated", "issuelinks", "parent"]
+
+Edge = Tuple[str, str, str]
+
+
+def _issue_edges(issue: Dict, epic_field: Optional[str] = None) -> List[Edge]:
+    """Edges reported by one raw issue ({"key", "fields": {...}})"""
+    key = issue["key"]
+    fields = issue.get("fields") or {}
+    edges = []
+    for link in fields.get("issuelinks") or []:
+        link_type = (link.get("type") or {}).get("name") or "Relates"
+        if link.get("outwardIssue"):
+            edges.append((key, link_type, link["outwardIssue"]["key"]))
+        elif link.get("inwardIssue"):
+            edges.append((link["inwardIssue"]["key"], link_type, key))
+    parent = fields.get("parent")
+    if isinstance(parent, dict) and parent.get("key"):
+        edges.append((parent["key"], EPIC_LINK, key))
+    epic = fields.get(epic_field) if epic_field else None
+    if isinstance(epic, str) and epic:
+        edges.append((epic, EPIC_LINK, key))
+    return edges
+
+
+def _linked_nodes(issue: Dict) -> Dict[str, Dict]:
+    """Type, summary and status of the issues a raw issue links to, from the link payload"""
+    nodes = {}
+    for link in (issue.get("fields") or {}).get("issuelinks") or []:
+        other = link.get("outwardIssue") or link.get("inwardIssue")
+        if not other or not other.get("key"):
+            continue
+        fields = other.get("fields") or {}
+        nodes[other["key"]] = {
+            "type": (fields.get("issuetype") or {}).get("name"),
+            "summary": fields.get("summary"),
+            "status": (fields.get("status") or {}).get("name"),
+            "updated": None,
+        }
+    return nodes
+
+
+class IssueLinkGraph:
+    def __init__(self, epic_field: Optional[str] = None):
+        # Custom field holding the Epic Link on Jira Server (e.g. customfield_10008)
+        self.epic_field = epic_field or os.getenv("JIRA_EPIC_LINK_FIELD")
+        # key -> {"type", "summary", "status", "updated"}
+        self.nodes: Dict[str, Dict] = {}
+        # Same for issues only seen in the links of synced issues
+        self.linked: Dict[str, Dict] = {}
+        # key -> link type -> keys, for both directions of every edge
+        self.outward: Dict[str, Dict[str, Set[str]]] = {}
+        self.inward: Dict[str, Dict[str, Set[str]]] = {}
+        self._reporters: Dict[Edge, Set[str]] = {}
+        self._reported: Dict[str, List[Edge]] = {}
+        self.synced: Dict[str, Optional[str]] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def fields(self) -> List[str]:
+        return GRAPH_FIELDS + ([self.epic_field] if self.epic_field else [])
+
+    def _add_edge(self, edge: Edge, reporter: str) -> None:
+        reporters = self._reporters.setdefault(edge, set())
+        if not reporters:
+            source, link_type, target = edge
+            self.outward.setdefault(source, {}).setdefault(link_type, set()).add(target)
+            self.inward.setdefault(target, {}).setdefault(link_type, set()).add(source)
+        reporters.add(reporter)
+
+    def _remove_edge(self, edge: Edge, reporter: str) -> None:
+        reporters = self._reporters.get(edge)
+        if not reporters:
+            return
+        reporters.discard(reporter)
+        if reporters:
+            return
+        del self._reporters[edge]
+        source, link_type, target = edge
+        for adjacency, a, b in ((self.outward, source, target), (self.inward, target, source)):
+            targets = adjacency.get(a, {}).get(link_type)
+            if targets is not None:
+                targets.discard(b)
+                if not targets:
+                    del adjacency[a][link_type]
+                if not adjacency[a]:
+                    del adjacency[a]
+
+    def add_issue(self, issue: Dict) -> None:
+        """Insert or replace one raw issue and the links it reports"""
+        key = issue["key"]
+        fields = issue.get("fields") or {}
+        with self._lock:
+            for edge in self._reported.pop(key, []):
+                self._remove_edge(edge, key)
+            self.nodes[key] = {
+                "type": (fields.get("issuetype") or {}).get("name"),
+                "summary": fields.get("summary"),
+                "status": (fields.get("status") or {}).get("name"),
+                "updated": fields.get("updated"),
+            }
+            self.linked.pop(key, None)
+            for other, node in _linked_nodes(issue).items():
+                if other not in self.nodes:
+                    self.linked[other] = node
+            edges = _issue_edges(issue, self.epic_field)
+            for edge in edges:
+                self._add_edge(edge, key)
+            self._reported[key] = edges
+
+    def add_issues(self, issues: Iterable[Dict]) -> int:
+        count = 0
+        for issue in issues:
+            self.add_issue(issue)
+            count += 1
+        return count
+
+    def remove_issue(self, key: str) -> None:
+        """Forget a deleted issue and every link it was part of"""
+        with self._lock:
+            for edge in self._reported.pop(key, []):
+                self._remove_edge(edge, key)
+            for edge in [e for e in self._reporters if key in (e[0], e[2])]:
+                for reporter in list(self._reporters.get(edge, ())):
+                    self._remove_edge(edge, reporter)
+            self.nodes.pop(key, None)
+            self.linked.pop(key, None)
+
+    def project_keys(self, project: str) -> List[str]:
+        prefix = f"{project}-"
+        with self._lock:
+            return [key for key in self.nodes if key.startswith(prefix)]
+
+    def sync(self, jira_client, project: str, full: bool = False, page_size: int = 1000) -> Dict:
+        """
+        Load a project (first time or full=True) or apply issues updated since the last sync
+        Returns:
+            {"project", "mode", "issues_read", "nodes", "edges"}
+        """
+        last = self.synced.get(project)
+        mode = "full" if full or not last else "incremental"
+        jql = f'project = "{project}"'
+        if mode == "incremental":
+            try:
+                # Absolute dates in JQL are read in the searching user's timezone, so ask
+                # for a window relative to Jira's clock instead, with a safety margin
+                since = datetime.fromisoformat(last)
+                if since.tzinfo is None:
+                    since = since.replace(tzinfo=timezone.utc)
+                age = (datetime.now(timezone.utc) - since).total_seconds() / 60
+                jql += f' AND updated >= -{max(0, math.ceil(age)) + SYNC_MARGIN_MINUTES}m'
+            except ValueError:
+                logger.warning(f"[GRAPH] Unparseable sync timestamp {last} for {project}, reloading")
+                mode = "full"
+        jql += " ORDER BY updated ASC"
+        try:
+            logger.info(f"[GRAPH] {mode.capitalize()} sync of {project}: {jql}")
+            seen = set()
+            newest = last if mode == "incremental" else None
+            for issue in jira_client.iter_issue_dicts(jql, page_size=page_size, fields=",".join(self.fields)):
+                self.add_issue(issue)
+                seen.add(issue["key"])
+                updated = (issue.get("fields") or {}).get("updated")
+                if updated and (newest is None or updated > newest):
+                    newest = updated
+            if mode == "full":
+                for key in set(self.project_keys(project)) - seen:
+                    self.remove_issue(key)
+            self.synced[project] = newest
+            return {"project": project, "mode": mode, "issues_read": len(seen),
+                    "nodes": len(self.nodes), "edges": len(self._reporters)}
+        except Exception as e:
+            logger.error(f"[GRAPH] Error syncing {project}: {e}\n{traceback.format_exc()}")
+            raise
+
+    def neighbors(self, key: str, link_type: Optional[str] = None, direction: str = "both") -> Set[str]:
+        """Issues linked to key, optionally only through one link type or direction ("out", "in", "both")"""
+        result = set()
+        with self._lock:
+            for adjacency, name in ((self.outward, "out"), (self.inward, "in")):
+                if direction not in (name, "both"):
+                    continue
+                for kind, keys in adjacency.get(key, {}).items():
+                    if link_type is None or kind.lower() == link_type.lower():
+                        result.update(keys)
+        return result
+
+    def node(self, key: str) -> Dict:
+        empty = {"type": None, "summary": None, "status": None, "updated": None}
+        return {"key": key, **(self.nodes.get(key) or self.linked.get(key) or empty)}
+
+    def _type(self, key: str) -> str:
+        return ((self.nodes.get(key) or self.linked.get(key) or {}).get("type") or "").lower()
+
+    def traverse(self, root: str, depth: int = 2, link_types: Optional[List[str]] = None) -> Dict:
+        """
+        Breadth-first walk from root over links in both directions, so
+        epic -> stories -> tests is found whichever way the links point
+        Returns:
+            {"root", "nodes": [{key, type, summary, status, depth}], "edges": [[source, type, target]]}
+        """
+        allowed = {t.lower() for t in link_types} if link_types else None
+        with self._lock:
+            depths = {root: 0}
+            edges = set()
+            queue = deque([root])
+            while queue:
+                key = queue.popleft()
+                if depths[key] >= depth:
+                    continue
+                for adjacency, outward in ((self.outward, True), (self.inward, False)):
+                    for kind, keys in adjacency.get(key, {}).items():
+                        if allowed is not None and kind.lower() not in allowed:
+                            continue
+                        for other in keys:
+                            edges.add((key, kind, other) if outward else (other, kind, key))
+                            if other not in depths:
+                                depths[other] = depths[key] + 1
+                                queue.append(other)
+            nodes = [{**self.node(key), "depth": d} for key, d in sorted(depths.items(), key=lambda item: (item[1], item[0]))]
+        return {"root": root, "nodes": nodes, "edges": [list(edge) for edge in sorted(edges)]}
+
+    def coverage(self, project: str, test_type: str = "Test", link_type: Optional[str] = None,
+                 issue_types: Optional[List[str]] = None) -> Dict:
+        """
+        Test coverage matrix of a project: the tests linked to every non-test issue
+        Args:
+            test_type: Issue type counted as a test
+            link_type: Only count tests linked through this link type
+            issue_types: Only report these issue types (all non-test, non-epic types by default)
+        """
+        test_type = test_type.lower()
+        wanted = {t.lower() for t in issue_types} if issue_types else None
+        matrix, by_epic = {}, {}
+        with self._lock:
+            for key in sorted(self.project_keys(project)):
+                kind = (self.nodes[key].get("type") or "").lower()
+                if kind == test_type or (wanted is None and kind == "epic") or (wanted is not None and kind not in wanted):
+                    continue
+                tests = sorted(other for other in self.neighbors(key, link_type) if self._type(other) == test_type)
+                matrix[key] = tests
+                epics = self.inward.get(key, {}).get(EPIC_LINK) or {None}
+                for epic in epics:
+                    entry = by_epic.setdefault(epic or "No epic", {"issues": 0, "covered": 0})
+                    entry["issues"] += 1
+                    entry["covered"] += bool(tests)
+        covered = sum(1 for tests in matrix.values() if tests)
+        return {
+            "project": project,
+            "synced": self.synced.get(project),
+            "issues": len(matrix),
+            "covered": covered,
+            "coverage": (covered / len(matrix)) if matrix else 0.0,
+            "uncovered": [key for key, tests in matrix.items() if not tests],
+            "by_epic": by_epic,
+            "matrix": matrix,
+        }
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            data = {"synced": self.synced, "linked": self.linked, "issues": {
+                key: {"node": node, "edges": self._reported.get(key, [])} for key, node in self.nodes.items()
+            }}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: str, epic_field: Optional[str] = None) -> "IssueLinkGraph":
+        graph = cls(epic_field)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for key, entry in data.get("issues", {}).items():
+                graph.nodes[key] = entry["node"]
+                edges = [tuple(edge) for edge in entry["edges"]]
+                for edge in edges:
+                    graph._add_edge(edge, key)
+                graph._reported[key] = edges
+            graph.synced = data.get("synced", {})
+            graph.linked = data.get("linked", {})
+        return graph
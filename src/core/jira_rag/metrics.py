@@ -0,0 +1,455 @@
+"""
+Prometheus-style metrics without a client library.
+
+Counters, gauges and histograms keep one value table per thread, so an
+update is a thread-local lookup and an in-place add on a list that only its
+own thread writes: no lock and no string formatting on the hot path. Label
+values are stored as given and only turned into text when /metrics renders.
+
+With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR to a directory
+shared by the workers (and emptied at deploy time, as with prometheus_client).
+Every worker writes its totals to ``metrics_<pid>.json`` there every
+METRICS_FLUSH_INTERVAL seconds (default 5) and on shutdown; the worker that
+answers a scrape adds up all the files. Counters and histograms of exited
+workers are kept, their gauges are dropped.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+from .tracing import TRACER, route_template
+
+logger = logging.getLogger(__name__)
+
+# Starlette appends "; charset=utf-8" to text/ media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Any, ...]
+
+
+class _Child:
+    __slots__ = ("_metric", "_key")
+
+    def __init__(self, metric: "_Metric", key: Labels):
+        self._metric = metric
+        self._key = key
+
+    def _cell(self) -> list:
+        values = self._metric._values()
+        cell = values.get(self._key)
+        if cell is None:
+            cell = values[self._key] = [0.0] * self._metric._width
+        return cell
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._cell()[0] += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._cell()[0] -= amount
+
+    def observe(self, value: float) -> None:
+        cell = self._cell()
+        buckets = self._metric.buckets
+        cell[bisect_left(buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._width = 1
+        self._local = threading.local()
+        # (thread, values) for live threads; values of finished threads are folded into _retired
+        self._shards: List[Tuple[weakref.ref, Dict[Labels, list]]] = []
+        self._retired: Dict[Labels, list] = {}
+        self._children: Dict[Labels, _Child] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _values(self) -> Dict[Labels, list]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), values))
+            return values
+
+    def labels(self, *values) -> _Child:
+        """Child for one label set; keep it around on hot paths to skip the lookup"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children.setdefault(values, _Child(self, values))
+        return child
+
+    def collect(self) -> Dict[Labels, List[float]]:
+        """Sum of every thread's values per label set"""
+        totals: Dict[Labels, List[float]] = {}
+        with self._lock:
+            live = []
+            for thread, values in self._shards:
+                alive = thread() is not None and thread().is_alive()
+                target_table = totals if alive else self._retired
+                for key, cell in values.copy().items():
+                    target = target_table.setdefault(key, [0.0] * self._width)
+                    for idx, value in enumerate(cell):
+                        target[idx] += value
+                if alive:
+                    live.append((thread, values))
+            self._shards = live
+            for key, cell in self._retired.items():
+                target = totals.setdefault(key, [0.0] * self._width)
+                for idx, value in enumerate(cell):
+                    target[idx] += value
+        return totals
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Up/down value such as work in progress; summed over threads and live workers"""
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def track(self, *labels) -> "_InProgress":
+        """Context manager counting the block as in progress"""
+        return _InProgress(self.labels(*labels))
+
+
+class _InProgress:
+    __slots__ = ("_child",)
+
+    def __init__(self, child: _Child):
+        self._child = child
+
+    def __enter__(self):
+        self._child.inc()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.dec()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: "Registry" = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket plus +Inf, then sum and count
+        self._width = len(self.buckets) + 3
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+
+class CallbackMetric:
+    """Values read from elsewhere (e.g. a cache's own counters) when metrics are collected"""
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Labels, float]], registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def collect(self) -> Dict[Labels, List[float]]:
+        try:
+            return {key: [float(value)] for key, value in self.callback().items()}
+        except Exception as e:
+            logger.error(f"[METRICS] Error collecting {self.name}: {e}")
+            return {}
+
+
+class Ratio:
+    """Gauge derived at render time as the share of one label value in a counter (e.g. cache hit ratio)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, source: str, label: str, numerator: str,
+                 registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.source = source
+        self.label = label
+        self.numerator = numerator
+        (registry if registry is not None else REGISTRY).register(self)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register(self, metric) -> None:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    @property
+    def multiprocess_dir(self) -> Optional[str]:
+        return os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """This process's values: name -> {"kind", "labelnames", "samples": [[labels, values]]}"""
+        data = {}
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Ratio):
+                continue
+            data[name] = {"kind": metric.kind, "labelnames": list(metric.labelnames),
+                          "samples": [[list(key), values] for key, values in metric.collect().items()]}
+        return data
+
+    def flush(self) -> Optional[str]:
+        """Write this process's snapshot to the multiprocess directory (no-op without one)"""
+        directory = self.multiprocess_dir
+        if not directory:
+            return None
+        path = os.path.join(directory, f"metrics_{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"pid": os.getpid(), "written": time.time(), "metrics": self.snapshot()}, f)
+            os.replace(tmp, path)
+            return path
+        except Exception as e:
+            logger.error(f"[METRICS] Error writing {path}: {e}")
+            return None
+
+    def start(self, interval: Optional[float] = None) -> None:
+        """Flush periodically in the background when PROMETHEUS_MULTIPROC_DIR is set"""
+        if not self.multiprocess_dir or (self._flusher is not None and self._flusher.is_alive()):
+            return
+        interval = interval or float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self.flush()
+
+        self._flusher = threading.Thread(target=run, name="metrics-flush", daemon=True)
+        self._flusher.start()
+        logger.info(f"[METRICS] Writing worker metrics to {self.multiprocess_dir} every {interval:.0f}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def _merged(self) -> Dict[str, Dict]:
+        """Snapshots of every worker added up (or just this process without a multiprocess directory)"""
+        directory = self.multiprocess_dir
+        if not directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for entry in sorted(os.listdir(directory)):
+                if not (entry.startswith("metrics_") and entry.endswith(".json")):
+                    continue
+                try:
+                    with open(os.path.join(directory, entry), "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                alive = _pid_alive(int(data.get("pid", 0)))
+                snapshots.append({name: metric for name, metric in data.get("metrics", {}).items()
+                                  if alive or metric["kind"] != "gauge"})
+        merged: Dict[str, Dict] = {}
+        for snapshot in snapshots:
+            for name, metric in snapshot.items():
+                target = merged.setdefault(name, {"kind": metric["kind"], "labelnames": metric["labelnames"], "samples": {}})
+                for labels, values in metric["samples"]:
+                    key = tuple(str(value) for value in labels)
+                    cell = target["samples"].setdefault(key, [0.0] * len(values))
+                    for idx, value in enumerate(values):
+                        cell[idx] += value
+        return merged
+
+    def render(self) -> str:
+        """Text exposition format 0.0.4"""
+        merged = self._merged()
+        lines = []
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Ratio):
+                samples = self._ratio_samples(metric, merged.get(metric.source))
+                labelnames = [n for n in self.metrics[metric.source].labelnames if n != metric.label]
+            else:
+                entry = merged.get(name)
+                samples = entry["samples"] if entry else {}
+                labelnames = metric.labelnames
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, values in sorted(samples.items()):
+                if metric.kind == "histogram":
+                    cumulative = 0.0
+                    for bound, count in zip(list(metric.buckets) + ["+Inf"], values[:-2]):
+                        cumulative += count
+                        le = bound if bound == "+Inf" else _format_value(bound)
+                        lines.append(f"{name}_bucket{_format_labels(list(labelnames) + ['le'], list(key) + [le])} "
+                                     f"{_format_value(cumulative)}")
+                    lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(values[-2])}")
+                    lines.append(f"{name}_count{_format_labels(labelnames, key)} {_format_value(values[-1])}")
+                else:
+                    lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(values[0])}")
+        return "\n".join(lines) + "\n"
+
+    def _ratio_samples(self, ratio: Ratio, source: Optional[Dict]) -> Dict[Labels, List[float]]:
+        if not source:
+            return {}
+        position = source["labelnames"].index(ratio.label)
+        totals: Dict[Labels, List[float]] = {}
+        for key, values in source["samples"].items():
+            rest = key[:position] + key[position + 1:]
+            cell = totals.setdefault(rest, [0.0, 0.0])
+            cell[1] += values[0]
+            if key[position] == ratio.numerator:
+                cell[0] += values[0]
+        return {key: [hits / total if total else 0.0] for key, (hits, total) in totals.items()}
+
+
+REGISTRY = Registry()
+
+# Shared by both APIs and the core clients
+HTTP_REQUEST_SECONDS = Histogram(
+    "jira_rag_http_request_duration_seconds", "API request latency by route, method and status code",
+    ["route", "method", "status"])
+UPSTREAM_REQUESTS = Counter(
+    "jira_rag_upstream_requests_total", "Calls to Jira and Dify by service, operation and status code",
+    ["service", "operation", "status"])
+UPSTREAM_SECONDS = Histogram(
+    "jira_rag_upstream_request_duration_seconds", "Latency of calls to Jira and Dify by service and operation",
+    ["service", "operation"])
+RETRIES = Counter("jira_rag_retries_total", "Retried upstream operations", ["service", "operation"])
+INGEST_IN_PROGRESS = Gauge("jira_rag_ingest_jobs_in_progress", "Ingestion jobs currently running", ["kind"])
+DOCUMENTS_INGESTED = Counter("jira_rag_documents_ingested_total", "Documents created in Dify", ["kind"])
+TOKENS_INGESTED = Counter("jira_rag_tokens_ingested_total", "Tokens sent to Dify for embedding", ["kind"])
+CACHE_LOOKUPS = CallbackMetric(
+    "jira_rag_cache_lookups_total", "Cache lookups by cache and result (hit or miss)", "counter", ["cache", "result"],
+    lambda: _cache_lookups())
+CACHE_HIT_RATIO = Ratio("jira_rag_cache_hit_ratio", "Share of cache lookups answered from the cache",
+                        source="jira_rag_cache_lookups_total", label="result", numerator="hit")
+
+# name -> callable returning {"hits", "misses"}, registered by the caches
+_caches: Dict[str, Callable[[], Dict]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], Dict]) -> None:
+    _caches[name] = stats
+
+
+def _cache_lookups() -> Dict[Labels, float]:
+    values = {}
+    for name, stats in list(_caches.items()):
+        data = stats()
+        values[(name, "hit")] = data.get("hits", 0)
+        values[(name, "miss")] = data.get("misses", 0)
+    return values
+
+
+class timed_upstream:
+    """
+    Count and time one upstream call:
+
+        with timed_upstream("dify", "create_document") as call:
+            response = requests.post(...)
+            call.status = response.status_code
+
+    The status stays "error" when the block raises before a status is set.
+    The call is also traced as a "<service>.<operation>" span.
+    """
+    __slots__ = ("service", "operation", "status", "_started", "_span")
+
+    def __init__(self, service: str, operation: str):
+        self.service = service
+        self.operation = operation
+        self.status = "error"
+
+    def __enter__(self) -> "timed_upstream":
+        self._span = TRACER.span(f"{self.service}.{self.operation}")
+        self._span.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None and self.status == "error":
+            self.status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None) or "error"
+        self._span.__exit__(exc_type, exc, tb)
+        UPSTREAM_SECONDS.labels(self.service, self.operation).observe(time.perf_counter() - self._started)
+        UPSTREAM_REQUESTS.labels(self.service, self.operation, self.status).inc()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every request under its route template
+    (e.g. /graph/{project}/coverage), so path parameters do not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(route_template(scope), scope["method"], status[0]).observe(
+                time.perf_counter() - started)
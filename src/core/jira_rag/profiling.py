@@ -0,0 +1,299 @@
+"""
+On-demand CPU profiles of one API request or CLI run.
+
+Two profilers from the standard library:
+
+    cprofile  deterministic (cProfile): exact call counts, but only sees the
+              thread that started it and slows Python code down noticeably
+    sample    statistical: a background thread records the stack of every
+              busy thread every PROFILE_INTERVAL seconds (default 0.005), so
+              threadpool and worker-thread code is included at a small cost
+
+A profile is saved as a raw file (``.prof`` for pstats/snakeviz, or
+``.folded`` collapsed stacks for flamegraph.pl/speedscope) plus a
+``.json`` summary of the top-N hot functions.
+
+On the APIs a request is profiled when it carries ``X-Profile: <value>`` or
+``?profile=<value>``: ``1``/``save`` saves the profile under PROFILE_DIR
+(default ``profiles``) and names the files in an X-Profile-Path header,
+``return`` replaces the response with the summary. Requests without the flag
+only pay a header and query-string check.
+
+The flag is ignored unless PROFILING_ENABLED=1, since profiles write files
+and expose internal function names. With PROFILING_TOKEN set, a flagged
+request must also carry it in an X-Profile-Token header. Only the newest
+PROFILE_MAX_SAVED profiles (default 50) are kept in PROFILE_DIR.
+"""
+from typing import Any, Dict, Optional
+from collections import Counter
+import cProfile
+import glob
+import hmac
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_SUFFIXES = (".prof", ".folded", ".json")
+
+# Leaf frames of threads that are waiting for work rather than running
+_IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("selectors.py", "select"),
+    ("queue.py", "get"), ("thread.py", "_worker"), ("base_events.py", "_run_once"),
+}
+
+
+class SamplingProfiler:
+    """Samples the stacks of all busy threads except its own"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class Profile:
+    """
+    Context manager profiling the block:
+
+        with Profile("sample") as profile:
+            dify.ingest_json_file(path)
+        profile.save("profiles", "ingest")
+    """
+
+    def __init__(self, mode: str = "cprofile", interval: Optional[float] = None):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'. Expected one of: {', '.join(PROFILE_MODES)}")
+        self.mode = mode
+        self.interval = interval or float(os.getenv("PROFILE_INTERVAL", "0.005"))
+        self.seconds = 0.0
+        self._profiler = None
+
+    def __enter__(self) -> "Profile":
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = SamplingProfiler(self.interval)
+            self._profiler.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.seconds = time.perf_counter() - self._started
+        if self.mode == "cprofile":
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+
+    def summary(self, top: int = 30) -> Dict[str, Any]:
+        """
+        Top functions of the profile
+        Returns:
+            cprofile: functions by own time, with calls and own/cumulative seconds
+            sample: functions by samples as the running frame (self) and anywhere on the stack (total)
+        """
+        result: Dict[str, Any] = {"mode": self.mode, "seconds": self.seconds}
+        if self.mode == "cprofile":
+            stats = pstats.Stats(self._profiler)
+            rows = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:top]
+            result["functions"] = [
+                {"function": f"{name} ({filename}:{line})", "calls": calls, "self_seconds": tottime,
+                 "cumulative_seconds": cumtime}
+                for (filename, line, name), (_, calls, tottime, cumtime, _) in rows
+            ]
+            return result
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self._profiler.stacks.items():
+            own[stack[-1]] += count
+            for code in set(stack):
+                total[code] += count
+        samples = self._profiler.samples or 1
+        result["samples"] = self._profiler.samples
+        result["interval"] = self.interval
+        result["functions"] = [
+            {"function": _label(code), "self_samples": count, "total_samples": total[code],
+             "self_share": count / samples, "total_share": total[code] / samples}
+            for code, count in own.most_common(top)
+        ]
+        return result
+
+    def save(self, directory: str, name: str, top: int = 30) -> Dict[str, str]:
+        """
+        Write the raw profile and the summary as <directory>/<name>.{prof|folded,json}
+        Returns:
+            {"profile": path, "summary": path}
+        """
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, name)
+        if self.mode == "cprofile":
+            profile_path = f"{base}.prof"
+            self._profiler.dump_stats(profile_path)
+        else:
+            profile_path = f"{base}.folded"
+            with open(profile_path, "w", encoding="utf-8") as f:
+                for stack, count in self._profiler.stacks.items():
+                    f.write(";".join(_label(code) for code in stack) + f" {count}\n")
+        summary_path = f"{base}.json"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(top), f, indent=2)
+        logger.info(f"[PROFILE] Saved {profile_path} and {summary_path}")
+        return {"profile": profile_path, "summary": summary_path}
+
+
+def profile_name(label: str) -> str:
+    """File name stem from a timestamp and a label such as a route"""
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_") or "run"
+    now = time.time()
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}_{slug}_{os.getpid()}"
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests flagged with an X-Profile header or a
+    profile query parameter. One request is profiled at a time; a flagged
+    request arriving meanwhile runs unprofiled with ``X-Profile: busy``.
+
+    PROFILE_MODE defaults to sample: sync endpoints run in the threadpool,
+    which cprofile would not see from the event loop thread.
+    """
+
+    def __init__(self, app, mode: Optional[str] = None, directory: Optional[str] = None, top: int = 30,
+                 max_saved: Optional[int] = None):
+        self.app = app
+        self.mode = mode or os.getenv("PROFILE_MODE", "sample")
+        if self.mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{self.mode}'. Expected one of: {', '.join(PROFILE_MODES)}")
+        self.directory = directory or os.getenv("PROFILE_DIR", "profiles")
+        self.top = top
+        self.max_saved = max_saved if max_saved is not None else int(os.getenv("PROFILE_MAX_SAVED", "50"))
+        self.enabled = os.getenv("PROFILING_ENABLED", "0") == "1"
+        self.token = os.getenv("PROFILING_TOKEN") or None
+        self._busy = threading.Lock()
+
+    def _flag(self, scope) -> Optional[str]:
+        flag, token = None, None
+        for name, value in scope.get("headers") or ():
+            if name == b"x-profile":
+                flag = value.decode("latin-1").strip().lower()
+            elif name == b"x-profile-token":
+                token = value.decode("latin-1").strip()
+        if flag is None:
+            query = scope.get("query_string") or b""
+            if b"profile=" in query:
+                match = re.search(rb"(?:^|&)profile=([^&]*)", query)
+                if match:
+                    flag = match.group(1).decode("latin-1").strip().lower()
+        if flag and self.token and not hmac.compare_digest(token or "", self.token):
+            logger.warning(f"[PROFILE] Ignoring a profile flag without a valid X-Profile-Token on {scope.get('path')}")
+            return None
+        return flag
+
+    async def __call__(self, scope, receive, send):
+        flag = self._flag(scope) if self.enabled and scope["type"] == "http" else None
+        if flag in (None, "", "0", "false"):
+            await self.app(scope, receive, send)
+            return
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, self._with_headers(send, [(b"x-profile", b"busy")]))
+            return
+        try:
+            if flag == "return":
+                await self._profile_and_return(scope, receive, send)
+            else:
+                await self._profile_and_save(scope, receive, send)
+        finally:
+            self._busy.release()
+
+    @staticmethod
+    def _with_headers(send, headers):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + headers)
+            await send(message)
+        return send_wrapper
+
+    async def _profile_and_save(self, scope, receive, send):
+        # Headers go out before the body is done, so the file names are decided up front
+        name = profile_name(f"{scope['method']} {scope['path']}")
+        ext = "prof" if self.mode == "cprofile" else "folded"
+        path = os.path.join(self.directory, f"{name}.{ext}")
+        send = self._with_headers(send, [(b"x-profile-path", path.encode("latin-1"))])
+        profile = Profile(self.mode)
+        try:
+            with profile:
+                await self.app(scope, receive, send)
+        finally:
+            try:
+                profile.save(self.directory, name, self.top)
+                self._rotate()
+            except Exception as e:
+                logger.error(f"[PROFILE] Error saving profile {name}: {e}")
+
+    def _rotate(self) -> None:
+        """Delete the oldest saved profiles beyond max_saved"""
+        stems = {}
+        for path in glob.glob(os.path.join(self.directory, "*")):
+            stem, suffix = os.path.splitext(path)
+            if suffix in PROFILE_SUFFIXES:
+                stems.setdefault(stem, []).append(path)
+        # Names start with a timestamp, so they sort oldest first
+        for stem in sorted(stems)[:max(0, len(stems) - self.max_saved)]:
+            for path in stems[stem]:
+                os.remove(path)
+
+    async def _profile_and_return(self, scope, receive, send):
+        response = {"status_code": None, "body_bytes": 0}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status_code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body_bytes"] += len(message.get("body", b""))
+
+        with Profile(self.mode) as profile:
+            await self.app(scope, receive, capture)
+        body = json.dumps({"response": response, "profile": profile.summary(self.top)}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
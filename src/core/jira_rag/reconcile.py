@@ -0,0 +1,140 @@
+"""
+Reconciliation sweep between a Dify dataset and the live set of Jira issues.
+
+The dataset's document list is fetched page by page (pages after the first
+in parallel), issue documents are matched to their key by name, and two kinds
+of stale documents are deleted:
+
+    orphans     documents of issues that no longer exist (deleted or moved)
+    duplicates  all but the newest document of an issue ingested more than once
+
+Documents that are not issue documents (project summaries, manual uploads)
+are never touched.
+"""
+from typing import List, Dict, Optional, Iterable, Set
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
+import time
+import traceback
+
+from .dify_integration import ISSUE_DOCUMENT_NAME_RE
+from .issue_store import IssueStore, is_store_path, extract_column
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+
+def live_keys_from_files(paths: Iterable[str]) -> Set[str]:
+    """Issue keys in dataset JSON/JSONL or .jstore files"""
+    from .cleaning import iter_raw_issues
+
+    keys = set()
+    for path in paths:
+        if is_store_path(path):
+            with IssueStore(path) as store:
+                keys.update(key for key in store.column('key') if key)
+        else:
+            keys.update(key for key in (extract_column(issue, 'key') for issue in iter_raw_issues(path)) if key)
+    return keys
+
+
+def live_keys_from_jira(jira_client, jql_query: str) -> Set[str]:
+    """Issue keys matching a JQL query, fetched without any issue fields"""
+    return {issue["key"] for issue in jira_client.iter_issue_dicts(jql_query, page_size=1000, fields="key")}
+
+
+def list_all_documents(dify, workers: int = 4) -> List[Dict]:
+    """Fetch the whole document list; pages after the first are requested concurrently"""
+    first = dify.list_documents_page(1, PAGE_SIZE)
+    documents = list(first.get("data", []))
+    if not first.get("has_more"):
+        return documents
+    total = first.get("total") or 0
+    pages = max(2, math.ceil(total / PAGE_SIZE))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for body in pool.map(lambda page: dify.list_documents_page(page, PAGE_SIZE), range(2, pages + 1)):
+            documents.extend(body.get("data", []))
+    # The list may have grown while paging
+    page = pages + 1
+    while body.get("has_more"):
+        body = dify.list_documents_page(page, PAGE_SIZE)
+        documents.extend(body.get("data", []))
+        page += 1
+    return documents
+
+
+def find_stale_documents(documents: List[Dict], live_keys: Set[str], project_keys: Optional[Set[str]] = None) -> Dict[str, List[Dict]]:
+    """
+    Split issue documents into orphans and duplicates
+    Args:
+        documents: Document dicts from the Dify document list
+        live_keys: Keys of issues that still exist
+        project_keys: Only consider documents of these projects (all if None), so a
+                      sweep against one project's issues leaves other projects alone
+    Returns:
+        {"orphans": [...], "duplicates": [...]}, each entry {"id", "key", "name"}
+    """
+    by_key: Dict[str, List[Dict]] = {}
+    for document in documents:
+        match = ISSUE_DOCUMENT_NAME_RE.match(document.get("name") or "")
+        if not match:
+            continue
+        key = match.group(1)
+        if project_keys is not None and key.rsplit('-', 1)[0] not in project_keys:
+            continue
+        by_key.setdefault(key, []).append(document)
+
+    orphans, duplicates = [], []
+    for key, docs in sorted(by_key.items()):
+        entries = [{"id": d["id"], "key": key, "name": d.get("name")} for d in
+                   sorted(docs, key=lambda d: d.get("created_at") or 0, reverse=True)]
+        if key not in live_keys:
+            orphans.extend(entries)
+        elif len(entries) > 1:
+            duplicates.extend(entries[1:])
+    return {"orphans": orphans, "duplicates": duplicates}
+
+
+def reconcile(dify, live_keys: Set[str], project_keys: Optional[Set[str]] = None, dry_run: bool = False,
+              workers: int = 8, rate: Optional[float] = 20.0) -> Dict:
+    """
+    Delete documents of issues that no longer exist and duplicate issue documents
+    Args:
+        dify: DifyIntegration of the dataset to sweep
+        live_keys: Keys of issues that still exist
+        project_keys: Restrict the sweep to these projects
+        dry_run: Only report what would be deleted
+        workers: Concurrent list and delete requests
+        rate: Maximum delete requests per second
+    Returns:
+        Report with document counts, the removed orphans and duplicates, and failures
+    """
+    started = time.perf_counter()
+    try:
+        logger.info(f"[RECONCILE] Listing documents of dataset {dify.dataset_id}")
+        documents = list_all_documents(dify, workers=min(workers, 4))
+        stale = find_stale_documents(documents, live_keys, project_keys)
+        report = {
+            "dataset_id": dify.dataset_id,
+            "documents": len(documents),
+            "live_issues": len(live_keys),
+            "orphans": stale["orphans"],
+            "duplicates": stale["duplicates"],
+            "dry_run": dry_run,
+            "deleted": 0,
+            "failed": {},
+        }
+        to_delete = [entry["id"] for entry in stale["orphans"] + stale["duplicates"]]
+        logger.info(f"[RECONCILE] {len(documents)} documents: {len(stale['orphans'])} orphans, "
+                    f"{len(stale['duplicates'])} duplicates")
+        if to_delete and not dry_run:
+            result = dify.delete_documents(to_delete, max_workers=workers, rate=rate)
+            report["deleted"] = len(result["deleted"])
+            report["failed"] = result["failed"]
+        report["seconds"] = time.perf_counter() - started
+        return report
+    except Exception as e:
+        logger.error(f"[RECONCILE] Error reconciling dataset {dify.dataset_id}: {e}\n{traceback.format_exc()}")
+        raise
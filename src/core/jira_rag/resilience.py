@@ -0,0 +1,219 @@
+"""
+Circuit breaking and hedged reads for upstream HTTP calls.
+
+A CircuitBreaker counts consecutive failures of one upstream (transport
+errors, timeouts, 5xx and 429 answers). After ``failures`` of them it opens:
+calls fail at once with CircuitOpenError for ``reset_timeout`` seconds,
+then a single probe call is let through (half-open). A successful probe
+closes the circuit, a failed one opens it again. Breakers are shared by all
+clients of the same upstream in the process, so a stuck server is noticed
+once and not by every ingest worker separately.
+
+A hedged call sends a second, identical request when the first has not
+answered after a percentile of the operation's recent latencies, and
+returns whichever answer arrives first. Only idempotent reads may be
+hedged; the slower request is not cancelled and runs to its timeout.
+Requests only go to idle workers of the shared hedge pool and never queue:
+when every worker is busy, typically with reads stuck on a slow upstream,
+the call runs on the calling thread and no hedge is sent.
+"""
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+import logging
+import math
+import threading
+import time
+
+from .metrics import CallbackMetric, Counter
+from .tracing import propagate
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WORKERS = 16
+
+_rejected = Counter("jira_rag_circuit_rejected_total", "Upstream calls failed fast by an open circuit breaker", ["breaker"])
+HEDGED_REQUESTS = Counter("jira_rag_hedged_requests_total",
+                          "Hedged reads by operation and which request answered first (first or hedge)",
+                          ["service", "operation", "winner"])
+CIRCUIT_OPEN = CallbackMetric("jira_rag_circuit_open", "1 while a circuit breaker is open or half-open", "gauge",
+                              ["breaker"], lambda: {(name,): stats["state"] != CLOSED for name, stats in breaker_stats().items()})
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open after repeated failures, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            name: Upstream name, used in errors, logs and metrics
+            failures: Consecutive failures that open the circuit (0 never opens it)
+            reset_timeout: Seconds the circuit stays open before a probe call
+        """
+        self.name = name
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> None:
+        """Let a call through, or raise CircuitOpenError while the circuit is open or already probing"""
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining <= 0 and not self._probing:
+                self._state = HALF_OPEN
+                self._probing = True
+                logger.info(f"[BREAKER] {self.name}: half-open, probing")
+                return
+        _rejected.labels(self.name).inc()
+        raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def record(self, success: bool) -> None:
+        """Outcome of a call let through by allow"""
+        with self._lock:
+            self._probing = False
+            if success:
+                if self._state != CLOSED:
+                    logger.info(f"[BREAKER] {self.name}: closed")
+                self._state = CLOSED
+                self._consecutive = 0
+                return
+            self._consecutive += 1
+            if self._state == HALF_OPEN or (self.failures and self._consecutive >= self.failures):
+                if self._state != OPEN:
+                    logger.warning(f"[BREAKER] {self.name}: open after {self._consecutive} consecutive failures, "
+                                   f"failing fast for {self.reset_timeout:.0f}s")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        state = self.state
+        with self._lock:
+            return {"state": state, "consecutive_failures": self._consecutive,
+                    "failures": self.failures, "reset_timeout": self.reset_timeout}
+
+
+class LatencyWindow:
+    """The most recent call latencies of one operation"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = HEDGE_MIN_SAMPLES) -> Optional[float]:
+        """p-th percentile (0-100) of the window, or None before min_samples calls"""
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyWindow] = {}
+_registry_lock = threading.Lock()
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_slots = threading.Semaphore(HEDGE_WORKERS)
+
+
+def breaker(name: str, failures: int = 5, reset_timeout: float = 30.0) -> CircuitBreaker:
+    """The process-wide breaker of an upstream, created with these settings on first use"""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, failures, reset_timeout)
+        return _breakers[name]
+
+
+def latency_window(name: str) -> LatencyWindow:
+    """The process-wide latency window of an operation"""
+    with _registry_lock:
+        if name not in _latencies:
+            _latencies[name] = LatencyWindow()
+        return _latencies[name]
+
+
+def breaker_stats() -> Dict[str, Dict]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.stats() for b in breakers}
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _registry_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+        return _hedge_pool
+
+
+def _submit(call: Callable[[], T]) -> Optional[Future]:
+    """Start call on an idle hedge worker; None if every worker is busy"""
+    if not _hedge_slots.acquire(blocking=False):
+        return None
+
+    def run() -> T:
+        try:
+            return call()
+        finally:
+            _hedge_slots.release()
+    return _pool().submit(run)
+
+
+def hedged(call: Callable[[], T], delay: float) -> Tuple[T, Optional[str]]:
+    """
+    Run call, and once more if the first run has not returned after delay seconds.
+    With no idle hedge worker the call runs on the calling thread, unhedged.
+    Returns:
+        (result of the first run to succeed, None if no hedge was sent else "first" or "hedge")
+    """
+    call = propagate(call)
+    first = _submit(call)
+    if first is None:
+        return call(), None
+    try:
+        return first.result(timeout=delay), None
+    except FutureTimeout:
+        pass
+    second = _submit(call)
+    if second is None:
+        return first.result(), None
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result(), "hedge" if future is second else "first"
+            error = error or future.exception()
+    raise error
+
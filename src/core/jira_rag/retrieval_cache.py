@@ -0,0 +1,131 @@
+from typing import Dict, Optional, Tuple, Any
+from collections import OrderedDict
+import threading
+import json
+import time
+import os
+import logging
+
+from .metrics import register_cache
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalCache:
+    """
+    In-process LRU + TTL cache for Dify dataset retrieval results.
+
+    Entries are keyed by (dataset_id, normalized query, retrieval params) and
+    tagged with the dataset generation at the time they were stored. Every
+    document write bumps the dataset generation, so entries written before the
+    change are treated as misses and evicted on access.
+
+    Dify indexes new documents asynchronously, so a result retrieved shortly
+    after a write may not contain them yet. For settle_seconds after a write
+    results are kept for settling_ttl seconds only.
+
+    Invalidation only sees writes made through this process: ingests from the
+    CLI or another uvicorn worker reach the cache through the TTL alone.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0, settle_seconds: float = 60.0,
+                 settling_ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.settle_seconds = settle_seconds
+        self.settling_ttl = settling_ttl
+        # key -> (stored at, generation, value, ttl)
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, int, Any, float]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._written_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Lowercase and collapse whitespace so trivially different queries share an entry"""
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def _params_key(params: Optional[Dict]) -> str:
+        return json.dumps(params or {}, sort_keys=True, separators=(",", ":"))
+
+    def _make_key(self, dataset_id: str, query: str, params: Optional[Dict]) -> Tuple[str, str, str]:
+        return (dataset_id, self.normalize_query(query), self._params_key(params))
+
+    def get(self, dataset_id: str, query: str, params: Optional[Dict] = None) -> Optional[Any]:
+        key = self._make_key(dataset_id, query, params)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, generation, value, ttl = entry
+            if now - stored_at > ttl or generation != self._generations.get(dataset_id, 0):
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, dataset_id: str, query: str, params: Optional[Dict], value: Any, generation: Optional[int] = None) -> None:
+        """
+        Store a retrieval result.
+        Args:
+            generation: Dataset generation observed before the upstream call was made.
+                        If a write happened in the meantime the result is not cached.
+        """
+        key = self._make_key(dataset_id, query, params)
+        now = time.monotonic()
+        with self._lock:
+            current = self._generations.get(dataset_id, 0)
+            if generation is not None and generation != current:
+                return
+            # Documents written in the last settle_seconds may still be indexing
+            written_at = self._written_at.get(dataset_id)
+            settling = written_at is not None and now - written_at < self.settle_seconds
+            self._entries[key] = (now, current, value, self.settling_ttl if settling else self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generation(self, dataset_id: str) -> int:
+        with self._lock:
+            return self._generations.get(dataset_id, 0)
+
+    def bump_generation(self, dataset_id: str) -> int:
+        """Invalidate every cached result for a dataset after its documents changed"""
+        with self._lock:
+            self._generations[dataset_id] = self._generations.get(dataset_id, 0) + 1
+            self._written_at[dataset_id] = time.monotonic()
+            return self._generations[dataset_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "settle_seconds": self.settle_seconds,
+                "settling_ttl": self.settling_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+            }
+
+
+retrieval_cache = RetrievalCache(
+    max_entries=int(os.getenv("DIFY_RETRIEVAL_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("DIFY_RETRIEVAL_CACHE_TTL", "300")),
+    settle_seconds=float(os.getenv("DIFY_RETRIEVAL_CACHE_SETTLE", "60")),
+    settling_ttl=float(os.getenv("DIFY_RETRIEVAL_CACHE_SETTLING_TTL", "5")),
+)
+register_cache("retrieval", retrieval_cache.stats)
@@ -0,0 +1,269 @@
+"""
+Project-sharded Dify datasets.
+
+A shard map assigns each Jira project to a shard and each shard to a Dify
+dataset. Ingestion is routed by issue key prefix, and retrieval only fans out
+to the shards of the projects a query is about, in parallel, merging the
+records by score.
+
+Shard map file (``DIFY_SHARD_MAP``)::
+
+    {
+      "default": null,                      # shard for unmapped projects; null = one shard per project
+      "projects": {"REST": "ecosystem", "QUID": "quidditch"},
+      "datasets": {"ecosystem": "<dataset id>", "quidditch": null}
+    }
+
+Shards without a dataset id get a new dataset on first write and the id is
+saved back to the file.
+"""
+from typing import List, Dict, Optional, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import json
+import logging
+import os
+import re
+import threading
+import traceback
+
+from .dify_integration import DifyIntegration, collect_responses
+from .issue_store import IssueStore, is_store_path, extract_column
+from .compression import open_text, base_path
+from .tracing import propagate
+
+logger = logging.getLogger(__name__)
+
+ISSUE_KEY_RE = re.compile(r'\b([A-Z][A-Z0-9_]+)-\d+\b')
+PROJECT_WORD_RE = re.compile(r'\b[A-Z][A-Z0-9_]+\b')
+
+
+def project_of(issue) -> Optional[str]:
+    """Project key of an issue, taken from its key prefix"""
+    key = issue.key if hasattr(issue, 'key') else extract_column(issue, 'key')
+    return key.rsplit('-', 1)[0] if key and '-' in key else None
+
+
+class ShardMap:
+    def __init__(self, projects: Optional[Dict[str, str]] = None, datasets: Optional[Dict[str, Optional[str]]] = None,
+                 default: Optional[str] = None, path: Optional[str] = None):
+        self.projects = projects or {}
+        self.datasets = datasets or {}
+        self.default = default
+        self.path = path
+        self._lock = threading.Lock()
+
+    def shard_for(self, project: str) -> str:
+        return self.projects.get(project) or self.default or project
+
+    def shards_for(self, projects: Iterable[str]) -> List[str]:
+        return sorted({self.shard_for(p) for p in projects})
+
+    @property
+    def shards(self) -> List[str]:
+        return sorted(set(self.datasets) | set(self.projects.values()) | ({self.default} if self.default else set()))
+
+    @property
+    def known_projects(self) -> List[str]:
+        return sorted(self.projects)
+
+    def set_dataset(self, shard: str, dataset_id: str) -> None:
+        with self._lock:
+            self.datasets[shard] = dataset_id
+            if self.path:
+                self.save(self.path)
+
+    def to_dict(self) -> Dict:
+        return {"default": self.default, "projects": self.projects, "datasets": self.datasets}
+
+    def save(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "ShardMap":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get("projects"), data.get("datasets"), data.get("default"), path=path)
+
+    @classmethod
+    def from_extraction_summary(cls, path: str, by: str = "category") -> "ShardMap":
+        """
+        Build a shard map from extraction_summary.json.
+        Args:
+            by: "project" (one shard per project), "collection" (per export collection)
+                or "category" (per entry of project_categories, falling back to the collection)
+        """
+        if by not in ("project", "collection", "category"):
+            raise ValueError(f"Unknown sharding '{by}'. Expected project, collection or category")
+        with open(path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        category_of = {
+            collection: category
+            for category, collections in summary.get("project_categories", {}).items()
+            for collection in collections
+        }
+        projects = {}
+        for collection, info in summary.get("projects_processed", {}).items():
+            for project in info.get("projects", {}):
+                if by == "project":
+                    projects[project] = project
+                elif by == "collection":
+                    projects[project] = collection
+                else:
+                    projects[project] = category_of.get(collection, collection)
+        return cls(projects, {shard: None for shard in set(projects.values())})
+
+
+class ShardedDifyIntegration:
+    """
+    Routes ingestion and retrieval across one DifyIntegration per shard.
+    Exposes the same ingest methods as DifyIntegration.
+    """
+
+    def __init__(self, shard_map: Optional[ShardMap] = None, api_key: str = None, base_url: str = None,
+                 advanced_ingestion: bool = False, chunking: str = None, max_workers: int = 8):
+        if shard_map is None:
+            path = os.getenv('DIFY_SHARD_MAP')
+            if not path:
+                raise ValueError("Missing shard map. Please provide it or set DIFY_SHARD_MAP environment variable.")
+            shard_map = ShardMap.load(path)
+        self.shard_map = shard_map
+        self.api_key = api_key
+        self.base_url = base_url
+        self.advanced_ingestion = advanced_ingestion
+        self.chunking = chunking
+        self.max_workers = max_workers
+        self._clients: Dict[str, DifyIntegration] = {}
+        self._lock = threading.Lock()
+
+    def client(self, shard: str) -> DifyIntegration:
+        """DifyIntegration for a shard, creating the shard's dataset on first use"""
+        with self._lock:
+            if shard not in self._clients:
+                dataset_id = self.shard_map.datasets.get(shard)
+                if dataset_id:
+                    client = DifyIntegration(api_key=self.api_key, base_url=self.base_url, dataset_id=dataset_id,
+                                             advanced_ingestion=self.advanced_ingestion, chunking=self.chunking)
+                else:
+                    # Any non-empty id skips dataset creation in the constructor
+                    client = DifyIntegration(api_key=self.api_key, base_url=self.base_url, dataset_id="pending",
+                                             advanced_ingestion=self.advanced_ingestion, chunking=self.chunking)
+                    client.dataset_id = client.create_dataset(name=f"Jira_Shard_{shard}")
+                    self.shard_map.set_dataset(shard, client.dataset_id)
+                    logger.info(f"[SHARD] Created dataset {client.dataset_id} for shard {shard}")
+                self._clients[shard] = client
+            return self._clients[shard]
+
+    def _group(self, issues: Iterable) -> Dict[str, List]:
+        groups: Dict[str, List] = {}
+        for issue in issues:
+            project = project_of(issue)
+            if not project:
+                logger.warning("[SHARD] Skipping issue without a project key")
+                continue
+            groups.setdefault(self.shard_map.shard_for(project), []).append(issue)
+        return groups
+
+    def ingest_issues(self, issues: Iterable, advanced_ingestion: bool = False) -> List[Dict]:
+        """Ingest issues, each into the dataset of its project's shard"""
+        return collect_responses(self.iter_ingest_issues(issues, advanced_ingestion=advanced_ingestion, raw=True))
+
+    def iter_ingest_issues(self, issues: Iterable, advanced_ingestion: bool = False, raw: bool = False) -> Iterator[Dict]:
+        """Ingest issues shard by shard, yielding each outcome tagged with its shard"""
+        for shard, shard_issues in self._group(issues).items():
+            logger.info(f"[SHARD] Routing {len(shard_issues)} issues to shard {shard}")
+            for outcome in self.client(shard).iter_ingest_issues(shard_issues, advanced_ingestion=advanced_ingestion, raw=raw):
+                outcome["shard"] = shard
+                yield outcome
+
+    def ingest_json_file(self, json_file_path: str, advanced_ingestion: bool = False, summary_mode: str = "per_field") -> List[Dict]:
+        """Ingest a dataset JSON or .jstore file, routing each issue (or the summary) to its shard"""
+        return collect_responses(self.iter_ingest_json_file(json_file_path, advanced_ingestion=advanced_ingestion,
+                                                            summary_mode=summary_mode, raw=True))
+
+    def iter_ingest_json_file(self, json_file_path: str, advanced_ingestion: bool = False, summary_mode: str = "per_field",
+                              raw: bool = False) -> Iterator[Dict]:
+        """
+        Ingest a dataset JSON (plain or gzip/zstd compressed) or .jstore file shard by shard,
+        yielding one outcome per issue or summary document
+        """
+        from .cleaning import iter_raw_issues
+
+        try:
+            if base_path(json_file_path).stem.endswith('_SUMMARY'):
+                if is_store_path(json_file_path):
+                    with IssueStore(json_file_path) as store:
+                        data = store[0]
+                else:
+                    with open_text(json_file_path) as f:
+                        data = json.load(f)
+                    data = data[0] if isinstance(data, list) else data
+                project = (data.get('key') or '').replace('-SUMMARY', '') or Path(json_file_path).stem.split('_')[0]
+                shard = self.shard_map.shard_for(project)
+                for outcome in self.client(shard)._iter_summary_file(data, json_file_path, mode=summary_mode, raw=raw):
+                    outcome["shard"] = shard
+                    yield outcome
+                return
+            if is_store_path(json_file_path):
+                with IssueStore(json_file_path) as store:
+                    yield from self.iter_ingest_issues(store, advanced_ingestion=advanced_ingestion, raw=raw)
+                return
+            with open_text(json_file_path) as f:
+                head = f.read(4096).lstrip()
+            if head.startswith('{') and '"issues"' in head:
+                with open_text(json_file_path) as f:
+                    issues = json.load(f)['issues']
+                yield from self.iter_ingest_issues(issues, advanced_ingestion=advanced_ingestion, raw=raw)
+                return
+            yield from self.iter_ingest_issues(iter_raw_issues(json_file_path), advanced_ingestion=advanced_ingestion, raw=raw)
+        except Exception as e:
+            logger.error(f"[SHARD] Error ingesting {json_file_path}: {e}\n{traceback.format_exc()}")
+            raise
+
+    def route_query(self, query: str, projects: Optional[List[str]] = None) -> List[str]:
+        """
+        Shards relevant to a query: the given projects, else the known projects named
+        in the query (issue keys or project keys), else every shard with a dataset
+        """
+        searchable = [shard for shard in self.shard_map.shards if self.shard_map.datasets.get(shard)]
+        if projects:
+            return [shard for shard in self.shard_map.shards_for(projects) if self.shard_map.datasets.get(shard)]
+        known = set(self.shard_map.known_projects)
+        if not self.shard_map.default:
+            # One shard per unmapped project, named after it
+            known |= set(searchable)
+        # Tokens such as UTF-8 or SHA-256 look like issue keys but name no project
+        mentioned = {project for project in ISSUE_KEY_RE.findall(query) if project in known}
+        mentioned |= {word for word in PROJECT_WORD_RE.findall(query) if word in known}
+        shards = [shard for shard in self.shard_map.shards_for(mentioned) if self.shard_map.datasets.get(shard)]
+        return shards or searchable
+
+    def retrieve(self, query: str, projects: Optional[List[str]] = None, retrieval_model: Optional[Dict] = None,
+                 top_k: Optional[int] = None, use_cache: bool = True) -> Dict:
+        """
+        Query the relevant shards in parallel and merge their records by score
+        Returns:
+            {"query", "records", "shards", "errors"}
+        """
+        shards = self.route_query(query, projects)
+        top_k = top_k or (retrieval_model or {}).get("top_k") or 8
+        logger.info(f"[SHARD] Retrieving from shards {shards}")
+
+        @propagate
+        def search(shard: str) -> Dict:
+            return self.client(shard).retrieve(query, retrieval_model=retrieval_model, use_cache=use_cache)
+
+        records, errors = [], {}
+        if shards:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(shards))) as pool:
+                futures = {shard: pool.submit(search, shard) for shard in shards}
+                for shard, future in futures.items():
+                    try:
+                        for record in future.result().get("records", []):
+                            records.append({**record, "shard": shard})
+                    except Exception as e:
+                        logger.error(f"[SHARD] Retrieval failed on shard {shard}: {e}")
+                        errors[shard] = str(e)
+        records.sort(key=lambda r: r.get("score") or 0.0, reverse=True)
+        return {"query": {"content": query}, "records": records[:top_k], "shards": shards, "errors": errors}
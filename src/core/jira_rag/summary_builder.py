@@ -0,0 +1,293 @@
+"""
+Incremental builder for the per-project ``*_SUMMARY.json`` aggregates.
+
+Each project keeps one small entry per issue (reporter, assignee, components,
+updated) so states can be merged, updated and have issues removed without
+rescanning the source. Derived fields are recomputed from those entries and
+compared with what was last uploaded so only changed summary documents are
+sent to Dify again.
+"""
+from typing import List, Dict, Optional, Iterable, Iterator
+from pathlib import Path
+from datetime import datetime, timezone
+import json
+import math
+import logging
+import traceback
+
+from .compression import base_path, compress, compression_of, open_text
+from .issue_store import IssueStore, is_store_path, extract_column
+
+logger = logging.getLogger(__name__)
+
+# Minutes re-read before the newest aggregated update by jira_delta_jql
+DELTA_MARGIN_MINUTES = 5
+
+SUMMARY_FIELDS = ["summary", "contributors", "assignees", "reporters", "components", "issue_count", "type"]
+
+
+def _issue_dict(issue) -> Dict:
+    # JiraIssue objects only carry flat fields
+    return issue.dict() if hasattr(issue, 'dict') else issue
+
+
+def _components_of(issue: Dict) -> List[str]:
+    components = issue.get('components')
+    if components is None:
+        components = (issue.get('fields') or {}).get('components')
+    names = []
+    for component in components or []:
+        name = component.get('name') if isinstance(component, dict) else component
+        if name:
+            names.append(name)
+    return names
+
+
+def _person(issue: Dict, role: str) -> Optional[str]:
+    # Summaries list display names; Jira server payloads also carry a login 'name'
+    for container in (issue.get('fields') or {}, issue):
+        value = container.get(role)
+        if isinstance(value, dict) and value.get('displayName'):
+            return value['displayName']
+    return extract_column(issue, role)
+
+
+class ProjectSummaryState:
+    """Mergeable aggregate state for a single project"""
+
+    def __init__(self, project: str):
+        self.project = project
+        # issue key -> [reporter, assignee, components, updated]
+        self.issues: Dict[str, list] = {}
+        self.summary: Optional[str] = None
+        self.uploaded: Dict[str, str] = {}
+        self.documents: Dict[str, str] = {}
+
+    def add(self, key: str, reporter: Optional[str], assignee: Optional[str], components: List[str], updated: Optional[str]) -> bool:
+        """Insert or replace an issue entry; older updates than the stored one are ignored"""
+        current = self.issues.get(key)
+        if current is not None and current[3] and updated and updated < current[3]:
+            return False
+        entry = [reporter, assignee, sorted(set(components)), updated]
+        if entry == current:
+            return False
+        self.issues[key] = entry
+        return True
+
+    def remove(self, key: str) -> bool:
+        return self.issues.pop(key, None) is not None
+
+    def merge(self, other: "ProjectSummaryState") -> None:
+        for key, (reporter, assignee, components, updated) in other.issues.items():
+            self.add(key, reporter, assignee, components, updated)
+        self.summary = other.summary or self.summary
+
+    @property
+    def last_updated(self) -> Optional[str]:
+        return max((entry[3] for entry in self.issues.values() if entry[3]), default=None)
+
+    def fields(self) -> Dict:
+        reporters = {entry[0] for entry in self.issues.values() if entry[0]}
+        assignees = {entry[1] for entry in self.issues.values() if entry[1]}
+        components = {name for entry in self.issues.values() for name in entry[2]}
+        return {
+            "summary": self.summary or f"Project {self.project} contains {len(self.issues)} issues.",
+            "contributors": sorted(reporters | assignees),
+            "assignees": sorted(assignees),
+            "reporters": sorted(reporters),
+            "components": sorted(components),
+            "issue_count": len(self.issues),
+            "type": "project_summary",
+        }
+
+    def changed_fields(self) -> List[str]:
+        """Summary fields whose value differs from the last upload"""
+        fields = self.fields()
+        return [name for name in SUMMARY_FIELDS if json.dumps(fields[name]) != self.uploaded.get(name)]
+
+    def mark_uploaded(self, field: str, document_id: Optional[str] = None) -> None:
+        self.uploaded[field] = json.dumps(self.fields()[field])
+        if document_id:
+            self.documents[field] = document_id
+
+    def to_dict(self) -> Dict:
+        return {"issues": self.issues, "summary": self.summary, "uploaded": self.uploaded, "documents": self.documents}
+
+    @classmethod
+    def from_dict(cls, project: str, data: Dict) -> "ProjectSummaryState":
+        state = cls(project)
+        state.issues = data.get("issues", {})
+        state.summary = data.get("summary")
+        state.uploaded = data.get("uploaded", {})
+        state.documents = data.get("documents", {})
+        return state
+
+
+class SummaryBuilder:
+    """
+    Computes project summaries in one streaming pass over issue files, stores
+    or a Jira iterator, keeping mergeable per-project state between runs.
+    """
+
+    def __init__(self):
+        self.projects: Dict[str, ProjectSummaryState] = {}
+        # Where each project's summary lives or should go, so rebuilt files replace the existing ones
+        self.summary_paths: Dict[str, str] = {}
+        self.collections: Dict[str, str] = {}
+
+    def state(self, project: str) -> ProjectSummaryState:
+        if project not in self.projects:
+            self.projects[project] = ProjectSummaryState(project)
+        return self.projects[project]
+
+    def add_issue(self, issue) -> Optional[str]:
+        """
+        Add or update one issue in any of the dataset schemas (or a JiraIssue).
+        Returns:
+            The project key the issue was counted under, or None if it was skipped
+        """
+        issue = _issue_dict(issue)
+        key = extract_column(issue, 'key')
+        if not key or key.endswith('-SUMMARY'):
+            return None
+        project = extract_column(issue, 'project')
+        # Flat JiraIssue objects carry the project name, not its key
+        if not project or project != project.upper():
+            project = key.rsplit('-', 1)[0]
+        reporter = _person(issue, 'reporter')
+        assignee = _person(issue, 'assignee')
+        if assignee == "Unassigned":
+            assignee = None
+        self.state(project).add(key, reporter, assignee, _components_of(issue), extract_column(issue, 'updated'))
+        return project
+
+    def add_issues(self, issues: Iterable) -> int:
+        count = 0
+        for issue in issues:
+            if self.add_issue(issue):
+                count += 1
+        return count
+
+    def remove_issue(self, issue_key: str) -> bool:
+        state = self.projects.get(issue_key.rsplit('-', 1)[0])
+        return state.remove(issue_key) if state else False
+
+    def add_file(self, path: str) -> int:
+        """Stream a dataset JSON/JSONL file or a .jstore file into the builder"""
+        from .cleaning import iter_raw_issues
+
+        try:
+            logger.info(f"[SUMMARY] Aggregating {path}")
+            projects: Dict[str, int] = {}
+
+            def add(issues: Iterable) -> None:
+                for issue in issues:
+                    project = self.add_issue(issue)
+                    if project:
+                        projects[project] = projects.get(project, 0) + 1
+
+            if is_store_path(path):
+                with IssueStore(path) as store:
+                    add(store)
+            else:
+                add(iter_raw_issues(path))
+            # <PROJECT>_<collection>_issues.json names the collection of the project's summary file
+            stem = base_path(path).stem
+            for project in projects:
+                prefix = f"{project}_"
+                if stem.startswith(prefix) and stem.endswith("_issues") and len(stem) > len(prefix) + len("_issues"):
+                    self.collections.setdefault(project, stem[len(prefix):-len("_issues")])
+            return sum(projects.values())
+        except Exception as e:
+            logger.error(f"[SUMMARY] Error aggregating {path}: {e}\n{traceback.format_exc()}")
+            raise
+
+    def load_summary_file(self, path: str) -> Optional[str]:
+        """Keep the free-text summary of an existing *_SUMMARY.json(.gz|.zst) file"""
+        with open_text(path) as f:
+            data = json.load(f)
+        data = data[0] if isinstance(data, list) and data else data
+        if not isinstance(data, dict) or not data.get('key'):
+            return None
+        project = data['key'].replace('-SUMMARY', '')
+        summary = (data.get('fields') or {}).get('summary')
+        if summary:
+            self.state(project).summary = summary
+        self.summary_paths[project] = str(path)
+        return project
+
+    def merge(self, other: "SummaryBuilder") -> None:
+        for project, state in other.projects.items():
+            self.state(project).merge(state)
+
+    def summary_document(self, project: str) -> List[Dict]:
+        """Render a project in the *_SUMMARY.json format"""
+        return [{
+            "id": f"{project}_SUMMARY",
+            "key": f"{project}-SUMMARY",
+            "fields": self.projects[project].fields(),
+        }]
+
+    def summary_path(self, output_dir: str, project: str, collection: Optional[str] = None) -> Path:
+        """
+        File a project's summary is written to: <PROJECT>_<collection>_SUMMARY.json, else the
+        summary file loaded from output_dir (so it is replaced, not duplicated), else one named
+        after the collection of the project's issue file, else <PROJECT>_SUMMARY.json
+        """
+        if collection:
+            return Path(output_dir) / f"{project}_{collection}_SUMMARY.json"
+        existing = self.summary_paths.get(project)
+        if existing and Path(existing).parent.resolve() == Path(output_dir).resolve():
+            return Path(existing)
+        if project in self.collections:
+            return Path(output_dir) / f"{project}_{self.collections[project]}_SUMMARY.json"
+        return Path(output_dir) / f"{project}_SUMMARY.json"
+
+    def write_summary_files(self, output_dir: str, collection: Optional[str] = None) -> List[str]:
+        paths = []
+        for project in sorted(self.projects):
+            path = self.summary_path(output_dir, project, collection)
+            data = json.dumps(self.summary_document(project), indent=2, ensure_ascii=False).encode('utf-8')
+            # A compressed summary file stays compressed
+            kind = compression_of(path)
+            with open(path, 'wb') as f:
+                f.write(compress(data, kind) if kind else data)
+            paths.append(str(path))
+        return paths
+
+    def jira_delta_jql(self, project: str) -> str:
+        """JQL fetching only issues updated since the newest one already aggregated"""
+        jql = f'project = "{project}"'
+        last_updated = self.projects[project].last_updated if project in self.projects else None
+        if last_updated:
+            try:
+                # Absolute JQL dates are read in the searching user's timezone; a bound
+                # relative to Jira's clock is not, and the margin covers clock skew
+                since = datetime.fromisoformat(last_updated)
+                if since.tzinfo is None:
+                    since = since.replace(tzinfo=timezone.utc)
+                age = (datetime.now(timezone.utc) - since).total_seconds() / 60
+                jql += f' AND updated >= -{max(0, math.ceil(age)) + DELTA_MARGIN_MINUTES}m'
+            except ValueError:
+                logger.warning(f"[SUMMARY] Unparseable updated timestamp {last_updated} for {project}")
+        return jql + " ORDER BY updated ASC"
+
+    def changed(self) -> Iterator[tuple]:
+        """Yield (project, changed fields) for projects with pending uploads"""
+        for project in sorted(self.projects):
+            fields = self.projects[project].changed_fields()
+            if fields:
+                yield project, fields
+
+    def save(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({project: state.to_dict() for project, state in self.projects.items()}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "SummaryBuilder":
+        builder = cls()
+        if Path(path).exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                for project, data in json.load(f).items():
+                    builder.projects[project] = ProjectSummaryState.from_dict(project, data)
+        return builder
@@ -0,0 +1,421 @@
+"""
+Tracing spans for the fetch, format and upload stages.
+
+A span times one stage (``jira.search``, ``dify.format_issue``,
+``dify.create_document``...) and records its parent, so a trace shows where
+an API request or an ingest run spent its time. The current span lives in a
+context variable: it follows the request through FastAPI's threadpool and
+streaming responses, and ``propagate`` carries it into worker threads.
+
+Finished spans go to the exporter chosen by TRACING_EXPORTER:
+
+    memory          keep the most recent traces in memory (default), served by /traces,
+                    at most TRACING_MAX_TOTAL_SPANS spans in all
+    jsonl:<path>    append one JSON object per span to a file
+    none            tracing off; spans cost a context variable lookup
+
+``summarize`` turns the spans of a run into a per-stage time breakdown and
+the slowest issues.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional["Span"]] = ContextVar("jira_rag_span", default=None)
+_ids = random.Random()
+
+
+def _new_id(bits: int) -> str:
+    return f"{_ids.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "duration", "attributes", "status", "_started")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.start = time.time()
+        self.duration = 0.0
+        self._started = time.perf_counter()
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stand-in returned while tracing is off, so callers can always set attributes"""
+    __slots__ = ()
+    name = trace_id = span_id = None
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _SpanScope:
+    __slots__ = ("_tracer", "_name", "_attributes", "_trace_id", "_parent_id", "_span", "_parent")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any],
+                 trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+        self._tracer = tracer
+        self._name = name
+        self._attributes = attributes
+        self._trace_id = trace_id
+        self._parent_id = parent_id
+        self._span = None
+
+    def __enter__(self):
+        if self._tracer.exporter is None:
+            return _NOOP
+        parent = self._parent = _current.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = self._trace_id or _new_id(128), self._parent_id
+        self._span = Span(self._name, trace_id, parent_id, self._attributes)
+        _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        span = self._span
+        if span is None:
+            return
+        span.duration = time.perf_counter() - span._started
+        if exc_type is not None:
+            span.status = "error"
+            span.attributes.setdefault("error", f"{exc_type.__name__}: {exc}")
+        # Restore instead of resetting a token: a generator step may finish the span in another context
+        _current.set(self._parent)
+        exporter = self._tracer.exporter
+        if exporter is not None:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.error(f"[TRACE] Error exporting span {span.name}: {e}")
+
+
+class InMemoryExporter:
+    """
+    Keeps the spans of the most recent traces, oldest trace dropped first.
+    Besides the trace count and the spans per trace, the spans of all traces
+    are bounded by max_total_spans (a span takes about 500 bytes).
+    """
+
+    def __init__(self, max_traces: int = 100, max_spans: int = 20000, max_total_spans: int = 100000):
+        self.max_traces = max_traces
+        self.max_spans = max_spans
+        self.max_total_spans = max_total_spans
+        self.dropped = 0
+        self._total = 0
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, keep: str) -> None:
+        """Drop the oldest traces other than keep until a span fits"""
+        for trace_id in list(self._traces):
+            if self._total < self.max_total_spans:
+                return
+            if trace_id != keep:
+                self._total -= len(self._traces.pop(trace_id))
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._total -= len(self._traces.popitem(last=False)[1])
+            if self._total >= self.max_total_spans:
+                self._evict(span.trace_id)
+            if len(spans) >= self.max_spans or self._total >= self.max_total_spans:
+                self.dropped += 1
+                return
+            spans.append(span)
+            self._total += 1
+
+    def spans(self, trace_id: str) -> List[Span]:
+        with self._lock:
+            return list(self._traces.get(trace_id, ()))
+
+    def traces(self) -> List[Dict[str, Any]]:
+        """Most recent first, with the root span's name and duration"""
+        with self._lock:
+            traces = list(self._traces.items())
+        listing = []
+        for trace_id, spans in reversed(traces):
+            ids = {span.span_id for span in spans}
+            roots = [span for span in spans if span.parent_id not in ids]
+            root = max(roots, key=lambda span: span.duration) if roots else None
+            listing.append({
+                "trace_id": trace_id,
+                "name": root.name if root else None,
+                "start": min(span.start for span in spans),
+                "duration": root.duration if root else None,
+                "spans": len(spans),
+                "errors": sum(1 for span in spans if span.status == "error"),
+            })
+        return listing
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+            self._total = 0
+
+
+class JsonLinesExporter:
+    """Appends one JSON object per finished span to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+
+    def span(self, name: str, **attributes) -> _SpanScope:
+        """Context manager timing the block as a child of the current span"""
+        return _SpanScope(self, name, attributes)
+
+    def root(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+             **attributes) -> _SpanScope:
+        """Span continuing a trace started elsewhere (e.g. a caller's traceparent header)"""
+        return _SpanScope(self, name, attributes, trace_id, parent_id)
+
+    def configure(self, spec: Optional[str] = None) -> None:
+        """Select the exporter from a TRACING_EXPORTER style spec"""
+        spec = spec if spec is not None else os.getenv("TRACING_EXPORTER", "memory")
+        previous = self.exporter
+        if spec == "none":
+            self.exporter = None
+        elif spec == "memory":
+            self.exporter = InMemoryExporter(
+                max_traces=int(os.getenv("TRACING_MAX_TRACES", "100")),
+                max_spans=int(os.getenv("TRACING_MAX_SPANS", "20000")),
+                max_total_spans=int(os.getenv("TRACING_MAX_TOTAL_SPANS", "100000")),
+            )
+        elif spec.startswith("jsonl:"):
+            self.exporter = JsonLinesExporter(spec[len("jsonl:"):])
+        else:
+            raise ValueError(f"Unknown tracing exporter '{spec}'. Expected memory, jsonl:<path> or none")
+        if previous is not None and hasattr(previous, "close"):
+            previous.close()
+        logger.info(f"[TRACE] Exporting spans to {spec}")
+
+
+TRACER = Tracer()
+TRACER.configure()
+
+
+def span(name: str, **attributes) -> _SpanScope:
+    return TRACER.span(name, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def activate(target: Optional[Span]):
+    """Make target the current span for the block (e.g. a generator step resumed in another context)"""
+    if target is None or target is _NOOP:
+        yield target
+        return
+    previous = _current.get()
+    _current.set(target)
+    try:
+        yield target
+    finally:
+        _current.set(previous)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap fn so it runs under the caller's current span when submitted to another thread"""
+    parent = _current.get()
+    if parent is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with activate(parent):
+            return fn(*args, **kwargs)
+    return run
+
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    """Spans written by JsonLinesExporter"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(spans: Iterable, slowest: int = 10) -> Dict[str, Any]:
+    """
+    Per-stage time breakdown and the slowest issues of a set of spans
+    Args:
+        spans: Span objects or their dicts
+        slowest: How many issues to list
+    Returns:
+        stages: per span name, count and total/self/mean/max seconds, by self time
+                (self time excludes child spans, so the stages add up to the wall time)
+        slowest_issues: the outermost spans tagged with an issue_key, longest first,
+                        with the self time of the stages under each
+    """
+    spans = [span.to_dict() if isinstance(span, Span) else span for span in spans]
+    by_id = {span["span_id"]: span for span in spans}
+    children: Dict[str, List[Dict]] = {}
+    for span in spans:
+        if span["parent_id"] in by_id:
+            children.setdefault(span["parent_id"], []).append(span)
+
+    def self_time(span: Dict) -> float:
+        return max(span["duration"] - sum(child["duration"] for child in children.get(span["span_id"], ())), 0.0)
+
+    stages: Dict[str, Dict[str, float]] = {}
+    for span in spans:
+        stage = stages.setdefault(span["name"], {"count": 0, "errors": 0, "total_seconds": 0.0,
+                                                 "self_seconds": 0.0, "max_seconds": 0.0})
+        stage["count"] += 1
+        stage["errors"] += span["status"] == "error"
+        stage["total_seconds"] += span["duration"]
+        stage["self_seconds"] += self_time(span)
+        stage["max_seconds"] = max(stage["max_seconds"], span["duration"])
+    for stage in stages.values():
+        stage["mean_seconds"] = stage["total_seconds"] / stage["count"]
+
+    def breakdown(span: Dict) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        pending = [span]
+        while pending:
+            node = pending.pop()
+            totals[node["name"]] = totals.get(node["name"], 0.0) + self_time(node)
+            pending.extend(children.get(node["span_id"], ()))
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    issues = [span for span in spans if "issue_key" in span["attributes"]
+              and "issue_key" not in by_id.get(span["parent_id"], {}).get("attributes", {})]
+    issues.sort(key=lambda span: -span["duration"])
+    roots = [span for span in spans if span["parent_id"] not in by_id]
+    return {
+        "spans": len(spans),
+        "wall_seconds": sum(span["duration"] for span in roots),
+        "stages": dict(sorted(stages.items(), key=lambda item: -item[1]["self_seconds"])),
+        "slowest_issues": [
+            {
+                "issue_key": span["attributes"]["issue_key"],
+                "seconds": span["duration"],
+                "status": span["status"],
+                "trace_id": span["trace_id"],
+                "stages": breakdown(span),
+            }
+            for span in issues[:slowest]
+        ],
+    }
+
+
+def parse_traceparent(header: Optional[str]) -> tuple:
+    """(trace_id, parent span_id) from a W3C traceparent header, or (None, None)"""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None, None
+    return parts[1], parts[2]
+
+
+_route_templates: Dict[Any, str] = {}
+
+
+def route_template(scope) -> str:
+    """Path template of the route that handled an ASGI request (e.g. /graph/{project}/coverage)"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    template = _route_templates.get(endpoint)
+    if template is None:
+        routes = getattr(scope.get("app"), "routes", None) or getattr(scope.get("router"), "routes", [])
+        template = next((getattr(route, "path", None) for route in routes
+                         if getattr(route, "endpoint", None) is endpoint), None) or "unmatched"
+        _route_templates[endpoint] = template
+    return template
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of every request, continuing the
+    caller's trace when a traceparent header is sent, and returning the
+    trace id in an X-Trace-Id header.
+    """
+
+    # Probes and scrapes would push the interesting traces out of memory
+    EXCLUDED_PATHS = ("/metrics", "/healthz", "/readyz", "/traces", "/docs", "/openapi.json")
+
+    def __init__(self, app, tracer: Tracer = None, excluded_paths: Iterable[str] = EXCLUDED_PATHS):
+        self.app = app
+        self.tracer = tracer or TRACER
+        self.excluded_paths = tuple(excluded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.tracer.exporter is None or scope["path"].startswith(self.excluded_paths):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or ())
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        with self.tracer.root("http.request", trace_id=trace_id, parent_id=parent_id,
+                              method=scope["method"], path=scope["path"]) as root:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    root.set("status_code", message["status"])
+                    message = dict(message, headers=list(message.get("headers", [])) +
+                                   [(b"x-trace-id", root.trace_id.encode("latin-1"))])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = route_template(scope)
+                root.name = f"{scope['method']} {route}"
+                root.set("route", route)
@@ -0,0 +1,349 @@
+"""
+Continuous ingestion of a dataset directory.
+
+``DirectoryWatcher`` reports dataset files that are new or changed once
+they have stopped changing for ``debounce`` seconds, so a file still being
+written is never read half-way. It waits on inotify where the kernel has it
+and falls back to scanning the directory every ``poll_interval`` seconds.
+A file counts as changed when its size or mtime differ from the last
+ingested version and its content hash does too; touching a file or
+rewriting the same content costs one hash and no upload.
+
+``DatasetIngestor`` ingests only the new content of a changed issue file.
+Issues are compared by a hash of their JSON against the state kept in
+``watch_state.json``: new issues are created, changed ones are updated in
+place and unchanged ones are skipped, through the same applier as the Jira
+webhooks. Issues that disappear from a file are left alone; reconciliation
+removes them. On the first run, issues that already have a document in the
+dataset are taken as current.
+"""
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from pathlib import Path
+import ctypes
+import ctypes.util
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+import traceback
+
+from .compression import BOOKKEEPING_FILES, DATASET_PATTERNS, base_name, base_path, open_text
+from .issue_store import STORE_SUFFIX, IssueStore, is_store_path, extract_column
+from .webhooks import IssueEvent, DifyWebhookApplier
+
+logger = logging.getLogger(__name__)
+
+WATCH_STATE_FILE = "watch_state.json"
+WATCH_PATTERNS = DATASET_PATTERNS + (f"*{STORE_SUFFIX}",)
+
+# inotify(7)
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_Q_OVERFLOW = 0x4000
+_EVENT = struct.Struct("iIII")
+
+Stat = Tuple[int, int]  # (size, mtime_ns)
+
+
+def is_dataset_file(name: str) -> bool:
+    return base_name(name) not in BOOKKEEPING_FILES and any(fnmatch.fnmatch(name, pattern) for pattern in WATCH_PATTERNS)
+
+
+def file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def issue_hash(issue: Dict) -> str:
+    return hashlib.blake2b(json.dumps(issue, sort_keys=True, separators=(",", ":")).encode("utf-8"),
+                           digest_size=16).hexdigest()
+
+
+def iter_file_issues(path: str) -> Iterator[Dict]:
+    """Issues of a dataset file: .jstore, {"issues": [...]}, array or JSON Lines, plain or compressed"""
+    from .cleaning import iter_raw_issues
+
+    if is_store_path(path):
+        with IssueStore(path) as store:
+            yield from store
+        return
+    with open_text(path) as f:
+        head = f.read(4096).lstrip()
+    if head.startswith("{") and '"issues"' in head:
+        with open_text(path) as f:
+            yield from json.load(f).get("issues", [])
+        return
+    yield from iter_raw_issues(path)
+
+
+class _Inotify:
+    """Names of files created, written or moved into one directory, from the kernel"""
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        """Names seen within timeout seconds; None when the kernel queue overflowed and events were lost"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names, pos = set(), 0
+        while pos + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    def __init__(self, directory: str, known: Optional[Dict[str, Stat]] = None, debounce: float = 2.0,
+                 poll_interval: float = 1.0, use_inotify: bool = True):
+        """
+        Args:
+            directory: Directory to watch (not recursive)
+            known: File name -> (size, mtime_ns) of the versions already handled
+            debounce: Seconds a file must stay unchanged before it is reported
+            poll_interval: Seconds between scans without inotify
+            use_inotify: Use inotify when available
+        """
+        self.directory = directory
+        self.known: Dict[str, Stat] = dict(known or {})
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.inotify: Optional[_Inotify] = None
+        if use_inotify:
+            try:
+                self.inotify = _Inotify(directory)
+            except (OSError, AttributeError) as e:
+                logger.info(f"[WATCH] inotify unavailable ({e}), scanning every {poll_interval}s")
+        # name -> (stat, monotonic time it was first seen with that stat)
+        self._pending: Dict[str, Tuple[Stat, float]] = {}
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self.inotify else "poll"
+
+    def stat(self, name: str) -> Optional[Stat]:
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def _scan(self) -> Set[str]:
+        with os.scandir(self.directory) as entries:
+            return {entry.name for entry in entries if entry.is_file() and is_dataset_file(entry.name)}
+
+    def _note(self, names: Set[str]) -> None:
+        now = time.monotonic()
+        for name in names:
+            stat = self.stat(name)
+            if stat is None or stat == self.known.get(name):
+                self._pending.pop(name, None)
+            elif name not in self._pending or self._pending[name][0] != stat:
+                self._pending[name] = (stat, now)
+
+    def poll(self) -> List[str]:
+        """
+        Wait for changes (up to debounce or poll_interval seconds)
+        Returns:
+            Names of files that are new or changed and have been stable for debounce seconds
+        """
+        if self.inotify is None:
+            time.sleep(self.poll_interval)
+            self._note(self._scan())
+        else:
+            names = self.inotify.read(min(self.debounce, self.poll_interval) if self._pending else self.poll_interval)
+            self._note(self._scan() if names is None else {n for n in names if is_dataset_file(n)})
+        # Pending files are re-checked until they stop changing
+        self._note(set(self._pending))
+        now = time.monotonic()
+        ready = sorted(name for name, (_, since) in self._pending.items() if now - since >= self.debounce)
+        for name in ready:
+            del self._pending[name]
+        return ready
+
+    def start(self) -> List[str]:
+        """
+        Files that are new or changed since the known versions and were last modified more than
+        debounce seconds ago; more recent ones are reported by poll once they settle
+        """
+        self._note(self._scan())
+        cutoff = time.time_ns() - int(self.debounce * 1e9)
+        ready = sorted(name for name, (stat, _) in self._pending.items() if stat[1] < cutoff)
+        for name in ready:
+            del self._pending[name]
+        return ready
+
+    def close(self) -> None:
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+
+class DatasetIngestor:
+    """
+    Ingests new and changed content of a dataset directory into a long-lived
+    DifyIntegration, remembering what was ingested in <directory>/watch_state.json
+    """
+
+    def __init__(self, dify, directory: str, advanced_ingestion: bool = False, summary_mode: str = "per_field",
+                 state_path: Optional[str] = None):
+        self.dify = dify
+        self.directory = directory
+        self.summary_mode = summary_mode
+        self.state_path = state_path or os.path.join(directory, WATCH_STATE_FILE)
+        self.applier = DifyWebhookApplier(dify, advanced_ingestion=advanced_ingestion)
+        # name -> {"size", "mtime_ns", "hash"}; issue key -> issue hash
+        self.files: Dict[str, Dict] = {}
+        self.issues: Dict[str, str] = {}
+        self.load()
+
+    def load(self) -> None:
+        if Path(self.state_path).exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.files, self.issues = state.get("files", {}), state.get("issues", {})
+
+    def save(self) -> None:
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "issues": self.issues}, f)
+        os.replace(tmp, self.state_path)
+
+    def known_stats(self) -> Dict[str, Stat]:
+        return {name: (entry["size"], entry["mtime_ns"]) for name, entry in self.files.items()}
+
+    def ingest(self, name: str) -> Dict:
+        """
+        Ingest the new content of one file
+        Returns:
+            {"file", "status": "unchanged" | "ingested" | "skipped" | "failed", "created", "updated", "unchanged",
+             "failed" (issues that could not be applied)}
+        """
+        path = os.path.join(self.directory, name)
+        result = {"file": name, "status": "ingested", "created": 0, "updated": 0, "unchanged": 0, "failed": 0}
+        try:
+            st = os.stat(path)
+            digest = file_hash(path)
+            previous = self.files.get(name)
+            entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": digest}
+            if previous and previous["hash"] == digest:
+                result["status"] = "unchanged"
+            elif base_path(name).stem.endswith("_SUMMARY"):
+                self._ingest_summary(path, previous, result)
+            else:
+                self._ingest_issues(path, result)
+            self.files[name] = entry
+            self.save()
+        except Exception as e:
+            logger.error(f"[WATCH] Error ingesting {name}: {e}\n{traceback.format_exc()}")
+            result.update(status="failed", error=str(e))
+        logger.info(f"[WATCH] {name}: {result['status']}, {result['created']} created, "
+                    f"{result['updated']} updated, {result['unchanged']} unchanged, {result['failed']} failed")
+        return result
+
+    def _ingest_summary(self, path: str, previous: Optional[Dict], result: Dict) -> None:
+        if previous:
+            # Re-uploading would duplicate the summary documents
+            logger.warning(f"[WATCH] {path} changed; use --build-summaries --upload-summaries to update summaries")
+            result["status"] = "skipped"
+            return
+        outcomes = list(self.dify.iter_ingest_json_file(path, summary_mode=self.summary_mode))
+        result["created"] = sum(outcome["status"] == "created" for outcome in outcomes)
+
+    def _ingest_issues(self, path: str, result: Dict) -> None:
+        documents = self.applier.documents
+        events, hashes = [], {}
+        for issue in iter_file_issues(path):
+            key = extract_column(issue, "key")
+            if not key:
+                continue
+            digest = issue_hash(issue)
+            known = self.issues.get(key)
+            if known == digest or (known is None and key in documents):
+                # Unchanged, or already in the dataset from before the first watch
+                result["unchanged"] += 1
+                hashes[key] = digest
+                continue
+            events.append(IssueEvent(key, "upsert", issue, 0))
+            hashes[key] = digest
+        if events:
+            actions = {event.key: "updated" if event.key in documents else "created" for event in events}
+            # Failed issues are tried again when the file next changes
+            failed = set(self.applier(events))
+            for key, action in actions.items():
+                if key in failed:
+                    hashes.pop(key, None)
+                    result["failed"] += 1
+                else:
+                    result[action] += 1
+        self.issues.update(hashes)
+
+
+def watch(ingestor: DatasetIngestor, debounce: float = 2.0, poll_interval: float = 1.0,
+          stop: Optional[threading.Event] = None, on_result: Optional[Callable[[Dict], None]] = None,
+          retry_backoff: float = 5.0, max_retry_delay: float = 300.0) -> None:
+    """
+    Ingest the files changed since the last run, then every file that changes until stop is set.
+    A file that fails is retried after retry_backoff seconds, doubling up to max_retry_delay,
+    or as soon as it changes again.
+    """
+    watcher = DirectoryWatcher(ingestor.directory, ingestor.known_stats(), debounce=debounce, poll_interval=poll_interval)
+    logger.info(f"[WATCH] Watching {ingestor.directory} ({watcher.mode}, debounce {debounce}s)")
+    stop = stop or threading.Event()
+    # name -> (stat of the failed version, attempts, monotonic time of the next retry)
+    failed: Dict[str, Tuple[Optional[Stat], int, float]] = {}
+    try:
+        names = watcher.start()
+        while not stop.is_set():
+            for name in names:
+                stat = watcher.stat(name)
+                retry = failed.get(name)
+                if retry and retry[0] == stat and time.monotonic() < retry[2]:
+                    continue
+                result = ingestor.ingest(name)
+                if result["status"] == "failed" and stat is not None:
+                    attempts = retry[1] + 1 if retry and retry[0] == stat else 1
+                    delay = min(max_retry_delay, retry_backoff * 2 ** (attempts - 1))
+                    failed[name] = (stat, attempts, time.monotonic() + delay)
+                    logger.warning(f"[WATCH] {name} failed (attempt {attempts}), retrying in {delay:.0f}s")
+                else:
+                    watcher.known[name] = stat
+                    failed.pop(name, None)
+                if on_result:
+                    on_result(result)
+            now = time.monotonic()
+            names = sorted(set(watcher.poll()) | {name for name, (_, _, due) in failed.items() if due <= now})
+    finally:
+        watcher.close()
@@ -0,0 +1,282 @@
+"""
+Push-based incremental ingestion from Jira webhooks.
+
+``jira:issue_created``, ``jira:issue_updated`` and ``jira:issue_deleted``
+events are coalesced per issue key: only the latest state of an issue is kept
+until no new event has arrived for ``window`` seconds (or ``max_delay`` has
+passed since the first one), then ready issues are applied to Dify in
+micro-batches. A burst of edits on one issue therefore costs a single
+create, update-in-place or delete. Issues that fail are retried with
+exponential backoff, up to ``max_retries`` times, unless a newer event for
+the same issue arrives first. While the Dify circuit breaker is open the
+batch is put back as is and nothing is applied until it may close again.
+"""
+from typing import List, Dict, Optional, Callable
+import hashlib
+import hmac
+import logging
+import threading
+import time
+import traceback
+
+from .dify_integration import ISSUE_DOCUMENT_NAME_RE
+from .resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_EVENTS = {
+    "jira:issue_created": "upsert",
+    "jira:issue_updated": "upsert",
+    "jira:issue_deleted": "delete",
+}
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str] = None, token: Optional[str] = None) -> bool:
+    """
+    Check a webhook against the shared secret, either through an HMAC-SHA256
+    signature of the body ("X-Hub-Signature: sha256=<hex>") or the secret
+    itself passed as a token (header or query parameter)
+    """
+    if not secret:
+        return False
+    if signature:
+        expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(signature.split('=', 1)[-1], expected)
+    if token:
+        return hmac.compare_digest(token, secret)
+    return False
+
+
+class IssueEvent:
+    __slots__ = ("key", "action", "issue", "timestamp", "first_seen", "last_seen", "events", "attempts", "retry_at")
+
+    def __init__(self, key: str, action: str, issue: Dict, timestamp: int):
+        self.key = key
+        self.action = action
+        self.issue = issue
+        self.timestamp = timestamp
+        self.first_seen = self.last_seen = time.monotonic()
+        self.events = 1
+        self.attempts = 0
+        self.retry_at = 0.0
+
+
+def parse_webhook(payload: Dict) -> Optional[IssueEvent]:
+    """Turn a Jira webhook payload into an IssueEvent; None for events we do not handle"""
+    action = WEBHOOK_EVENTS.get(payload.get("webhookEvent"))
+    issue = payload.get("issue") or {}
+    key = issue.get("key")
+    if not action or not key:
+        return None
+    return IssueEvent(key, action, issue, int(payload.get("timestamp") or 0))
+
+
+class WebhookCoalescer:
+    """
+    Keeps the latest pending event per issue key and hands ready events to
+    apply_batch from a background thread. apply_batch returns the keys of the
+    issues it could not apply; those events are put back and retried after
+    retry_backoff * 2 ** (attempt - 1) seconds, at most max_retries times.
+    """
+
+    def __init__(self, apply_batch: Callable[[List[IssueEvent]], Optional[List[str]]], window: float = 2.0,
+                 max_delay: float = 10.0, max_batch: int = 50, max_retries: int = 5, retry_backoff: float = 1.0):
+        self.apply_batch = apply_batch
+        self.window = window
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.pending: Dict[str, IssueEvent] = {}
+        self.stats = {"received": 0, "coalesced": 0, "ignored_stale": 0, "batches": 0, "applied": 0, "failed": 0,
+                      "retried": 0, "dropped": 0}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._flushing = 0
+        self._inflight = False
+        self._resume_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="webhook-coalescer", daemon=True)
+        self._thread.start()
+
+    def submit(self, event: IssueEvent) -> None:
+        with self._cond:
+            self.stats["received"] += 1
+            current = self.pending.get(event.key)
+            if current is not None:
+                self.stats["coalesced"] += 1
+                if event.timestamp and current.timestamp and event.timestamp < current.timestamp:
+                    # Jira does not guarantee delivery order
+                    self.stats["ignored_stale"] += 1
+                    current.events += 1
+                    return
+                event.first_seen = current.first_seen
+                event.events = current.events + 1
+            self.pending[event.key] = event
+            self._cond.notify_all()
+
+    def _ready(self, now: float) -> List[IssueEvent]:
+        ready = [e for e in self.pending.values() if e.retry_at <= now and
+                 (now - e.last_seen >= self.window or now - e.first_seen >= self.max_delay)]
+        ready.sort(key=lambda e: e.first_seen)
+        ready = ready[:self.max_batch]
+        for event in ready:
+            del self.pending[event.key]
+        return ready
+
+    def _next_deadline(self, now: float) -> Optional[float]:
+        if not self.pending:
+            return None
+        return min(max(e.retry_at, min(e.last_seen + self.window, e.first_seen + self.max_delay))
+                   for e in self.pending.values()) - now
+
+    def _apply(self, batch: List[IssueEvent]) -> None:
+        try:
+            failed = set(self.apply_batch(batch) or ())
+        except CircuitOpenError as e:
+            self._pause(batch, e)
+            return
+        except Exception as e:
+            failed = {event.key for event in batch}
+            logger.error(f"[WEBHOOK] Error applying batch of {len(batch)} events: {e}\n{traceback.format_exc()}")
+        with self._cond:
+            self.stats["applied"] += len(batch) - len(failed)
+            self.stats["failed"] += len(failed)
+            self.stats["batches"] += 1
+            self._retry([event for event in batch if event.key in failed], time.monotonic())
+            self._inflight = False
+            self._cond.notify_all()
+
+    def _pause(self, batch: List[IssueEvent], e: CircuitOpenError) -> None:
+        """Put a whole batch back, without using up retries, and stop draining for retry_after seconds"""
+        with self._cond:
+            self.stats["batches"] += 1
+            if self._closed:
+                self.stats["dropped"] += len(batch)
+                logger.error(f"[WEBHOOK] Dropping {len(batch)} events at shutdown: {e}")
+            else:
+                logger.warning(f"[WEBHOOK] {e}; retrying {len(batch)} events in {e.retry_after:.1f}s")
+                self._resume_at = time.monotonic() + e.retry_after
+                for event in batch:
+                    self.pending.setdefault(event.key, event)
+            self._inflight = False
+            self._cond.notify_all()
+
+    def _retry(self, events: List[IssueEvent], now: float) -> None:
+        """Put failed events back with backoff; a newer pending event for the same issue supersedes them"""
+        for event in events:
+            if event.key in self.pending:
+                continue
+            if event.attempts >= self.max_retries:
+                self.stats["dropped"] += 1
+                logger.error(f"[WEBHOOK] Giving up on {event.action} for {event.key} after {event.attempts + 1} attempts")
+                continue
+            event.attempts += 1
+            event.retry_at = now + self.retry_backoff * 2 ** (event.attempts - 1)
+            self.pending[event.key] = event
+            self.stats["retried"] += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self.pending:
+                        return
+                    now = time.monotonic()
+                    if now < self._resume_at and not self._closed:
+                        self._cond.wait(self._resume_at - now)
+                        continue
+                    batch = self._drain() if self._closed or self._flushing else self._ready(now)
+                    if batch:
+                        self._inflight = True
+                        break
+                    self._cond.wait(self._next_deadline(now))
+            self._apply(batch)
+
+    def _drain(self) -> List[IssueEvent]:
+        now = time.monotonic()
+        batch = [e for e in self.pending.values() if e.retry_at <= now][:self.max_batch]
+        for event in batch:
+            del self.pending[event.key]
+        return batch
+
+    def flush(self) -> None:
+        """Apply every pending event now and wait until they are applied"""
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            while self.pending or self._inflight:
+                self._cond.wait()
+            self._flushing -= 1
+
+    def close(self) -> None:
+        """Stop accepting work once pending events are applied"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {**self.stats, "pending": len(self.pending)}
+
+
+class DifyWebhookApplier:
+    """
+    Applies coalesced events to a dataset: new issues are created in one
+    ingest_issues call per batch, known issues are updated in place and
+    deleted issues are removed. Issue key -> document id is read from the
+    dataset once and kept up to date from the create responses.
+    """
+
+    def __init__(self, dify, advanced_ingestion: bool = False):
+        self.dify = dify
+        self.advanced_ingestion = advanced_ingestion
+        self._documents: Optional[Dict[str, str]] = None
+
+    @property
+    def documents(self) -> Dict[str, str]:
+        if self._documents is None:
+            self._documents = {}
+            for document in self.dify.iter_documents():
+                match = ISSUE_DOCUMENT_NAME_RE.match(document.get("name") or "")
+                if match:
+                    self._documents[match.group(1)] = document["id"]
+            logger.info(f"[WEBHOOK] Indexed {len(self._documents)} issue documents in dataset {self.dify.dataset_id}")
+        return self._documents
+
+    def __call__(self, events: List[IssueEvent]) -> List[str]:
+        """
+        Apply a batch of events
+        Returns:
+            Keys of the issues that could not be applied
+        """
+        documents = self.documents
+        creates, failed = [], []
+        for event in events:
+            document_id = documents.get(event.key)
+            try:
+                if event.action == "delete":
+                    if document_id:
+                        self.dify.delete_document(document_id)
+                        documents.pop(event.key, None)
+                    logger.info(f"[WEBHOOK] {event.key}: deleted ({event.events} events)")
+                elif document_id:
+                    doc = self.dify._format_issue_for_text(event.issue, advanced_ingestion=self.advanced_ingestion)
+                    self.dify.update_document_by_text(document_id, doc)
+                    logger.info(f"[WEBHOOK] {event.key}: updated in place ({event.events} events)")
+                else:
+                    creates.append(event)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                logger.error(f"[WEBHOOK] Error applying {event.action} for {event.key}: {e}\n{traceback.format_exc()}")
+                failed.append(event.key)
+        if creates:
+            # Record each document as it is created, so a batch put back after the circuit opens updates it in place
+            created = 0
+            for outcome in self.dify.iter_ingest_issues([event.issue for event in creates], advanced_ingestion=self.advanced_ingestion):
+                if outcome["status"] == "created" and outcome["document_id"]:
+                    documents[outcome["issue_key"]] = outcome["document_id"]
+                    created += 1
+            logger.info(f"[WEBHOOK] Created {created} documents")
+            failed.extend(event.key for event in creates if event.key not in documents)
+        return failed
@@ -1,3 +1,3 @@
-from .ingest_models import IngestJiraRequest, IngestJsonRequest
+from .ingest_models import IngestJiraRequest, IngestJsonRequest, RetrieveRequest
 
-__all__ = ['IngestJiraRequest', 'IngestJsonRequest'] 
\ No newline at end of file
+__all__ = ['IngestJiraRequest', 'IngestJsonRequest', 'RetrieveRequest']
\ No newline at end of file
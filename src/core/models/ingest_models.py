@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 
 class IngestJiraRequest(BaseModel):
     """Model for Jira ingestion requests."""
@@ -10,4 +10,14 @@ class IngestJiraRequest(BaseModel):
 class IngestJsonRequest(BaseModel):
     """Model for JSON file ingestion requests."""
     file_names: List[str]  # List of file names
-    dataset_dir: Optional[str] = "jira_rag/dataset" 
\ No newline at end of file
+    dataset_dir: Optional[str] = "jira_rag/dataset"
+
+class RetrieveRequest(BaseModel):
+    """Model for dataset retrieval requests."""
+    query: str
+    dataset_id: Optional[str] = None  # Defaults to DIFY_DATASET_ID
+    retrieval_model: Optional[Dict[str, Any]] = None
+    use_cache: bool = True
+    sharded: bool = False  # Fan out over the DIFY_SHARD_MAP datasets instead
+    projects: Optional[List[str]] = None  # Restrict sharded retrieval to these projects
+    top_k: Optional[int] = None
\ No newline at end of file
@@ -1,5 +1,15 @@
 from jira_rag.jira_client import JiraClient
 from jira_rag.dify_integration import DifyIntegration
+from jira_rag.cleaning import clean_export
+from jira_rag.issue_store import json_to_store, store_to_json, is_store_path
+from jira_rag.summary_builder import SummaryBuilder
+from jira_rag.sharding import ShardMap, ShardedDifyIntegration
+from jira_rag.reconcile import reconcile, live_keys_from_files, live_keys_from_jira
+from jira_rag.tracing import TRACER, span, load_spans, summarize
+from jira_rag.profiling import Profile, PROFILE_MODES, profile_name
+from jira_rag.compression import glob_dataset_files, base_path
+from jira_rag.watch import DatasetIngestor, watch
+from contextlib import nullcontext
 import os
 from dotenv import load_dotenv
 import logging
@@ -31,13 +41,14 @@ def check_env_vars():
             logger.error("JIRA_API_TOKEN=your-api-token")
         raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
 
-def ingest_json_files(dify: DifyIntegration, dataset_dir: str = "jira_rag/dataset", specific_file: str = None):
+def ingest_json_files(dify: DifyIntegration, dataset_dir: str = "jira_rag/dataset", specific_file: str = None, summary_mode: str = "per_field"):
     """
     Ingest JSON files from the dataset directory.
     Args:
         dify: DifyIntegration instance
-        dataset_dir: Directory containing JSON files
+        dataset_dir: Directory containing JSON or JSON Lines files, plain or .gz/.zst compressed
         specific_file: Optional specific JSON file to ingest
+        summary_mode: How summary files are ingested ("per_field" or "single")
     """
     if specific_file:
         json_files = [specific_file]
@@ -45,7 +56,7 @@ def ingest_json_files(dify: DifyIntegration, dataset_dir: str = "jira_rag/datase
             logger.error(f"Specified file {specific_file} does not exist")
             return
     else:
-        json_files = glob.glob(os.path.join(dataset_dir, "*.json"))
+        json_files = glob_dataset_files(dataset_dir)
         if not json_files:
             logger.warning(f"No JSON files found in {dataset_dir}")
             return
@@ -53,7 +64,7 @@ def ingest_json_files(dify: DifyIntegration, dataset_dir: str = "jira_rag/datase
     for json_file in json_files:
         try:
             logger.info(f"Ingesting JSON file: {json_file}")
-            response = dify.ingest_json_file(json_file)
+            response = dify.ingest_json_file(json_file, summary_mode=summary_mode)
             logger.info(f"Successfully ingested {json_file}")
             logger.debug(f"Ingestion response: {response}")
         except Exception as e:
@@ -69,14 +80,14 @@ def ingest_jira_issues(dify: DifyIntegration, jira_client: JiraClient, project:
     """
     logger.info(f"Fetching issues from {project} project...")
     jql_query = f"project = {project} ORDER BY created DESC"
-    issues = jira_client.get_issues(jql_query, max_results=100)
+    issues = jira_client.get_issue_rows(jql_query, max_results=100)
     
     logger.info(f"Found {len(issues)} issues from {project} project")
     
     if issues:
         logger.info("Ingesting issues into Dify RAG...")
-        response = dify.ingest_issues(issues)
-        logger.info(f"Ingestion response: {response}")
+        created = sum(outcome["status"] == "created" for outcome in dify.iter_ingest_issues(issues))
+        logger.info(f"Ingested {created} of {len(issues)} issues")
     else:
         logger.warning(f"No issues found in {project} project")
 
@@ -91,6 +102,20 @@ def parse_arguments():
     group.add_argument('--json', type=str, help='Ingest a specific JSON file from dataset directory')
     group.add_argument('--create-test', action='store_true', help='Create a test issue in Jira')
     group.add_argument('--fetch-jira', action='store_true', help='Fetch issues from Jira without Dify integration')
+    group.add_argument('--convert-store', type=str, metavar='FILE',
+                      help='Convert a dataset JSON file to a compact .jstore file, or a .jstore file back to JSON')
+    group.add_argument('--build-summaries', action='store_true',
+                      help='Rebuild *_SUMMARY.json files from the issue files in the dataset directory')
+    group.add_argument('--sync-summaries', action='store_true',
+                      help='Fetch issues updated in Jira since the last sync and upload changed project summaries')
+    group.add_argument('--clean', type=str, metavar='RAW_EXPORT',
+                      help='Clean a raw Jira export (JSON array or JSONL) into per-project files in the dataset directory')
+    group.add_argument('--reconcile', choices=['files', 'jira'],
+                      help='Delete Dify documents of issues missing from the dataset files (or from the Jira project) and duplicates')
+    group.add_argument('--watch', action='store_true',
+                      help='Keep ingesting new and changed files of the dataset directory until interrupted')
+    group.add_argument('--build-shard-map', choices=['project', 'collection', 'category'],
+                      help='Write a shard map from extraction_summary.json with one shard per project, collection or category')
     
     # Optional arguments
     parser.add_argument('--project', type=str, default='QAREF',
@@ -98,10 +123,139 @@ def parse_arguments():
     parser.add_argument('--dataset-dir', type=str, default='jira_rag/dataset',
                       help='Directory containing JSON files (default: jira_rag/dataset)')
     parser.add_argument('--max-results', type=int, default=100,
-                      help='Maximum number of issues to fetch (default: 100)')
+                      help='Maximum number of issues to fetch, 0 for all (default: 100)')
+    parser.add_argument('--collection', type=str, default=None,
+                      help='Collection name used in cleaned file names (default: raw export file name)')
+    parser.add_argument('--workers', type=int, default=None,
+                      help='Worker processes used for cleaning (default: CPU count)')
+    parser.add_argument('--ingest-cleaned', action='store_true',
+                      help='Ingest the cleaned files into Dify after --clean')
+    parser.add_argument('--summary-mode', choices=['per_field', 'single'], default='per_field',
+                      help='Ingest summary files as one document per field or one sectioned document (default: per_field)')
+    parser.add_argument('--summary-state', type=str, default=None,
+                      help='Summary builder state file (default: <dataset-dir>/summary_state.json)')
+    parser.add_argument('--upload-summaries', action='store_true',
+                      help='Upload changed project summaries to Dify after --build-summaries')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='With --reconcile, only report the documents that would be deleted')
+    parser.add_argument('--sharded', action='store_true',
+                      help='Ingest each project into its shard dataset from DIFY_SHARD_MAP')
+    parser.add_argument('--shard-map', type=str, default=None,
+                      help='Shard map file for --build-shard-map (default: DIFY_SHARD_MAP or <dataset-dir>/shard_map.json)')
+    parser.add_argument('--watch-debounce', type=float, default=2.0,
+                      help='Seconds a file must stay unchanged before --watch ingests it (default: 2)')
+    parser.add_argument('--watch-poll', type=float, default=1.0,
+                      help='Seconds between directory scans for --watch when inotify is unavailable (default: 1)')
+    parser.add_argument('--trace', type=str, default=None, metavar='FILE',
+                      help='Append tracing spans to FILE (JSON lines) and log a per-stage breakdown and the slowest issues')
+    parser.add_argument('--profile', choices=PROFILE_MODES, nargs='?', const='cprofile', default=None,
+                      help='Profile the run (cprofile by default, or sample to include worker threads)')
+    parser.add_argument('--profile-dir', type=str, default='profiles',
+                      help='Directory for --profile output (default: profiles)')
     
     return parser.parse_args()
 
+def clean_raw_export(raw_path: str, dataset_dir: str, collection: str = None, workers: int = None, ingest: bool = False):
+    """
+    Clean a raw Jira export and optionally ingest the cleaned files.
+    Args:
+        raw_path: Raw export file
+        dataset_dir: Directory receiving the cleaned files
+        collection: Collection name used in cleaned file names
+        workers: Worker processes used for cleaning
+        ingest: Whether to ingest the cleaned files into Dify
+    """
+    stats = clean_export(raw_path, dataset_dir, collection=collection, workers=workers)
+    logger.info(f"Cleaned {stats['raw_count']} raw issues into {stats['cleaned_count']} documents "
+                f"({stats['reduction_percent']:.2f}% size reduction)")
+    if ingest:
+        collection = collection or Path(raw_path).stem.split('.')[0]
+        dify = DifyIntegration()
+        for project in stats["projects"]:
+            for suffix in ("issues", "SUMMARY"):
+                ingest_json_files(dify, dataset_dir, os.path.join(dataset_dir, f"{project}_{collection}_{suffix}.json"))
+
+def build_summaries(dataset_dir: str, state_path: str, collection: str = None, upload: bool = False):
+    """
+    Rebuild project summaries from the issue files in the dataset directory.
+    Args:
+        dataset_dir: Directory containing *_issues.json(.gz|.zst) or .jstore files
+        state_path: Summary builder state file
+        collection: Collection name used in summary file names
+        upload: Whether to upload changed summaries to Dify
+    """
+    builder = SummaryBuilder.load(state_path)
+    dataset_files = glob_dataset_files(dataset_dir)
+    for summary_file in (p for p in dataset_files if base_path(p).stem.endswith('_SUMMARY')):
+        builder.load_summary_file(summary_file)
+    issue_files = [p for p in dataset_files if base_path(p).stem.endswith('_issues')] + glob.glob(os.path.join(dataset_dir, "*_issues.jstore"))
+    for issue_file in issue_files:
+        builder.add_file(issue_file)
+    for path in builder.write_summary_files(dataset_dir, collection):
+        logger.info(f"Wrote {path}")
+    if upload:
+        DifyIntegration().sync_summaries(builder, collection)
+    builder.save(state_path)
+
+def sync_summaries(jira_client: JiraClient, project: str, state_path: str, collection: str = None):
+    """
+    Apply issues updated in Jira since the last sync and upload changed summaries.
+    Args:
+        jira_client: JiraClient instance
+        project: Jira project key
+        state_path: Summary builder state file
+        collection: Collection name used in document labels
+    """
+    builder = SummaryBuilder.load(state_path)
+    jql_query = builder.jira_delta_jql(project)
+    count = builder.add_issues(jira_client.iter_issue_dicts(jql_query, fields="key,project,reporter,assignee,components,updated"))
+    logger.info(f"Applied {count} updated issues to the {project} summary")
+    DifyIntegration().sync_summaries(builder, collection)
+    builder.save(state_path)
+
+def watch_dataset(dataset_dir: str, summary_mode: str = "per_field", debounce: float = 2.0, poll_interval: float = 1.0):
+    """
+    Ingest new and changed dataset files as they appear, until interrupted.
+    One DifyIntegration (and its connection pool) serves the whole session.
+    Args:
+        dataset_dir: Directory to watch
+        summary_mode: How new summary files are ingested ("per_field" or "single")
+        debounce: Seconds a file must stay unchanged before it is ingested
+        poll_interval: Seconds between directory scans when inotify is unavailable
+    """
+    ingestor = DatasetIngestor(DifyIntegration(), dataset_dir, summary_mode=summary_mode)
+    try:
+        watch(ingestor, debounce=debounce, poll_interval=poll_interval)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+
+def reconcile_dataset(dify: DifyIntegration, source: str, dataset_dir: str, jira_client: JiraClient = None, project: str = None, dry_run: bool = False):
+    """
+    Remove stale issue documents from the dataset.
+    Args:
+        source: "files" to compare with the issue files in dataset_dir, "jira" with the Jira project
+    """
+    if source == "jira":
+        live_keys = live_keys_from_jira(jira_client, f'project = "{project}"')
+        project_keys = {project}
+    else:
+        paths = [p for p in glob_dataset_files(dataset_dir) + glob.glob(os.path.join(dataset_dir, "*.jstore"))
+                 if not base_path(p).stem.endswith('_SUMMARY')]
+        live_keys = live_keys_from_files(paths)
+        # Only sweep projects the files cover
+        project_keys = {key.rsplit('-', 1)[0] for key in live_keys}
+    report = reconcile(dify, live_keys, project_keys=project_keys, dry_run=dry_run)
+    action = "Would delete" if dry_run else "Deleted"
+    logger.info(f"{action} {len(report['orphans'])} orphaned and {len(report['duplicates'])} duplicate documents "
+                f"out of {report['documents']} in {report['seconds']:.1f}s")
+    for entry in report["orphans"]:
+        logger.info(f"  orphan    {entry['key']} ({entry['id']})")
+    for entry in report["duplicates"]:
+        logger.info(f"  duplicate {entry['key']} ({entry['id']})")
+    if report["failed"]:
+        logger.error(f"Failed to delete {len(report['failed'])} documents: {report['failed']}")
+    return report
+
 def create_test_issue(jira_client: JiraClient, project: str = "QAREF"):
     """
     Create a test issue in Jira.
@@ -131,7 +285,7 @@ def fetch_jira_issues(jira_client: JiraClient, project: str = "QAREF", max_resul
     """
     logger.info(f"Fetching issues from {project} project...")
     jql_query = f"project = {project} ORDER BY created DESC"
-    issues = jira_client.get_issues(jql_query, max_results=max_results)
+    issues = jira_client.get_issue_rows(jql_query, max_results=max_results)
     
     logger.info(f"Found {len(issues)} issues from {project} project")
     
@@ -146,14 +300,80 @@ def fetch_jira_issues(jira_client: JiraClient, project: str = "QAREF", max_resul
             logger.info(f"Assignee: {issue.assignee}")
         logger.info("-" * 80)
 
+def report_trace(trace_file: str, trace_id: str, slowest: int = 10):
+    """Log where the time of one traced run went"""
+    summary = summarize([s for s in load_spans(trace_file) if s["trace_id"] == trace_id], slowest=slowest)
+    logger.info(f"Trace {trace_id}: {summary['spans']} spans, {summary['wall_seconds']:.2f}s")
+    for name, stage in summary["stages"].items():
+        logger.info(f"  {name:<28} {stage['count']:>7} calls  {stage['self_seconds']:>9.3f}s self  "
+                    f"{stage['total_seconds']:>9.3f}s total  {stage['max_seconds'] * 1000:>9.1f}ms max")
+    if summary["slowest_issues"]:
+        logger.info("Slowest issues:")
+    for issue in summary["slowest_issues"]:
+        stages = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in issue["stages"].items())
+        logger.info(f"  {issue['issue_key']:<14} {issue['seconds'] * 1000:>9.1f}ms  {stages}")
+
+def report_profile(profile: Profile, profile_dir: str, top: int = 15):
+    """Save a profiled run and log its hottest functions"""
+    paths = profile.save(profile_dir, profile_name("example"))
+    logger.info(f"Profile ({profile.mode}, {profile.seconds:.2f}s) saved to {paths['profile']}, summary in {paths['summary']}")
+    for entry in profile.summary(top)["functions"]:
+        if profile.mode == "cprofile":
+            logger.info(f"  {entry['self_seconds']:>8.3f}s self {entry['cumulative_seconds']:>8.3f}s cum "
+                        f"{entry['calls']:>8} calls  {entry['function']}")
+        else:
+            logger.info(f"  {entry['self_share']:>6.1%} self {entry['total_share']:>6.1%} total  {entry['function']}")
+
 def main():
+    # Parse command line arguments
+    args = parse_arguments()
+    if args.trace:
+        TRACER.configure(f"jsonl:{args.trace}")
+    profile = Profile(args.profile) if args.profile else None
+    root = None
+    try:
+        with span("example.run") as root, profile or nullcontext():
+            run(args)
+    finally:
+        if profile:
+            report_profile(profile, args.profile_dir)
+        if args.trace and root is not None:
+            report_trace(args.trace, root.trace_id)
+
+def run(args):
     try:
-        # Parse command line arguments
-        args = parse_arguments()
-        
         # Load environment variables
         load_dotenv()
         
+        if args.convert_store:
+            path = os.path.join(args.dataset_dir, args.convert_store) if not os.path.isabs(args.convert_store) else args.convert_store
+            converted = store_to_json(path) if is_store_path(path) else json_to_store(path)
+            logger.info(f"Converted {path} -> {converted}")
+            return
+        
+        summary_state = args.summary_state or os.path.join(args.dataset_dir, "summary_state.json")
+        if args.build_summaries:
+            build_summaries(args.dataset_dir, summary_state, args.collection, args.upload_summaries)
+            return
+        
+        if args.build_shard_map:
+            shard_map_path = args.shard_map or os.getenv('DIFY_SHARD_MAP') or os.path.join(args.dataset_dir, "shard_map.json")
+            shard_map = ShardMap.from_extraction_summary(os.path.join(args.dataset_dir, "extraction_summary.json"), by=args.build_shard_map)
+            shard_map.save(shard_map_path)
+            logger.info(f"Wrote {len(shard_map.shards)} shards for {len(shard_map.projects)} projects to {shard_map_path}")
+            return
+        
+        if args.clean:
+            # Cleaning only needs Dify credentials, and only when ingesting
+            clean_raw_export(args.clean, args.dataset_dir, args.collection, args.workers, args.ingest_cleaned)
+            return
+        
+        if args.watch:
+            if args.sharded:
+                logger.warning("--watch ingests into DIFY_DATASET_ID; --sharded is ignored")
+            watch_dataset(args.dataset_dir, args.summary_mode, args.watch_debounce, args.watch_poll)
+            return
+        
         # Check for required environment variables
         check_env_vars()
         
@@ -164,7 +384,7 @@ def main():
         logger.info("JIRA_API_TOKEN: [REDACTED]")
         logger.info(f"NO_PROXY: {os.getenv('NO_PROXY')}")
         
-        if args.jira or args.create_test or args.fetch_jira:
+        if args.jira or args.create_test or args.fetch_jira or args.sync_summaries or args.reconcile == "jira":
             # Initialize Jira client
             logger.info("Initializing Jira client...")
             jira_client = JiraClient()
@@ -177,25 +397,32 @@ def main():
             if args.jira:
                 # Initialize Dify integration for ingestion
                 logger.info("Initializing Dify integration...")
-                dify = DifyIntegration()
+                dify = ShardedDifyIntegration() if args.sharded else DifyIntegration()
                 ingest_jira_issues(dify, jira_client, args.project)
             elif args.create_test:
                 create_test_issue(jira_client, args.project)
             elif args.fetch_jira:
                 fetch_jira_issues(jira_client, args.project, args.max_results)
+            elif args.sync_summaries:
+                sync_summaries(jira_client, args.project, summary_state, args.collection)
+            elif args.reconcile:
+                reconcile_dataset(DifyIntegration(), "jira", args.dataset_dir, jira_client, args.project, args.dry_run)
+            
+        elif args.reconcile:
+            reconcile_dataset(DifyIntegration(), "files", args.dataset_dir, dry_run=args.dry_run)
             
         elif args.all_json or args.json:
             # Initialize Dify integration for JSON ingestion
             logger.info("Initializing Dify integration...")
-            dify = DifyIntegration()
+            dify = ShardedDifyIntegration() if args.sharded else DifyIntegration()
             
             if args.all_json:
                 # Ingest all JSON files
-                ingest_json_files(dify, args.dataset_dir)
+                ingest_json_files(dify, args.dataset_dir, summary_mode=args.summary_mode)
             elif args.json:
                 # Ingest specific JSON file
                 json_path = os.path.join(args.dataset_dir, args.json) if not os.path.isabs(args.json) else args.json
-                ingest_json_files(dify, args.dataset_dir, json_path)
+                ingest_json_files(dify, args.dataset_dir, json_path, summary_mode=args.summary_mode)
             
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
@@ -0,0 +1,100 @@
+from jira_rag.cleaning import iter_raw_issues
+from jira_rag.webhooks import WEBHOOK_EVENTS
+from dotenv import load_dotenv
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+import requests
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def to_webhook_issue(issue: dict) -> dict:
+    """Dataset issues come flat or in the Atlassian schema; webhooks always carry 'fields'"""
+    if 'fields' in issue:
+        return {"id": issue.get("id"), "key": issue["key"], "fields": issue["fields"]}
+    fields = {k: v for k, v in issue.items() if k not in ("id", "key")}
+    return {"id": issue.get("id"), "key": issue["key"], "fields": fields}
+
+def build_payloads(dataset_file: str, limit: int, burst: int, delete_ratio: float, seed: int):
+    """
+    Yield webhook payloads: each issue is created, then edited burst - 1 times,
+    and a fraction of the issues is deleted at the end
+    """
+    rng = random.Random(seed)
+    created = []
+    for idx, issue in enumerate(iter_raw_issues(dataset_file)):
+        if idx >= limit:
+            break
+        if not issue.get("key"):
+            continue
+        issue = to_webhook_issue(issue)
+        created.append(issue)
+        for edit in range(burst):
+            event = "jira:issue_created" if edit == 0 else "jira:issue_updated"
+            fields = dict(issue["fields"])
+            if edit:
+                fields["summary"] = f"{fields.get('summary') or ''} (edit {edit})"
+            yield {"webhookEvent": event, "timestamp": int(time.time() * 1000), "issue": {**issue, "fields": fields}}
+    for issue in created:
+        if rng.random() < delete_ratio:
+            yield {"webhookEvent": "jira:issue_deleted", "timestamp": int(time.time() * 1000), "issue": issue}
+
+def replay(url: str, secret: str, payloads, delay: float = 0.0) -> dict:
+    stats = {"sent": 0, "accepted": 0, "errors": 0, "events": {name: 0 for name in WEBHOOK_EVENTS}}
+    session = requests.Session()
+    started = time.perf_counter()
+    for payload in payloads:
+        body = json.dumps(payload).encode('utf-8')
+        signature = "sha256=" + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        try:
+            response = session.post(url, data=body, headers={"Content-Type": "application/json", "X-Hub-Signature": signature})
+            response.raise_for_status()
+            stats["accepted"] += bool(response.json().get("accepted"))
+        except Exception as e:
+            logger.error(f"Error posting {payload['webhookEvent']} for {payload['issue']['key']}: {str(e)}")
+            stats["errors"] += 1
+        stats["sent"] += 1
+        stats["events"][payload["webhookEvent"]] += 1
+        if delay:
+            time.sleep(delay)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Replay Jira webhooks built from dataset issues against the ingestion API')
+    parser.add_argument('--file', type=str, default='data/dataset/REST_JiraEcosystem_issues.json',
+                      help='Dataset file the issues are read from')
+    parser.add_argument('--url', type=str, default='http://localhost:8000/webhooks/jira',
+                      help='Webhook endpoint (default: http://localhost:8000/webhooks/jira)')
+    parser.add_argument('--limit', type=int, default=20, help='Number of issues to replay (default: 20)')
+    parser.add_argument('--burst', type=int, default=3,
+                      help='Events per issue: one create followed by burst - 1 updates (default: 3)')
+    parser.add_argument('--delete-ratio', type=float, default=0.1,
+                      help='Fraction of replayed issues deleted at the end (default: 0.1)')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait between events')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the deletions')
+    parser.add_argument('--stats', action='store_true', help='Print the receiver statistics after replaying')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    load_dotenv()
+    secret = os.getenv('JIRA_WEBHOOK_SECRET')
+    if not secret:
+        raise ValueError("Set JIRA_WEBHOOK_SECRET to the secret configured on the receiver")
+    payloads = build_payloads(args.file, args.limit, max(1, args.burst), args.delete_ratio, args.seed)
+    stats = replay(args.url, secret, payloads, args.delay)
+    logger.info(f"Replayed {stats['sent']} events in {stats['seconds']:.2f}s: {json.dumps(stats)}")
+    if args.stats:
+        response = requests.get(f"{args.url.rstrip('/')}/stats")
+        logger.info(f"Receiver statistics: {response.text}")
+
+if __name__ == "__main__":
+    main()